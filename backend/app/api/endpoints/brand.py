@@ -1,38 +1,75 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from typing import List
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException
+from typing import List, Literal, Optional
 import shutil
-import os
-import tempfile
-from app.services.document_processor import document_processor
+from app.services.ingestion_service import ingestion_service
 from app.services.rag_service import rag_service
 
 router = APIRouter()
 
-@router.post("/upload-brand-info")
-async def upload_brand_info(file: UploadFile = File(...)):
+def _queue_upload(file: UploadFile, brand_id: Optional[str], doc_id: str) -> dict:
     file_ext = file.filename.split(".")[-1].lower()
     if file_ext not in ["pdf", "txt", "csv"]:
         raise HTTPException(status_code=400, detail="Unsupported file type")
     
-    with tempfile.NamedTemporaryFile(delete=False, suffix=f".{file_ext}") as tmp:
-        shutil.copyfileobj(file.file, tmp)
-        tmp_path = tmp.name
+    # The file is kept until its ingestion job finishes so the job can be resumed after a restart
+    upload_path = ingestion_service.new_upload_path(file_ext)
+    with open(upload_path, "wb") as out:
+        shutil.copyfileobj(file.file, out)
     
-    try:
-        texts = await document_processor.process_file(tmp_path, file_ext)
-        # Use a generic collection name for now, or user-specific one
-        collection_name = "brand_knowledge"
-        await rag_service.add_documents(
-            collection_name=collection_name,
-            texts=texts,
-            metadatas=[{"source": file.filename} for _ in texts]
-        )
-        return {"message": f"Successfully processed {len(texts)} chunks from {file.filename}"}
-    finally:
-        if os.path.exists(tmp_path):
-            os.remove(tmp_path)
+    # Each brand gets its own collection; requests without a brand share the default one
+    job = ingestion_service.submit(
+        file_path=upload_path,
+        file_type=file_ext,
+        source=file.filename,
+        collection_name=rag_service.collection_for(brand_id),
+        doc_id=doc_id
+    )
+    return {
+        "message": f"Queued {file.filename} for processing",
+        "job_id": job["id"],
+        "status": job["status"],
+        "doc_id": job["doc_id"],
+        "version": job["version"]
+    }
+
+@router.post("/upload-brand-info")
+async def upload_brand_info(
+    file: UploadFile = File(...),
+    brand_id: Optional[str] = Form(None),
+    doc_id: Optional[str] = Form(None)
+):
+    # Uploading the same document id again (by default the file name) replaces the earlier version
+    return _queue_upload(file, brand_id, doc_id or file.filename)
+
+@router.get("/documents")
+async def list_documents(brand_id: Optional[str] = None):
+    return {"documents": rag_service.list_documents(rag_service.collection_for(brand_id))}
+
+@router.put("/documents/{doc_id}")
+async def replace_document(doc_id: str, file: UploadFile = File(...), brand_id: Optional[str] = Form(None)):
+    """Upload a new version; the previous one keeps serving until the new one is fully ingested."""
+    return _queue_upload(file, brand_id, doc_id)
+
+@router.delete("/documents/{doc_id}")
+async def delete_document(doc_id: str, brand_id: Optional[str] = None):
+    removed = await rag_service.delete_document(rag_service.collection_for(brand_id), doc_id)
+    if removed is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    # Chunks another document also uses stay in the index
+    return {"doc_id": doc_id, "deleted": True, "chunks_removed": removed}
+
+@router.get("/jobs/{job_id}")
+async def get_ingestion_job(job_id: str):
+    job = ingestion_service.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
 @router.get("/search-knowledge")
-async def search_knowledge(query: str):
-    results = await rag_service.query_similar("brand_knowledge", query)
-    return {"results": results}
+async def search_knowledge(
+    query: str,
+    brand_id: Optional[str] = None,
+    mode: Optional[Literal["vector", "keyword", "hybrid"]] = None
+):
+    # Includes which retrieval path ran and its per-stage latency
+    return await rag_service.search(rag_service.collection_for(brand_id), query, mode=mode)
@@ -0,0 +1,95 @@
+from typing import List, Optional
+from fastapi import APIRouter, File, Form, HTTPException, UploadFile
+from pydantic import BaseModel, Field
+from app.core.prompts import PLATFORM_PROMPTS
+from app.services.calendar_service import calendar_service, normalize_items, parse_calendar
+
+router = APIRouter()
+
+class CalendarItem(BaseModel):
+    topic: str
+    platform: Optional[str] = None  # one or several ("facebook|threads"); defaults to the job's platforms
+    scheduled_date: Optional[str] = None
+    priority: int = 0  # higher runs first
+    style: Optional[str] = None
+    image_url: Optional[str] = None
+
+class CalendarJobRequest(BaseModel):
+    items: List[CalendarItem] = Field(..., min_length=1)
+    platforms: List[str] = Field(default_factory=lambda: list(PLATFORM_PROMPTS))
+    brand_id: Optional[str] = None
+    user_id: Optional[str] = None
+    style: str = "專業且親切"
+    model: str = "gpt-4o"
+    provider: str = "auto"  # "auto" spreads posts over providers by rate limit headroom
+    use_rag: bool = True
+    use_search: bool = False
+    use_cache: bool = True
+
+def _submit(items: List[dict], options: dict) -> dict:
+    try:
+        job = calendar_service.submit(items, options)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return {
+        "message": f"Queued {job['items_total']} posts",
+        "job_id": job["id"],
+        "status": job["status"]
+    }
+
+@router.post("/jobs")
+async def create_calendar_job(request: CalendarJobRequest):
+    try:
+        items = normalize_items([item.model_dump() for item in request.items], request.platforms)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _submit(items, request.model_dump(exclude={"items", "platforms"}))
+
+@router.post("/jobs/upload")
+async def upload_calendar(
+    file: UploadFile = File(...),
+    platforms: str = Form(",".join(PLATFORM_PROMPTS)),
+    brand_id: Optional[str] = Form(None),
+    user_id: Optional[str] = Form(None),
+    style: str = Form("專業且親切"),
+    model: str = Form("gpt-4o"),
+    provider: str = Form("auto"),
+    use_rag: bool = Form(True),
+    use_search: bool = Form(False),
+    use_cache: bool = Form(True)
+):
+    file_ext = file.filename.split(".")[-1].lower()
+    if file_ext not in ["csv", "json"]:
+        raise HTTPException(status_code=400, detail="Unsupported file type")
+    try:
+        items = parse_calendar(await file.read(), file_ext, [p.strip() for p in platforms.split(",") if p.strip()])
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not items:
+        raise HTTPException(status_code=400, detail="Calendar has no rows")
+    return _submit(items, {
+        "brand_id": brand_id, "user_id": user_id, "style": style, "model": model, "provider": provider,
+        "use_rag": use_rag, "use_search": use_search, "use_cache": use_cache
+    })
+
+@router.get("/jobs/{job_id}")
+async def get_calendar_job(job_id: str):
+    job = calendar_service.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.get("/jobs/{job_id}/posts")
+async def get_calendar_posts(job_id: str):
+    """Finished posts as ``posts`` table rows (plus ``scheduled_date``), ready to insert."""
+    if calendar_service.get_job(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"posts": calendar_service.get_posts(job_id)}
+
+@router.post("/jobs/{job_id}/retry")
+async def retry_calendar_job(job_id: str):
+    """Queue the job's failed posts again."""
+    job = calendar_service.retry_failed(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
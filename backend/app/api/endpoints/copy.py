@@ -1,30 +1,82 @@
+import asyncio
+import json
+from contextlib import nullcontext
+from typing import List, Literal, Optional, Tuple
 from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from app.core.config import settings
+from app.core.tracing import current_trace, start_trace
+from app.services.context_service import PromptContext, build_context, copy_prompt
+from app.services.llm_providers import current_usage, track_usage
 from app.services.llm_service import llm_service
 from app.services.rag_service import rag_service
-from app.services.workflow_service import workflow_service
+from app.services.search_service import search_service
+from app.services.variant_service import rank_candidates
+from app.services.workflow_service import search_query, workflow_service
 from app.core.prompts import PLATFORM_PROMPTS
 
 router = APIRouter()
 
+# Shared by every batch request so concurrent batches cannot multiply provider load
+batch_semaphore = asyncio.Semaphore(settings.BATCH_MAX_CONCURRENCY)
+
 class CopyRequest(BaseModel):
     platform: str
     topic: str
+    brand_id: Optional[str] = None
     style: str = "專業且親切"
     model: str = "gpt-4o"
-    provider: str = "openai"
+    provider: str = "openai"  # or "auto" for the fastest healthy provider
     use_rag: bool = True
     use_agent: bool = False
+    # "lint": local checks, LLM editor only when sampled; "strict": always run the LLM editor
+    editor_mode: Literal["lint", "strict"] = "lint"
     use_search: bool = False
+    use_cache: bool = True
+    # Alternative versions ranked best first (single-call generation only)
+    variants: int = Field(1, ge=1, le=settings.COPY_MAX_VARIANTS)
+    # "trace": return a span breakdown; "profile": also write a whole-process cProfile dump for this request's duration
+    debug: Optional[Literal["trace", "profile"]] = None
 
 class CopyResponse(BaseModel):
     content: str
+    # Every version when more than one was requested, best first; ``content`` is the first
+    variants: List[dict] = []
     context_used: list = []
     logs: list = []
+    llm_calls_saved: int = 0
+    # Estimated prompt tokens trimmed by context budgeting, summed over every prompt that carried the context
+    tokens_saved: int = 0
+    # Provider token usage summed over every LLM call, including prompt tokens served from prefix caches
+    usage: Optional[dict] = None
+    trace_id: Optional[str] = None
+    trace: Optional[dict] = None
+
+class BatchCopyRequest(BaseModel):
+    topics: List[str] = Field(..., min_length=1)
+    platforms: List[str] = Field(default_factory=lambda: list(PLATFORM_PROMPTS))
+    brand_id: Optional[str] = None
+    style: str = "專業且親切"
+    model: str = "gpt-4o"
+    provider: str = "openai"  # or "auto" for the fastest healthy provider
+    use_rag: bool = True
+    use_agent: bool = False
+    editor_mode: Literal["lint", "strict"] = "lint"
+    use_search: bool = False
+    use_cache: bool = True
 
 class BrainstormRequest(BaseModel):
     idea: str
     platform: str = "facebook"
+    use_cache: bool = True
+    variants: int = Field(1, ge=1, le=settings.COPY_MAX_VARIANTS)
+
+async def _rank(platform: Optional[str], variants: List[str]) -> List[dict]:
+    ranked = await rank_candidates(platform, variants)
+    if not ranked:
+        raise HTTPException(status_code=502, detail="The provider returned no usable variants")
+    return ranked
 
 @router.post("/brainstorm")
 async def brainstorm_themes(request: BrainstormRequest):
@@ -39,60 +91,296 @@ async def brainstorm_themes(request: BrainstormRequest):
     請用繁體中文回答，並以 Markdown 格式呈現。
     """
     
+    system_prompt = "你是一位專業的社群媒體創意總監，擅長發想引人入勝的貼文主題。"
+    if request.variants > 1:
+        result = await llm_service.generate_variants(
+            prompt, request.variants, system_prompt=system_prompt,
+            model="gemini-3-flash-preview", provider="google", use_cache=request.use_cache
+        )
+        # Suggestions aren't posts, so they are ranked on diversity alone
+        ranked = await _rank(None, result.variants)
+        return {"suggestions": ranked[0]["content"], "variants": ranked}
+
     content = await llm_service.generate_text(
         prompt=prompt,
-        system_prompt="你是一位專業的社群媒體創意總監，擅長發想引人入勝的貼文主題。",
+        system_prompt=system_prompt,
         model="gemini-3-flash-preview",
-        provider="google"
+        provider="google",
+        use_cache=request.use_cache
     )
     return {"suggestions": content}
 
-@router.post("/generate", response_model=CopyResponse)
-async def generate_copy(request: CopyRequest):
-    if request.platform.lower() not in PLATFORM_PROMPTS:
-        raise HTTPException(status_code=400, detail="Unsupported platform")
-    
+async def _retrieve_context(request: CopyRequest):
     context_str = ""
     context_used = []
     
     if request.use_rag:
         # Search for relevant brand knowledge
-        search_results = await rag_service.query_similar("brand_knowledge", request.topic)
+        search_results = await rag_service.query_similar(rag_service.collection_for(request.brand_id), request.topic)
         if search_results:
             context_used = [res for res in search_results]
             context_str = "\n".join([res for res in search_results])
-    
+    return context_str, context_used
+
+async def _search(request: CopyRequest) -> str:
+    if not request.use_search:
+        return ""
+    # Agent runs search as the workflow's searcher would, so batch and /generate share results and cache entries
+    query = search_query(request.topic) if request.use_agent else request.topic
+    return await search_service.search(query)
+
+async def _gather_single_inputs(request: CopyRequest):
+    # Brand retrieval and web search are independent, so run them concurrently
+    (context_str, context_used), search_results = await asyncio.gather(
+        _retrieve_context(request), _search(request)
+    )
+    return context_str, context_used, search_results
+
+def _build_single_prompt(request: CopyRequest, context: PromptContext) -> Tuple[str, str]:
+    return copy_prompt(request.platform, request.topic, request.style, context, request.use_search)
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def _tracing(request: CopyRequest, name: str):
+    if not (request.debug or settings.TRACING_ENABLED):
+        return nullcontext()
+    return start_trace(name, profile=request.debug == "profile")
+
+def _usage_fields() -> dict:
+    usage = current_usage()
+    return {"usage": usage.as_dict()} if usage is not None else {}
+
+def _trace_fields(request: CopyRequest) -> dict:
+    trace = current_trace()
+    if trace is None:
+        return {}
+    fields = {"trace_id": trace.trace_id}
+    if request.debug:
+        fields["trace"] = trace.report()
+    return fields
+
+@router.post("/generate", response_model=CopyResponse)
+async def generate_copy(request: CopyRequest):
+    if request.platform.lower() not in PLATFORM_PROMPTS:
+        raise HTTPException(status_code=400, detail="Unsupported platform")
+    if request.variants > 1 and request.use_agent:
+        raise HTTPException(status_code=400, detail="variants requires use_agent=false")
+
+    with _tracing(request, "copy.generate") as trace, track_usage() as usage:
+        response = await _generate_copy(request)
+    response.usage = usage.as_dict()
+    if trace is not None:
+        response.trace_id = trace.trace_id
+        if request.debug:
+            response.trace = trace.report()
+    return response
+
+async def _generate_copy(request: CopyRequest) -> CopyResponse:
     if request.use_agent:
-        # Use Multi-Agent Workflow
+        # Use Multi-Agent Workflow; brand retrieval runs inside the graph alongside web search
         result = await workflow_service.run_workflow(
             platform=request.platform,
             topic=request.topic,
             style=request.style,
-            context=context_str,
-            use_search=request.use_search
+            use_search=request.use_search,
+            use_cache=request.use_cache,
+            use_rag=request.use_rag,
+            collection_name=rag_service.collection_for(request.brand_id),
+            editor_mode=request.editor_mode
         )
         return CopyResponse(
             content=result["final_copy"],
-            context_used=context_used,
-            logs=result["logs"]
+            context_used=result.get("context_used", []),
+            logs=result["logs"],
+            llm_calls_saved=result["llm_calls_saved"],
+            tokens_saved=result["tokens_saved"]
         )
     else:
         # Use Single LLM Call
-        template = PLATFORM_PROMPTS[request.platform.lower()]
-        prompt = template.format(topic=request.topic, style=request.style)
-        
-        if request.use_search:
-            from app.services.search_service import search_service
-            search_results = await search_service.search(request.topic)
-            prompt = f"{prompt}\n\n最新時事資訊：\n{search_results}"
-        
-        if context_str:
-            prompt = f"{prompt}\n\n品牌參考資訊：\n{context_str}"
-        
+        _, context_used, search_results = await _gather_single_inputs(request)
+        context = build_context(context_used, search_results, request.model)
+        prefix, prompt = _build_single_prompt(request, context)
+
+        if request.variants > 1:
+            # One provider request for every version; retrieval, search and the prompt are shared
+            result = await llm_service.generate_variants(
+                prompt, request.variants, model=request.model, provider=request.provider,
+                use_cache=request.use_cache, prefix=prefix
+            )
+            ranked = await _rank(request.platform, result.variants)
+            return CopyResponse(
+                content=ranked[0]["content"], variants=ranked, context_used=context_used,
+                logs=[f"單一 Agent 生成 {len(ranked)} 個版本並完成排序。"], tokens_saved=context.tokens_saved
+            )
+
         content = await llm_service.generate_text(
             prompt=prompt,
             model=request.model,
-            provider=request.provider
+            provider=request.provider,
+            use_cache=request.use_cache,
+            prefix=prefix
         )
         
-        return CopyResponse(content=content, context_used=context_used, logs=["單一 Agent 生成完成。"])
+        return CopyResponse(
+            content=content, context_used=context_used, logs=["單一 Agent 生成完成。"],
+            tokens_saved=context.tokens_saved
+        )
+
+@router.post("/generate/stream")
+async def generate_copy_stream(request: CopyRequest):
+    """Server-Sent Events variant of /generate.
+
+    Emits ``context`` once retrieval finishes, ``token`` events as provider tokens arrive and
+    ``log`` events on agent node transitions, and finally ``done`` (or ``error``).
+    """
+    if request.platform.lower() not in PLATFORM_PROMPTS:
+        raise HTTPException(status_code=400, detail="Unsupported platform")
+    if request.variants > 1:
+        raise HTTPException(status_code=400, detail="variants is only supported by /generate")
+
+    async def event_stream():
+        with _tracing(request, "copy.generate.stream"), track_usage():
+            async for chunk in copy_events():
+                yield chunk
+
+    async def copy_events():
+        try:
+            if request.use_agent:
+                async for event in workflow_service.stream_workflow(
+                    platform=request.platform,
+                    topic=request.topic,
+                    style=request.style,
+                    use_search=request.use_search,
+                    use_cache=request.use_cache,
+                    use_rag=request.use_rag,
+                    collection_name=rag_service.collection_for(request.brand_id),
+                    editor_mode=request.editor_mode
+                ):
+                    event_type = event.pop("type")
+                    if event_type == "done":
+                        event.update(_usage_fields())
+                        event.update(_trace_fields(request))
+                    yield _sse(event_type, event)
+            else:
+                _, context_used, search_results = await _gather_single_inputs(request)
+                yield _sse("context", {"context_used": context_used})
+                context = build_context(context_used, search_results, request.model)
+                prefix, prompt = _build_single_prompt(request, context)
+                parts = []
+                async for delta in llm_service.stream_text(
+                    prompt=prompt,
+                    model=request.model,
+                    provider=request.provider,
+                    use_cache=request.use_cache,
+                    prefix=prefix
+                ):
+                    parts.append(delta)
+                    yield _sse("token", {"node": "writer", "revision": 1, "text": delta})
+                yield _sse("log", {"node": "writer", "message": "單一 Agent 生成完成。"})
+                yield _sse("done", {
+                    "content": "".join(parts), "logs": ["單一 Agent 生成完成。"],
+                    "tokens_saved": context.tokens_saved, **_usage_fields(), **_trace_fields(request)
+                })
+        except Exception as e:
+            print(f"❌ Error streaming copy: {e}")
+            yield _sse("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.post("/generate/batch")
+async def generate_copy_batch(request: BatchCopyRequest):
+    """Generate copy for every topic × platform pair, streaming each result as it finishes.
+
+    Retrieval and web search run once per topic and are shared by all of its
+    platforms. Emits one ``result`` (or ``item_error``) event per pair, then ``done``.
+    """
+    platforms = [platform.lower() for platform in request.platforms]
+    unsupported = [platform for platform in platforms if platform not in PLATFORM_PROMPTS]
+    if unsupported:
+        raise HTTPException(status_code=400, detail=f"Unsupported platform: {', '.join(unsupported)}")
+
+    shared = request.model_dump(exclude={"topics", "platforms"})
+
+    async def generate_one(copy_request: CopyRequest, inputs: asyncio.Task) -> dict:
+        try:
+            # Each pair runs in its own task, so its usage is tracked separately
+            with track_usage() as usage:
+                result = await _generate_pair(copy_request, inputs)
+            return {**result, "usage": usage.as_dict()}
+        except Exception as e:
+            print(f"❌ Error in batch generation ({copy_request.topic}/{copy_request.platform}): {e}")
+            return {"topic": copy_request.topic, "platform": copy_request.platform, "detail": str(e)}
+
+    async def _generate_pair(copy_request: CopyRequest, inputs: asyncio.Task) -> dict:
+        context_str, context_used, search_results = await inputs
+        async with batch_semaphore:
+            if copy_request.use_agent:
+                result = await workflow_service.run_workflow(
+                    platform=copy_request.platform,
+                    topic=copy_request.topic,
+                    style=copy_request.style,
+                    context=context_str,
+                    use_search=copy_request.use_search,
+                    use_cache=copy_request.use_cache,
+                    search_results=search_results,
+                    editor_mode=copy_request.editor_mode,
+                    context_used=context_used
+                )
+                content, logs, tokens_saved = result["final_copy"], result["logs"], result["tokens_saved"]
+            else:
+                context = build_context(context_used, search_results, copy_request.model)
+                tokens_saved = context.tokens_saved
+                prefix, prompt = _build_single_prompt(copy_request, context)
+                content = await llm_service.generate_text(
+                    prompt=prompt,
+                    model=copy_request.model,
+                    provider=copy_request.provider,
+                    use_cache=copy_request.use_cache,
+                    prefix=prefix
+                )
+                logs = ["單一 Agent 生成完成。"]
+        return {
+            "topic": copy_request.topic,
+            "platform": copy_request.platform,
+            "content": content,
+            "context_used": context_used,
+            "logs": logs,
+            "tokens_saved": tokens_saved
+        }
+
+    async def event_stream():
+        inputs = {}
+        tasks = []
+        for topic in dict.fromkeys(request.topics):
+            for platform in platforms:
+                copy_request = CopyRequest(topic=topic, platform=platform, **shared)
+                if topic not in inputs:
+                    inputs[topic] = asyncio.create_task(_gather_single_inputs(copy_request))
+                tasks.append(asyncio.create_task(generate_one(copy_request, inputs[topic])))
+
+        completed = failed = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                result = await next_done
+                if "detail" in result:
+                    failed += 1
+                    yield _sse("item_error", result)
+                else:
+                    completed += 1
+                    yield _sse("result", result)
+            yield _sse("done", {"completed": completed, "failed": failed})
+        finally:
+            # Stop outstanding work if the client disconnects mid-batch
+            for task in [*tasks, *inputs.values()]:
+                task.cancel()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -1,39 +1,60 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
-import base64
-from app.services.llm_service import llm_service
+from typing import List
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException
+from app.core.config import settings
+from app.core.prompts import VISION_ANALYSIS_PROMPT
+from app.services.llm_router import ProviderUnavailableError
+from app.services.vision_service import vision_service
 
 router = APIRouter()
 
+ALLOWED_EXTENSIONS = ["jpg", "jpeg", "png", "webp"]
+
 @router.post("/analyze")
 async def analyze_image(file: UploadFile = File(...)):
     print(f"📸 Receiving image analysis request: {file.filename}")
     file_ext = file.filename.split(".")[-1].lower()
-    if file_ext not in ["jpg", "jpeg", "png", "webp"]:
+    if file_ext not in ALLOWED_EXTENSIONS:
         print(f"❌ Unsupported image type: {file_ext}")
         raise HTTPException(status_code=400, detail="Unsupported image type")
     
-    # Read file and convert to base64
     try:
         contents = await file.read()
         print(f"📦 Image size: {len(contents)} bytes")
-        base64_image = base64.b64encode(contents).decode('utf-8')
-        image_url = f"data:image/{file_ext};base64,{base64_image}"
-        
-        prompt = """
-        你是一位專業的社群媒體視覺分析師。請分析這張圖片並提供以下資訊：
-        1. 圖片內容描述 (Objects, Scene)
-        2. 氛圍與情緒 (Mood, Emotion)
-        3. 主要顏色與視覺風格
-        4. 適合的社群媒體貼文主題建議
-        5. 建議的 5 個 Hashtags
         
-        請用繁體中文回答。
-        """
-        
-        print("🤖 Sending to LLM for analysis...")
-        analysis = await llm_service.analyze_image(image_url, prompt)
+        print("🤖 Preparing image and sending to LLM for analysis...")
+        result = await vision_service.analyze(contents, VISION_ANALYSIS_PROMPT)
+        image = result["image"]
+        print(f"🖼️ Sent {image['width']}x{image['height']}, {image['bytes']} bytes (cached: {result['cached']})")
         print("✅ Analysis complete.")
-        return {"analysis": analysis}
+        return result
+    except ProviderUnavailableError as e:
+        print(f"❌ No provider for image analysis: {str(e)}")
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         print(f"❌ Error processing image: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/analyze-batch")
+async def analyze_carousel(files: List[UploadFile] = File(...), pack: bool = Form(True)):
+    """Carousel analysis: per-image results plus a summary of the whole set."""
+    print(f"📸 Receiving carousel analysis request: {len(files)} images")
+    if len(files) > settings.VISION_BATCH_MAX_IMAGES:
+        raise HTTPException(status_code=400, detail=f"At most {settings.VISION_BATCH_MAX_IMAGES} images per batch")
+    for file in files:
+        file_ext = file.filename.split(".")[-1].lower()
+        if file_ext not in ALLOWED_EXTENSIONS:
+            print(f"❌ Unsupported image type: {file.filename}")
+            raise HTTPException(status_code=400, detail=f"Unsupported image type: {file.filename}")
+
+    try:
+        contents_list = [await file.read() for file in files]
+        result = await vision_service.analyze_carousel(contents_list, pack=pack)
+        cached = sum(1 for item in result["images"] if item["cached"])
+        print(f"✅ Carousel analysis complete ({cached}/{len(files)} cached, requests: {result['requests']})")
+        return result
+    except ProviderUnavailableError as e:
+        print(f"❌ No provider for carousel analysis: {str(e)}")
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        print(f"❌ Error processing carousel: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,7 +1,8 @@
 from fastapi import APIRouter
-from app.api.endpoints import copy, brand, vision
+from app.api.endpoints import copy, brand, vision, calendar
 
 api_router = APIRouter()
 api_router.include_router(copy.router, prefix="/copy", tags=["copy"])
 api_router.include_router(brand.router, prefix="/brand", tags=["brand"])
 api_router.include_router(vision.router, prefix="/vision", tags=["vision"])
+api_router.include_router(calendar.router, prefix="/calendar", tags=["calendar"])
@@ -0,0 +1,56 @@
+"""Offline compaction of the brand knowledge store.
+
+Stop the API (and its ingestion workers) first, then run from the backend directory:
+
+    python -m app.compact --brand-id acme
+    python -m app.compact --all
+
+Each collection is rebuilt with only the chunks of current document versions
+(see ``RAGService.compact``), then the vector store's and keyword index's SQLite
+files are vacuumed so the space of removed chunks goes back to the filesystem.
+"""
+import argparse
+import os
+from app.core.config import settings
+from app.services.rag_service import RETIRED_SUFFIX, STAGING_SUFFIX, rag_service
+
+
+def directory_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total
+
+
+def main(brand_ids: list, everything: bool):
+    if everything:
+        collections = set()
+        for collection in rag_service.client.list_collections():
+            # A copy left by an interrupted compaction stands for the collection it belongs to
+            name = collection.name
+            for suffix in (STAGING_SUFFIX, RETIRED_SUFFIX):
+                name = name[:-len(suffix)] if name.endswith(suffix) else name
+            collections.add(name)
+        collections = sorted(collections)
+    else:
+        collections = [rag_service.collection_for(brand_id) for brand_id in brand_ids or [None]]
+
+    before = directory_size(rag_service.persist_directory)
+    keyword_before = os.path.getsize(settings.KEYWORD_INDEX_PATH) if os.path.exists(settings.KEYWORD_INDEX_PATH) else 0
+    reports = [rag_service.compact(name) for name in collections]
+    rag_service.vacuum()
+    for report in reports:
+        print(f"🧹 {report['collection']}: {report['chunks_before']} -> {report['chunks_after']} chunks")
+        for source, chunks in report["adopted"].items():
+            print(f"   registered {chunks} older chunks as document {source!r} v1")
+    after = directory_size(rag_service.persist_directory)
+    keyword_after = os.path.getsize(settings.KEYWORD_INDEX_PATH) if os.path.exists(settings.KEYWORD_INDEX_PATH) else 0
+    print(f"📦 Vector store {before / 1e6:.1f} MB -> {after / 1e6:.1f} MB, keyword index {keyword_before / 1e6:.1f} MB -> {keyword_after / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild brand knowledge collections without stale chunks.")
+    parser.add_argument("--brand-id", action="append", dest="brand_ids", help="brand to compact; repeatable (default: the shared collection)")
+    parser.add_argument("--all", action="store_true", help="compact every collection")
+    args = parser.parse_args()
+    main(args.brand_ids, args.all)
@@ -12,10 +12,118 @@ class Settings(BaseSettings):
     ANTHROPIC_API_KEY: str = os.getenv("ANTHROPIC_API_KEY", "")
     GOOGLE_API_KEY: str = os.getenv("GOOGLE_API_KEY", "")
     
+    # Heavy clients (LLM SDKs, Chroma, embeddings, the agent graph) are built on first use.
+    # Comma-separated services to build during startup instead: llm, rag, workflow, search, documents or "all"
+    SERVICE_WARMUP: str = os.getenv("SERVICE_WARMUP", "")
+
     # Supabase
     SUPABASE_URL: str = os.getenv("SUPABASE_URL", "")
     SUPABASE_KEY: str = os.getenv("SUPABASE_KEY", "")
     
+    # LLM providers
+    LLM_TIMEOUT_SECONDS: float = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+    LLM_KEEPALIVE_SECONDS: float = float(os.getenv("LLM_KEEPALIVE_SECONDS", "30"))
+    OPENAI_MAX_CONCURRENCY: int = int(os.getenv("OPENAI_MAX_CONCURRENCY", "16"))
+    ANTHROPIC_MAX_CONCURRENCY: int = int(os.getenv("ANTHROPIC_MAX_CONCURRENCY", "8"))
+    GOOGLE_MAX_CONCURRENCY: int = int(os.getenv("GOOGLE_MAX_CONCURRENCY", "16"))
+    # Account rate limits used to throttle bulk calendar jobs; 0 means unlimited
+    OPENAI_REQUESTS_PER_MINUTE: int = int(os.getenv("OPENAI_REQUESTS_PER_MINUTE", "0"))
+    OPENAI_TOKENS_PER_MINUTE: int = int(os.getenv("OPENAI_TOKENS_PER_MINUTE", "0"))
+    ANTHROPIC_REQUESTS_PER_MINUTE: int = int(os.getenv("ANTHROPIC_REQUESTS_PER_MINUTE", "0"))
+    ANTHROPIC_TOKENS_PER_MINUTE: int = int(os.getenv("ANTHROPIC_TOKENS_PER_MINUTE", "0"))
+    GOOGLE_REQUESTS_PER_MINUTE: int = int(os.getenv("GOOGLE_REQUESTS_PER_MINUTE", "0"))
+    GOOGLE_TOKENS_PER_MINUTE: int = int(os.getenv("GOOGLE_TOKENS_PER_MINUTE", "0"))
+    
+    # Provider routing: rolling stats window, circuit breaker and hedged requests
+    LLM_ROUTER_WINDOW: int = int(os.getenv("LLM_ROUTER_WINDOW", "50"))
+    LLM_BREAKER_FAILURE_THRESHOLD: int = int(os.getenv("LLM_BREAKER_FAILURE_THRESHOLD", "3"))
+    LLM_BREAKER_COOLDOWN_SECONDS: float = float(os.getenv("LLM_BREAKER_COOLDOWN_SECONDS", "30"))
+    LLM_HEDGE_ENABLED: bool = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+    LLM_HEDGE_MIN_SAMPLES: int = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "10"))
+    
+    # Provider-side prompt prefix caching (Anthropic cache_control, OpenAI prompt_cache_key, Gemini context caches);
+    # explicit Gemini caches are billed for storage, so only prefixes past the minimum size get one
+    LLM_PREFIX_CACHE_ENABLED: bool = os.getenv("LLM_PREFIX_CACHE_ENABLED", "true").lower() == "true"
+    GEMINI_CONTEXT_CACHE_MIN_TOKENS: int = int(os.getenv("GEMINI_CONTEXT_CACHE_MIN_TOKENS", "4096"))
+    GEMINI_CONTEXT_CACHE_TTL_SECONDS: float = float(os.getenv("GEMINI_CONTEXT_CACHE_TTL_SECONDS", "3600"))
+    
+    # Observability: one JSON timing line per HTTP request (histograms are always on at /metrics)
+    TIMING_LOGS_ENABLED: bool = os.getenv("TIMING_LOGS_ENABLED", "true").lower() == "true"
+    # Trace every copy request (trace_id in responses); requests can also opt in with "debug"
+    TRACING_ENABLED: bool = os.getenv("TRACING_ENABLED", "false").lower() == "true"
+    TRACE_PROFILE_DIR: str = os.getenv("TRACE_PROFILE_DIR", "./cache/profiles")
+    
+    # Agent workflow: share of lint-passing drafts still sent to the LLM editor in "lint" mode
+    EDITOR_LLM_SAMPLE_RATE: float = float(os.getenv("EDITOR_LLM_SAMPLE_RATE", "0"))
+    COPY_MAX_VARIANTS: int = int(os.getenv("COPY_MAX_VARIANTS", "5"))
+    
+    # Prompt context budget (estimated tokens) for brand knowledge plus web search, per prompt;
+    # CONTEXT_TOKEN_BUDGETS overrides it per model, e.g. "gpt-4o-mini=800,gemini-3-flash-preview=1000"
+    CONTEXT_TOKEN_BUDGET: int = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2000"))
+    CONTEXT_TOKEN_BUDGETS: str = os.getenv("CONTEXT_TOKEN_BUDGETS", "")
+    
+    # Batch generation: cap on concurrent generations across all batch requests
+    BATCH_MAX_CONCURRENCY: int = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+    
+    # Bulk content calendar jobs: checkpointed in SQLite; throughput is bounded by the provider rate limits above
+    CALENDAR_DB_PATH: str = os.getenv("CALENDAR_DB_PATH", "./cache/calendar.sqlite3")
+    CALENDAR_WORKERS: int = int(os.getenv("CALENDAR_WORKERS", "32"))
+    CALENDAR_MAX_ATTEMPTS: int = int(os.getenv("CALENDAR_MAX_ATTEMPTS", "3"))
+    # Completion tokens reserved per post before the provider reports actual usage
+    CALENDAR_OUTPUT_TOKENS_ESTIMATE: int = int(os.getenv("CALENDAR_OUTPUT_TOKENS_ESTIMATE", "800"))
+    
+    # Vision preprocessing: longest/shortest side caps match what the vision models downsample to
+    VISION_MAX_SIDE: int = int(os.getenv("VISION_MAX_SIDE", "2048"))
+    VISION_MAX_SHORT_SIDE: int = int(os.getenv("VISION_MAX_SHORT_SIDE", "768"))
+    VISION_JPEG_QUALITY: int = int(os.getenv("VISION_JPEG_QUALITY", "85"))
+    VISION_CACHE_TTL_SECONDS: float = float(os.getenv("VISION_CACHE_TTL_SECONDS", "86400"))
+    VISION_CACHE_MAX_ENTRIES: int = int(os.getenv("VISION_CACHE_MAX_ENTRIES", "500"))
+    # Reuse analyses of near-identical pictures (re-saved, resized), not just identical bytes
+    VISION_PERCEPTUAL_CACHE: bool = os.getenv("VISION_PERCEPTUAL_CACHE", "false").lower() == "true"
+    VISION_BATCH_MAX_IMAGES: int = int(os.getenv("VISION_BATCH_MAX_IMAGES", "20"))
+    VISION_IMAGES_PER_REQUEST: int = int(os.getenv("VISION_IMAGES_PER_REQUEST", "10"))
+    VISION_BATCH_CONCURRENCY: int = int(os.getenv("VISION_BATCH_CONCURRENCY", "4"))
+    
+    # Vector store
+    CHROMA_PERSIST_DIRECTORY: str = os.getenv("CHROMA_PERSIST_DIRECTORY", "./chroma_db")
+    # Retrieval: "vector", "keyword" (local BM25 only) or "hybrid" (BM25 + vector, fused)
+    RETRIEVAL_MODE: str = os.getenv("RETRIEVAL_MODE", "hybrid")
+    KEYWORD_INDEX_PATH: str = os.getenv("KEYWORD_INDEX_PATH", "./cache/keyword_index.sqlite3")
+    DOCUMENT_REGISTRY_PATH: str = os.getenv("DOCUMENT_REGISTRY_PATH", "./cache/documents.sqlite3")
+    # Per-process top-k result cache, dropped for a collection whenever it gets new documents
+    RETRIEVAL_CACHE_ENABLED: bool = os.getenv("RETRIEVAL_CACHE_ENABLED", "true").lower() == "true"
+    RETRIEVAL_CACHE_TTL_SECONDS: float = float(os.getenv("RETRIEVAL_CACHE_TTL_SECONDS", "300"))
+    RETRIEVAL_CACHE_MAX_ENTRIES: int = int(os.getenv("RETRIEVAL_CACHE_MAX_ENTRIES", "2000"))
+    CHROMA_MAX_OPEN_COLLECTIONS: int = int(os.getenv("CHROMA_MAX_OPEN_COLLECTIONS", "64"))
+    
+    # Document embeddings
+    EMBEDDING_CACHE_ENABLED: bool = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+    EMBEDDING_CACHE_PATH: str = os.getenv("EMBEDDING_CACHE_PATH", "./cache/embeddings.sqlite3")
+    EMBEDDING_CACHE_MAX_ENTRIES: int = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+    QUERY_EMBEDDING_CACHE_MAX_ENTRIES: int = int(os.getenv("QUERY_EMBEDDING_CACHE_MAX_ENTRIES", "2000"))
+    EMBEDDING_BATCH_SIZE: int = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+    EMBEDDING_MAX_CONCURRENCY: int = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "4"))
+    
+    # Background document ingestion
+    INGESTION_DB_PATH: str = os.getenv("INGESTION_DB_PATH", "./cache/ingestion.sqlite3")
+    INGESTION_UPLOAD_DIR: str = os.getenv("INGESTION_UPLOAD_DIR", "./uploads")
+    INGESTION_WORKERS: int = int(os.getenv("INGESTION_WORKERS", "2"))
+    INGESTION_BATCH_SIZE: int = int(os.getenv("INGESTION_BATCH_SIZE", "64"))
+    # Parse uploads in a child process so pypdf/docx parsing never holds the API's GIL; false parses in a thread
+    INGESTION_PARSE_IN_PROCESS: bool = os.getenv("INGESTION_PARSE_IN_PROCESS", "true").lower() == "true"
+    
+    # LLM response cache
+    LLM_CACHE_ENABLED: bool = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+    LLM_CACHE_BACKEND: str = os.getenv("LLM_CACHE_BACKEND", "memory")  # "memory" or "sqlite"
+    LLM_CACHE_PATH: str = os.getenv("LLM_CACHE_PATH", "./cache/llm_responses.sqlite3")
+    LLM_CACHE_TTL_SECONDS: float = float(os.getenv("LLM_CACHE_TTL_SECONDS", "86400"))
+    LLM_CACHE_MAX_ENTRIES: int = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1000"))
+    # Cosine similarity for near-duplicate prompt hits; 0 disables the embedding lookup
+    LLM_CACHE_SEMANTIC_THRESHOLD: float = float(os.getenv("LLM_CACHE_SEMANTIC_THRESHOLD", "0"))
+
+    # Concurrent identical LLM generations (cacheable ones only), retrievals and web searches share one upstream call
+    SINGLE_FLIGHT_ENABLED: bool = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+    
     class Config:
         case_sensitive = True
 
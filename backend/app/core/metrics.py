@@ -0,0 +1,274 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Sequence, Tuple
+from app.core.config import settings
+from app.core.tracing import request_finished, request_started
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Sequence[Tuple[str, str]]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _labels(self, key: tuple, *extra: Tuple[str, str]) -> str:
+        return _format_labels(list(zip(self.labelnames, key)) + list(extra))
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        return self.header() + [f"{self.name}{self._labels(key)} {_format_value(value)}" for key, value in values.items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._series: Dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket counts, then sum and count
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        lines = self.header()
+        for key, values in series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{self._labels(key, ('le', _format_value(bound)))} {cumulative}")
+            lines.append(f"{self.name}_sum{self._labels(key)} {_format_value(values[-2])}")
+            lines.append(f"{self.name}_count{self._labels(key)} {values[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    """Minimal Prometheus text-format registry.
+
+    Collectors are callables evaluated at scrape time, for values that already
+    live elsewhere (cache stats, router windows); each returns
+    ``(name, type, help, [(labels_dict, value), ...])`` tuples.
+    """
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], list]] = []
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, collect: Callable[[], list]):
+        self._collectors.append(collect)
+
+    def register_cache(self, cache: str, stats: Callable[[], object]):
+        """Expose a ``CacheStats`` object under ``cache="<name>"``."""
+        def collect():
+            current = stats()
+            if current is None:
+                return []
+            data, labels = current.as_dict(), {"cache": cache}
+            return [
+                ("cache_hits_total", "counter", "Cache lookups served from cache.", [(labels, data["hits"])]),
+                ("cache_misses_total", "counter", "Cache lookups that missed.", [(labels, data["misses"])]),
+                ("cache_evictions_total", "counter", "Entries evicted to stay within size limits.", [(labels, data["evictions"])]),
+                ("cache_invalidations_total", "counter", "Explicit invalidations (e.g. a collection got new documents).", [(labels, data["invalidations"])]),
+                ("cache_hit_ratio", "gauge", "Share of lookups served from cache.", [(labels, data["hit_rate"])]),
+            ]
+        self.collector(collect)
+
+    def register_single_flight(self, service: str, stats: Callable[[], object]):
+        """Expose a ``FlightStats`` object under ``service="<name>"``."""
+        def collect():
+            data, labels = stats().as_dict(), {"service": service}
+            return [
+                ("singleflight_calls_total", "counter", "Calls that went through request coalescing.", [(labels, data["calls"])]),
+                ("singleflight_coalesced_total", "counter", "Calls served by joining an identical call already in flight.", [(labels, data["coalesced"])]),
+                ("singleflight_upstream_failures_total", "counter", "Shared upstream calls that raised; every waiter got the error.", [(labels, data["failures"])]),
+                ("singleflight_upstream_cancellations_total", "counter", "Shared upstream calls cancelled because every waiter left.", [(labels, data["cancellations"])]),
+                ("singleflight_coalesced_ratio", "gauge", "Share of calls that joined an in-flight call.", [(labels, data["coalesced_ratio"])]),
+            ]
+        self.collector(collect)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+
+        # Collectors may report the same family (e.g. several caches); emit one header per family
+        families: Dict[str, tuple] = {}
+        for collect in self._collectors:
+            try:
+                collected = collect()
+            except Exception as e:
+                print(f"Error collecting metrics: {e}")
+                continue
+            for name, kind, documentation, samples in collected:
+                families.setdefault(name, (kind, documentation, []))[2].extend(samples)
+        for name, (kind, documentation, samples) in families.items():
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{_format_labels(list(labels.items()))} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def log_timing(event: str, **fields):
+    """One JSON line per timed event, for log pipelines that don't scrape /metrics."""
+    if settings.TIMING_LOGS_ENABLED:
+        print(json.dumps({"event": event, **fields}, ensure_ascii=False))
+
+
+registry = MetricsRegistry()
+
+HTTP_REQUEST_SECONDS = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency until the response body completes.",
+    ["method", "route", "status"]
+)
+LLM_REQUEST_SECONDS = registry.histogram(
+    "llm_request_duration_seconds", "Provider call latency; streams are measured to the first token.",
+    ["task", "provider", "model", "outcome"]
+)
+LLM_TOKENS_TOTAL = registry.counter(
+    "llm_tokens_total", "Tokens reported by providers; cached_input and cache_write are subsets of input.",
+    ["provider", "model", "direction"]
+)
+CHROMA_OPERATION_SECONDS = registry.histogram(
+    "chroma_operation_duration_seconds", "Vector store call latency, including query embedding.",
+    ["operation"]
+)
+RETRIEVAL_SECONDS = registry.histogram(
+    "retrieval_duration_seconds", "Brand knowledge retrieval latency by mode and the path it took.",
+    ["mode", "path"]
+)
+EMBEDDING_BATCH_SECONDS = registry.histogram(
+    "embedding_batch_duration_seconds", "Embedding provider call latency per batch.", ["operation"]
+)
+EMBEDDING_TEXTS_TOTAL = registry.counter(
+    "embedding_texts_total", "Texts sent to the embedding provider.", ["operation"]
+)
+SEARCH_REQUEST_SECONDS = registry.histogram(
+    "search_request_duration_seconds", "Tavily web search latency.", ["outcome"]
+)
+PROMPT_CONTEXT_TOKENS_TOTAL = registry.counter(
+    "prompt_context_tokens_total", "Estimated brand and search context tokens per assembly, before (raw) and after (sent) budgeting.",
+    ["stage"]
+)
+RATE_LIMIT_WAIT_SECONDS = registry.histogram(
+    "rate_limit_wait_seconds", "Time bulk generations waited on a provider's rate limit buckets.", ["provider"]
+)
+CALENDAR_ITEMS_TOTAL = registry.counter(
+    "calendar_items_total", "Bulk calendar posts finished, by outcome.", ["outcome"]
+)
+WORKFLOW_NODE_SECONDS = registry.histogram(
+    "workflow_node_duration_seconds", "Agent workflow node latency.", ["node"]
+)
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing every request by its route template.
+
+    Timing stops when the last body chunk is sent, so SSE endpoints report
+    the full stream duration rather than the time to headers.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] == "/metrics":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = {"code": 500}
+        request_started()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_finished()
+            elapsed = time.perf_counter() - start
+            route = scope.get("route")
+            # Route templates keep label cardinality bounded (no job ids in labels)
+            path = getattr(route, "path", "unmatched")
+            HTTP_REQUEST_SECONDS.observe(elapsed, method=scope["method"], route=path, status=status["code"])
+            log_timing(
+                "http_request", method=scope["method"], route=path,
+                status=status["code"], ms=round(elapsed * 1000, 1)
+            )
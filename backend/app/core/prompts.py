@@ -1,29 +1,81 @@
-FB_PROMPT_TEMPLATE = """
-你是一位專業的 Facebook 社群經營專家。請根據以下主題撰寫一篇吸引人的 Facebook 貼文。
+# Templates are split into a static platform guide and the per-request topic section.
+# The guide (plus brand context) goes first so providers can reuse the cached prefix;
+# PLATFORM_PROMPTS keeps the combined template for callers that want a single string.
+FB_GUIDE = """
+你是一位專業的 Facebook 社群經營專家。請根據主題撰寫一篇吸引人的 Facebook 貼文。
 Facebook 貼文特點：語氣親切、適合分享、可以包含較長的故事或詳細資訊，並在結尾加入行動呼籲 (CTA)。
-
-主題：{topic}
-風格：{style}
 """
 
-IG_PROMPT_TEMPLATE = """
-你是一位專業的 Instagram 視覺行銷專家。請根據以下主題撰寫一篇吸引人的 Instagram 貼文。
+IG_GUIDE = """
+你是一位專業的 Instagram 視覺行銷專家。請根據主題撰寫一篇吸引人的 Instagram 貼文。
 Instagram 貼文特點：第一句要極具吸引力、語氣活潑、使用大量 Emoji、段落清晰，並在最後加入 5-10 個相關的 Hashtags。
-
-主題：{topic}
-風格：{style}
 """
 
-THREADS_PROMPT_TEMPLATE = """
-你是一位專業的 Threads 內容創作者。請根據以下主題撰寫一篇吸引人的 Threads 貼文。
+THREADS_GUIDE = """
+你是一位專業的 Threads 內容創作者。請根據主題撰寫一篇吸引人的 Threads 貼文。
 Threads 貼文特點：語氣直白、像是在對話、具備觀點或幽默感、簡短有力，適合引發討論。
+"""
 
+TOPIC_TEMPLATE = """
 主題：{topic}
 風格：{style}
 """
 
+PLATFORM_GUIDES = {
+    "facebook": FB_GUIDE,
+    "instagram": IG_GUIDE,
+    "threads": THREADS_GUIDE
+}
+
+FB_PROMPT_TEMPLATE = FB_GUIDE + TOPIC_TEMPLATE
+IG_PROMPT_TEMPLATE = IG_GUIDE + TOPIC_TEMPLATE
+THREADS_PROMPT_TEMPLATE = THREADS_GUIDE + TOPIC_TEMPLATE
+
 PLATFORM_PROMPTS = {
     "facebook": FB_PROMPT_TEMPLATE,
     "instagram": IG_PROMPT_TEMPLATE,
     "threads": THREADS_PROMPT_TEMPLATE
 }
+
+VISION_ANALYSIS_PROMPT = """
+你是一位專業的社群媒體視覺分析師。請分析這張圖片並提供以下資訊：
+1. 圖片內容描述 (Objects, Scene)
+2. 氛圍與情緒 (Mood, Emotion)
+3. 主要顏色與視覺風格
+4. 適合的社群媒體貼文主題建議
+5. 建議的 5 個 Hashtags
+
+請用繁體中文回答。
+"""
+
+# Several carousel images in one request: per-image analyses plus a carousel summary, as JSON
+CAROUSEL_PACKED_TEMPLATE = """
+你是一位專業的社群媒體視覺分析師。以下依序附上同一則輪播貼文的 {count} 張圖片。
+請逐張分析，每張都包含：
+1. 圖片內容描述 (Objects, Scene)
+2. 氛圍與情緒 (Mood, Emotion)
+3. 主要顏色與視覺風格
+4. 適合的社群媒體貼文主題建議
+5. 建議的 5 個 Hashtags
+
+最後請給出整組輪播的總結：共同主題、整體故事、建議的圖片排序與 5 個 Hashtags。
+請用繁體中文回答，並只輸出 JSON，不要加任何其他文字：
+{{"images": ["第 1 張的分析", "第 2 張的分析", ...], "summary": "整組輪播的總結"}}
+"images" 必須剛好有 {count} 個項目，順序與圖片相同。
+"""
+
+CAROUSEL_SUMMARY_TEMPLATE = """
+以下是同一則輪播貼文中每張圖片的分析，請根據這些分析給出整組輪播的總結：共同主題、整體故事、建議的圖片排序與 5 個 Hashtags。
+請用繁體中文回答。
+
+{analyses}
+"""
+
+# Several alternative versions in one completion, for providers without a native ``n``
+VARIANTS_JSON_TEMPLATE = """{prompt}
+
+請提供 {count} 個不同的版本，每個版本的切入點、開頭與語氣都要明顯不同。
+只輸出 JSON，不要加任何其他文字：
+{{"variants": ["第 1 個版本的完整內容", "第 2 個版本的完整內容", ...]}}
+"variants" 必須剛好有 {count} 個項目。
+"""
@@ -0,0 +1,175 @@
+import cProfile
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+from app.core.config import settings
+
+_trace: ContextVar[Optional["Trace"]] = ContextVar("trace", default=None)
+_span: ContextVar[Optional["Span"]] = ContextVar("span", default=None)
+
+# cProfile hooks the whole interpreter thread, so only one request can be profiled at a time. It still
+# records everything else the event loop runs meanwhile (other requests, background workers)
+_profile_lock = threading.Lock()
+# HTTP requests in flight and started so far, kept by MetricsMiddleware so a profile can say what it overlapped
+_requests = {"in_flight": 0, "started": 0}
+
+_NO_SPAN = nullcontext()
+
+
+@dataclass
+class Span:
+    name: str
+    span_id: int
+    parent_id: Optional[int]
+    start: float
+    end: Optional[float] = None
+    attributes: Dict[str, object] = field(default_factory=dict)
+
+
+class Trace:
+    """Spans recorded for one request.
+
+    Spans are appended from whichever task the work runs in; parentage follows
+    the contextvar copy asyncio makes when a task is created, so concurrent
+    LangGraph nodes nest under the request rather than under each other.
+    """
+
+    def __init__(self, name: str):
+        self.trace_id = uuid.uuid4().hex
+        self.spans: List[Span] = []
+        self.root = self._new_span(name, None, {})
+        self.profile_path: Optional[str] = None
+        self.profile_overlapping_requests: Optional[int] = None
+
+    def _new_span(self, name: str, parent_id: Optional[int], attributes: dict) -> Span:
+        span = Span(name, len(self.spans), parent_id, time.perf_counter(), attributes=attributes)
+        self.spans.append(span)
+        return span
+
+    @contextmanager
+    def span(self, name: str, attributes: dict):
+        parent = _span.get()
+        current = self._new_span(name, parent.span_id if parent else self.root.span_id, attributes)
+        token = _span.set(current)
+        try:
+            yield current
+        finally:
+            current.end = time.perf_counter()
+            _span.reset(token)
+
+    def record(self, name: str, start: float, attributes: dict):
+        """Add an already finished span without making it current (e.g. around an async generator)."""
+        parent = _span.get()
+        current = self._new_span(name, parent.span_id if parent else self.root.span_id, attributes)
+        current.start = start
+        current.end = time.perf_counter()
+
+    def _duration(self, span: Span) -> float:
+        return ((span.end or time.perf_counter()) - span.start) * 1000
+
+    def breakdown(self) -> dict:
+        """Nested span tree with offsets from the request start, in milliseconds."""
+        children: Dict[int, List[Span]] = {}
+        for span in self.spans[1:]:
+            children.setdefault(span.parent_id, []).append(span)
+
+        def node(span: Span) -> dict:
+            return {
+                "name": span.name,
+                "start_ms": round((span.start - self.root.start) * 1000, 1),
+                "duration_ms": round(self._duration(span), 1),
+                **({"attributes": span.attributes} if span.attributes else {}),
+                "children": [node(child) for child in children.get(span.span_id, [])],
+            }
+        return node(self.root)
+
+    def folded(self) -> List[str]:
+        """Collapsed stacks weighted by self time in ms, the format flamegraph.pl, speedscope and py-spy's raw output share."""
+        by_id = {span.span_id: span for span in self.spans}
+        child_time: Dict[int, float] = {}
+        for span in self.spans[1:]:
+            child_time[span.parent_id] = child_time.get(span.parent_id, 0.0) + self._duration(span)
+
+        lines = []
+        for span in self.spans:
+            stack, current = [], span
+            while current is not None:
+                stack.append(current.name)
+                current = by_id.get(current.parent_id)
+            # Concurrent children can add up to more than the parent; clamp instead of going negative
+            self_ms = max(0.0, self._duration(span) - child_time.get(span.span_id, 0.0))
+            if self_ms >= 1:
+                lines.append(f"{';'.join(reversed(stack))} {round(self_ms)}")
+        return lines
+
+    def report(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "total_ms": round(self._duration(self.root), 1),
+            "spans": self.breakdown(),
+            "folded": self.folded(),
+            "profile_path": self.profile_path,
+            # The profile covers the whole process for this request's duration, not this request alone
+            "profile_scope": "process" if self.profile_path else None,
+            "profile_overlapping_requests": self.profile_overlapping_requests,
+        }
+
+
+def span(name: str, **attributes):
+    """Time a block as a child of the current span; a no-op outside a traced request."""
+    trace = _trace.get()
+    if trace is None:
+        return _NO_SPAN
+    return trace.span(name, attributes)
+
+
+def record_span(name: str, start: float, **attributes):
+    trace = _trace.get()
+    if trace is not None:
+        trace.record(name, start, attributes)
+
+
+def current_trace() -> Optional[Trace]:
+    return _trace.get()
+
+
+def request_started():
+    _requests["in_flight"] += 1
+    _requests["started"] += 1
+
+
+def request_finished():
+    _requests["in_flight"] -= 1
+
+
+@contextmanager
+def start_trace(name: str, profile: bool = False):
+    trace = Trace(name)
+    token = _trace.set(trace)
+    profiler = None
+    if profile and _profile_lock.acquire(blocking=False):
+        trace.profile_path = os.path.join(settings.TRACE_PROFILE_DIR, f"{trace.trace_id}.process.prof")
+        # Requests already running besides this one, plus any started before the profile stops
+        overlapping = max(0, _requests["in_flight"] - 1) - _requests["started"]
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        yield trace
+    finally:
+        trace.root.end = time.perf_counter()
+        _trace.reset(token)
+        if profiler is not None:
+            profiler.disable()
+            _profile_lock.release()
+            trace.profile_overlapping_requests = overlapping + _requests["started"]
+            os.makedirs(settings.TRACE_PROFILE_DIR, exist_ok=True)
+            profiler.dump_stats(trace.profile_path)
+            print(
+                f"🔬 Whole-process profile for {trace.root.name} written to {trace.profile_path} "
+                f"({trace.profile_overlapping_requests} other requests overlapped)"
+            )
@@ -1,8 +1,26 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from app.api.router import api_router
+from app.core.metrics import MetricsMiddleware, registry
+from app.services.calendar_service import calendar_service
+from app.services.ingestion_service import ingestion_service
+from app.services.llm_service import llm_service
+from app.services.warmup import warm_up
 
-app = FastAPI(title="AI Social Media Agent API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await warm_up()
+    await ingestion_service.start()
+    await calendar_service.start()
+    yield
+    await calendar_service.stop()
+    await ingestion_service.stop()
+    # Release pooled provider connections
+    await llm_service.aclose()
+
+app = FastAPI(title="AI Social Media Agent API", lifespan=lifespan)
 
 # Set up CORS
 app.add_middleware(
@@ -13,12 +31,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(MetricsMiddleware)
+
 app.include_router(api_router, prefix="/api")
 
 @app.get("/")
 async def root():
     return {"message": "Welcome to AI Social Media Agent API"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,288 @@
+import hashlib
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Any, Awaitable, Callable, List, Optional
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    semantic_hits: int = 0
+    evictions: int = 0
+    expirations: int = 0
+    invalidations: int = 0
+
+    def as_dict(self) -> dict:
+        data = asdict(self)
+        lookups = self.hits + self.misses
+        data["hit_rate"] = round(self.hits / lookups, 4) if lookups else 0.0
+        return data
+
+
+class MemoryCacheBackend:
+    """In-process LRU map with per-entry TTL."""
+
+    def __init__(self, max_entries: int = 1000):
+        self.max_entries = max_entries
+        self.stats = CacheStats()
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at and expires_at < time.time():
+                del self._data[key]
+                self.stats.expirations += 1
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def get_many(self, keys: List[str]) -> dict:
+        found = {}
+        for key in keys:
+            value = self.get(key)
+            if value is not None:
+                found[key] = value
+        return found
+
+    def set(self, key: str, value: Any, ttl: float):
+        self.set_many([(key, value)], ttl)
+
+    def set_many(self, items: List[tuple], ttl: float):
+        expires_at = time.time() + ttl if ttl else 0
+        with self._lock:
+            for key, value in items:
+                self._data[key] = (expires_at, value)
+                self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.stats.evictions += 1
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SQLiteCacheBackend:
+    """Disk-backed LRU map with per-entry TTL; values must be JSON serializable."""
+
+    def __init__(self, path: str, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self.stats = CacheStats()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_last_access ON cache (last_access)")
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at and expires_at < now:
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self._conn.commit()
+                self._count -= 1
+                self.stats.expirations += 1
+                return None
+            self._conn.execute("UPDATE cache SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        return json.loads(value)
+
+    def get_many(self, keys: List[str]) -> dict:
+        now = time.time()
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM cache WHERE key IN ({placeholders}) AND (expires_at = 0 OR expires_at >= ?)",
+                    (*chunk, now)
+                ).fetchall()
+                found.update((key, json.loads(value)) for key, value in rows)
+            if found:
+                self._conn.executemany("UPDATE cache SET last_access = ? WHERE key = ?", [(now, key) for key in found])
+                self._conn.commit()
+        return found
+
+    def set(self, key: str, value: Any, ttl: float):
+        self.set_many([(key, value)], ttl)
+
+    def set_many(self, items: List[tuple], ttl: float):
+        now = time.time()
+        expires_at = now + ttl if ttl else 0
+        with self._lock:
+            # One transaction per batch keeps bulk writes (e.g. embedding batches) cheap
+            for key, value in items:
+                exists = self._conn.execute("SELECT 1 FROM cache WHERE key = ?", (key,)).fetchone()
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO cache (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(value, ensure_ascii=False), expires_at, now)
+                )
+                if not exists:
+                    self._count += 1
+            overflow = self._count - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY last_access LIMIT ?)",
+                    (overflow,)
+                )
+                self._count -= overflow
+                self.stats.evictions += overflow
+            self._conn.commit()
+
+    def delete(self, key: str):
+        with self._lock:
+            deleted = self._conn.execute("DELETE FROM cache WHERE key = ?", (key,)).rowcount
+            self._count -= deleted
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache")
+            self._count = 0
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        return self._count
+
+
+def normalize_text(text: str) -> str:
+    return re.sub(r"\s+", " ", text or "").strip()
+
+
+def cosine(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class ResponseCache:
+    """Exact-match response cache with an optional embedding-similarity fallback.
+
+    Near-duplicate lookups only compare prompts sent to the same provider, model
+    and system prompt, and are skipped entirely when no ``embed`` function is set.
+    """
+
+    def __init__(
+        self,
+        backend,
+        ttl: float,
+        embed: Optional[Callable[[str], Awaitable[List[float]]]] = None,
+        semantic_threshold: float = 0.0,
+        semantic_max_entries: int = 500,
+    ):
+        self.backend = backend
+        self.ttl = ttl
+        self.embed = embed
+        self.semantic_threshold = semantic_threshold
+        self.semantic_max_entries = semantic_max_entries
+        self._vectors: "OrderedDict[str, tuple]" = OrderedDict()
+
+    @property
+    def stats(self) -> CacheStats:
+        return self.backend.stats
+
+    @property
+    def semantic_enabled(self) -> bool:
+        return self.embed is not None and self.semantic_threshold > 0
+
+    @staticmethod
+    def _namespace(provider: str, model: str, system_prompt: str) -> str:
+        return json.dumps([provider, model, normalize_text(system_prompt)], ensure_ascii=False)
+
+    def make_key(self, provider: str, model: str, system_prompt: str, prompt: str) -> str:
+        raw = json.dumps(
+            [self._namespace(provider, model, system_prompt), normalize_text(prompt)],
+            ensure_ascii=False
+        )
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def get(self, provider: str, model: str, system_prompt: str, prompt: str) -> Optional[Any]:
+        value = self.backend.get(self.make_key(provider, model, system_prompt, prompt))
+        if value is not None:
+            self.stats.hits += 1
+            return value
+
+        if self.semantic_enabled:
+            value = await self._semantic_get(self._namespace(provider, model, system_prompt), prompt)
+            if value is not None:
+                self.stats.hits += 1
+                self.stats.semantic_hits += 1
+                return value
+
+        self.stats.misses += 1
+        return None
+
+    async def set(self, provider: str, model: str, system_prompt: str, prompt: str, value: Any):
+        key = self.make_key(provider, model, system_prompt, prompt)
+        self.backend.set(key, value, self.ttl)
+        if self.semantic_enabled:
+            try:
+                vector = await self.embed(normalize_text(prompt))
+            except Exception as e:
+                print(f"Error embedding prompt for response cache: {e}")
+                return
+            self._vectors[key] = (self._namespace(provider, model, system_prompt), vector)
+            self._vectors.move_to_end(key)
+            while len(self._vectors) > self.semantic_max_entries:
+                self._vectors.popitem(last=False)
+
+    async def _semantic_get(self, namespace: str, prompt: str) -> Optional[Any]:
+        candidates = [(key, vector) for key, (ns, vector) in self._vectors.items() if ns == namespace]
+        if not candidates:
+            return None
+        try:
+            query = await self.embed(normalize_text(prompt))
+        except Exception as e:
+            print(f"Error embedding prompt for response cache: {e}")
+            return None
+
+        best_key, best_score = None, 0.0
+        for key, vector in candidates:
+            score = cosine(query, vector)
+            if score > best_score:
+                best_key, best_score = key, score
+        if best_key is None or best_score < self.semantic_threshold:
+            return None
+
+        value = self.backend.get(best_key)
+        if value is None:
+            # Entry expired or was evicted from the backend
+            self._vectors.pop(best_key, None)
+        return value
+
+    def clear(self):
+        self.backend.clear()
+        self._vectors.clear()
@@ -0,0 +1,354 @@
+import asyncio
+import csv
+import io
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from app.core.config import settings
+from app.core.metrics import CALENDAR_ITEMS_TOTAL
+from app.core.prompts import PLATFORM_PROMPTS
+from app.services.context_service import build_context, copy_prompt, estimate_tokens
+from app.services.llm_router import AUTO, TASK_TEXT
+from app.services.llm_service import llm_service
+from app.services.rag_service import rag_service
+from app.services.rate_limiter import rate_limiter
+from app.services.search_service import search_service
+
+# Same columns as the posts table in schema.sql, so finished rows can be inserted as they are
+POST_COLUMNS = ["id", "user_id", "platform", "topic", "content", "image_url", "status", "created_at", "updated_at"]
+DEFAULT_OPTIONS = {
+    "brand_id": None, "style": "專業且親切", "model": "gpt-4o", "provider": AUTO,
+    "use_rag": True, "use_search": False, "use_cache": True, "user_id": None,
+}
+PLATFORM_SEPARATORS = re.compile(r"[|,;/\s]+")
+# Retrieval and search results kept per (job, topic) so every platform of a topic shares them
+MAX_SHARED_INPUTS = 256
+# Failed posts wait 1s, 2s, 4s... before going back on the queue, so an open circuit can cool down
+RETRY_BASE_DELAY = 1.0
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def normalize_items(rows: Iterable[dict], default_platforms: List[str]) -> List[dict]:
+    """Validate calendar rows, expanding rows without a platform (or with several) into one item per platform."""
+    items = []
+    for line, row in enumerate(rows, start=1):
+        row = {str(key).strip().lower(): value for key, value in row.items() if key}
+        topic = str(row.get("topic") or "").strip()
+        if not topic:
+            raise ValueError(f"Row {line}: topic is required")
+        platforms = row.get("platform") or row.get("platforms") or default_platforms
+        if isinstance(platforms, str):
+            platforms = [platform for platform in PLATFORM_SEPARATORS.split(platforms) if platform]
+        try:
+            priority = int(row.get("priority") or 0)
+        except ValueError:
+            raise ValueError(f"Row {line}: priority must be an integer")
+        for platform in platforms:
+            platform = platform.strip().lower()
+            if platform not in PLATFORM_PROMPTS:
+                raise ValueError(f"Row {line}: unsupported platform '{platform}'")
+            items.append({
+                "topic": topic,
+                "platform": platform,
+                "style": (row.get("style") or "").strip() or None,
+                "scheduled_date": str(row.get("scheduled_date") or row.get("date") or "").strip() or None,
+                "priority": priority,
+                "image_url": (row.get("image_url") or "").strip() or None,
+            })
+    return items
+
+
+def parse_calendar(data: bytes, file_type: str, default_platforms: List[str]) -> List[dict]:
+    """Rows from a CSV (header: topic, platform, date, priority, style, image_url) or a JSON list / {"items": [...]}."""
+    text = data.decode("utf-8-sig")
+    if file_type == "json":
+        rows = json.loads(text)
+        if isinstance(rows, dict):
+            rows = rows.get("items", [])
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            raise ValueError("JSON calendar must be a list of objects or {\"items\": [...]}")
+    else:
+        rows = list(csv.DictReader(io.StringIO(text)))
+    return normalize_items(rows, default_platforms)
+
+
+class CalendarService:
+    """Bulk content calendar generation, checkpointed in SQLite.
+
+    Every topic/platform pair is a row shaped like the ``posts`` table and is
+    written as soon as it finishes. Workers pull pairs from one priority queue
+    (priority, then scheduled date) and only throttle on the provider rate
+    limit buckets, so a run goes as fast as the account's limits allow. Pairs
+    left queued or running by a previous process are queued again on start.
+    """
+
+    def __init__(self, db_path: str = settings.CALENDAR_DB_PATH):
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS calendar_jobs ("
+            "id TEXT PRIMARY KEY, options TEXT NOT NULL, items_total INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, started_at REAL, finished_at REAL);"
+            "CREATE TABLE IF NOT EXISTS calendar_posts ("
+            "id TEXT PRIMARY KEY, job_id TEXT NOT NULL, item_index INTEGER NOT NULL, "
+            "priority INTEGER NOT NULL DEFAULT 0, scheduled_date TEXT, style TEXT, "
+            "user_id TEXT, platform TEXT NOT NULL, topic TEXT, content TEXT, image_url TEXT, "
+            "status TEXT NOT NULL DEFAULT 'draft', created_at TEXT NOT NULL, updated_at TEXT NOT NULL, "
+            "state TEXT NOT NULL DEFAULT 'queued', attempts INTEGER NOT NULL DEFAULT 0, error TEXT, "
+            "provider TEXT, model TEXT, input_tokens INTEGER NOT NULL DEFAULT 0, output_tokens INTEGER NOT NULL DEFAULT 0);"
+            "CREATE INDEX IF NOT EXISTS calendar_posts_job ON calendar_posts (job_id, state);"
+        )
+        self._conn.commit()
+        self._lock = threading.Lock()
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._workers = []
+        self._inputs: "OrderedDict[Tuple[str, str], asyncio.Task]" = OrderedDict()
+
+    def _execute(self, sql: str, params: tuple = ()):
+        with self._lock:
+            self._conn.execute(sql, params)
+            self._conn.commit()
+
+    def _enqueue(self, row):
+        # Higher priority first, then earlier dates; undated posts go after dated ones
+        self._queue.put_nowait((-row["priority"], row["scheduled_date"] or "~", row["job_id"], row["item_index"], row["id"]))
+
+    def submit(self, items: List[dict], options: Dict[str, Any]) -> Dict[str, Any]:
+        if not llm_service.router.routes(TASK_TEXT):
+            raise RuntimeError("No LLM provider configured.")
+        options = {**DEFAULT_OPTIONS, **{key: value for key, value in options.items() if value is not None}}
+        job_id = uuid.uuid4().hex
+        now, created = time.time(), _now_iso()
+        rows = [
+            {
+                "id": str(uuid.uuid4()), "job_id": job_id, "item_index": index, "priority": item["priority"],
+                "scheduled_date": item["scheduled_date"], "style": item["style"], "user_id": options["user_id"],
+                "platform": item["platform"], "topic": item["topic"], "image_url": item["image_url"],
+            }
+            for index, item in enumerate(items)
+        ]
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO calendar_jobs (id, options, items_total, created_at) VALUES (?, ?, ?, ?)",
+                (job_id, json.dumps(options, ensure_ascii=False), len(rows), now)
+            )
+            self._conn.executemany(
+                "INSERT INTO calendar_posts (id, job_id, item_index, priority, scheduled_date, style, user_id, "
+                "platform, topic, image_url, created_at, updated_at) VALUES "
+                "(:id, :job_id, :item_index, :priority, :scheduled_date, :style, :user_id, :platform, :topic, "
+                ":image_url, :created, :created)",
+                [{**row, "created": created} for row in rows]
+            )
+            self._conn.commit()
+        if self._queue is not None:
+            for row in rows:
+                self._enqueue(row)
+        return self.get_job(job_id)
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._conn.execute("SELECT * FROM calendar_jobs WHERE id = ?", (job_id,)).fetchone()
+            if job is None:
+                return None
+            counts = dict(self._conn.execute(
+                "SELECT state, COUNT(*) FROM calendar_posts WHERE job_id = ? GROUP BY state", (job_id,)
+            ).fetchall())
+            usage = self._conn.execute(
+                "SELECT COALESCE(SUM(input_tokens), 0), COALESCE(SUM(output_tokens), 0) FROM calendar_posts WHERE job_id = ?",
+                (job_id,)
+            ).fetchone()
+            errors = self._conn.execute(
+                "SELECT topic, platform, attempts, error FROM calendar_posts "
+                "WHERE job_id = ? AND state = 'failed' ORDER BY item_index LIMIT 20", (job_id,)
+            ).fetchall()
+
+        counts = {state: counts.get(state, 0) for state in ("queued", "running", "completed", "failed")}
+        if counts["queued"] or counts["running"]:
+            status = "running" if job["started_at"] else "queued"
+        else:
+            status = "completed" if counts["completed"] else "failed"
+        elapsed = None
+        if job["started_at"]:
+            elapsed = (job["finished_at"] or time.time()) - job["started_at"]
+        return {
+            "id": job["id"],
+            "status": status,
+            "options": json.loads(job["options"]),
+            "items_total": job["items_total"],
+            **counts,
+            "input_tokens": usage[0],
+            "output_tokens": usage[1],
+            "elapsed_seconds": round(elapsed, 3) if elapsed is not None else None,
+            "posts_per_minute": round(counts["completed"] / elapsed * 60, 2) if elapsed else 0.0,
+            "errors": [dict(row) for row in errors],
+        }
+
+    def get_posts(self, job_id: str) -> List[Dict[str, Any]]:
+        """Finished posts in ``posts`` table shape, in calendar order."""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(POST_COLUMNS)}, scheduled_date FROM calendar_posts "
+                f"WHERE job_id = ? AND state = 'completed' ORDER BY scheduled_date IS NULL, scheduled_date, item_index",
+                (job_id,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def retry_failed(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM calendar_posts WHERE job_id = ? AND state = 'failed'", (job_id,)
+            ).fetchall()
+            self._conn.execute(
+                "UPDATE calendar_posts SET state = 'queued', attempts = 0, error = NULL WHERE job_id = ? AND state = 'failed'",
+                (job_id,)
+            )
+            if rows:
+                self._conn.execute("UPDATE calendar_jobs SET finished_at = NULL WHERE id = ?", (job_id,))
+            self._conn.commit()
+        if self._queue is not None:
+            for row in rows:
+                self._enqueue(row)
+        return self.get_job(job_id)
+
+    async def start(self):
+        self._queue = asyncio.PriorityQueue()
+        with self._lock:
+            self._conn.execute("UPDATE calendar_posts SET state = 'queued' WHERE state = 'running'")
+            self._conn.commit()
+            pending = self._conn.execute("SELECT * FROM calendar_posts WHERE state = 'queued'").fetchall()
+        for row in pending:
+            self._enqueue(row)
+        if pending:
+            print(f"📅 Resuming {len(pending)} queued calendar posts")
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(settings.CALENDAR_WORKERS)]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        for task in self._inputs.values():
+            task.cancel()
+        self._inputs.clear()
+
+    async def _worker(self):
+        while True:
+            *_, post_id = await self._queue.get()
+            try:
+                await self._run(post_id)
+            except Exception as e:
+                print(f"❌ Calendar post {post_id} failed: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _shared_inputs(self, job_id: str, topic: str, options: dict) -> asyncio.Task:
+        key = (job_id, topic)
+        task = self._inputs.get(key)
+        if task is None or (task.done() and (task.cancelled() or task.exception() is not None)):
+            task = asyncio.ensure_future(self._gather_inputs(topic, options))
+            self._inputs[key] = task
+            while len(self._inputs) > MAX_SHARED_INPUTS:
+                self._inputs.popitem(last=False)
+        self._inputs.move_to_end(key)
+        return task
+
+    async def _gather_inputs(self, topic: str, options: dict):
+        async def retrieve():
+            if not options["use_rag"]:
+                return []
+            return await rag_service.query_similar(rag_service.collection_for(options["brand_id"]), topic) or []
+
+        async def search():
+            return await search_service.search(topic) if options["use_search"] else ""
+
+        return await asyncio.gather(retrieve(), search())
+
+    def _pick_route(self, provider: str, model: str, tokens: int) -> Tuple[str, str]:
+        routes = llm_service.router.routes(TASK_TEXT, provider, model)
+        if not routes:
+            raise RuntimeError("No LLM provider configured.")
+        if provider != AUTO:
+            return routes[0].provider, routes[0].model
+        # Spread "auto" jobs over whichever provider has rate limit headroom soonest; ties keep latency order
+        route = min(routes, key=lambda route: rate_limiter.wait_time(route.provider, tokens))
+        return route.provider, route.model
+
+    async def _run(self, post_id: str):
+        with self._lock:
+            item = self._conn.execute("SELECT * FROM calendar_posts WHERE id = ?", (post_id,)).fetchone()
+            if item is None or item["state"] != "queued":
+                return
+            job = self._conn.execute("SELECT options FROM calendar_jobs WHERE id = ?", (item["job_id"],)).fetchone()
+            self._conn.execute(
+                "UPDATE calendar_posts SET state = 'running', attempts = attempts + 1 WHERE id = ?", (post_id,)
+            )
+            self._conn.execute(
+                "UPDATE calendar_jobs SET started_at = COALESCE(started_at, ?) WHERE id = ?", (time.time(), item["job_id"])
+            )
+            self._conn.commit()
+        options = json.loads(job["options"])
+
+        try:
+            context_used, search_results = await self._shared_inputs(item["job_id"], item["topic"], options)
+            context = build_context(context_used, search_results, options["model"])
+            prefix, prompt = copy_prompt(
+                item["platform"], item["topic"], item["style"] or options["style"], context, options["use_search"]
+            )
+            tokens = estimate_tokens(prefix) + estimate_tokens(prompt) + settings.CALENDAR_OUTPUT_TOKENS_ESTIMATE
+            provider, model = self._pick_route(options["provider"], options["model"], tokens)
+            await rate_limiter.acquire(provider, tokens)
+            result = await llm_service.generate(
+                prompt, model=model, provider=provider, use_cache=options["use_cache"], prefix=prefix
+            )
+            rate_limiter.settle(
+                provider, tokens, result.input_tokens + result.output_tokens, served_by=result.provider, cached=result.cached
+            )
+        except asyncio.CancelledError:
+            # Shutdown mid-generation: leave it for the next start to pick up
+            self._execute("UPDATE calendar_posts SET state = 'queued', attempts = attempts - 1 WHERE id = ?", (post_id,))
+            raise
+        except Exception as e:
+            retry = item["attempts"] + 1 < settings.CALENDAR_MAX_ATTEMPTS
+            self._execute(
+                "UPDATE calendar_posts SET state = ?, error = ?, updated_at = ? WHERE id = ?",
+                ("queued" if retry else "failed", str(e), _now_iso(), post_id)
+            )
+            if retry:
+                asyncio.get_running_loop().call_later(RETRY_BASE_DELAY * 2 ** item["attempts"], self._enqueue, item)
+            else:
+                CALENDAR_ITEMS_TOTAL.inc(outcome="failed")
+                self._finish_job(item["job_id"])
+            raise
+
+        self._execute(
+            "UPDATE calendar_posts SET state = 'completed', content = ?, provider = ?, model = ?, "
+            "input_tokens = ?, output_tokens = ?, error = NULL, updated_at = ? WHERE id = ?",
+            (result.text, result.provider, result.model, result.input_tokens, result.output_tokens, _now_iso(), post_id)
+        )
+        CALENDAR_ITEMS_TOTAL.inc(outcome="completed")
+        self._finish_job(item["job_id"])
+
+    def _finish_job(self, job_id: str):
+        with self._lock:
+            remaining = self._conn.execute(
+                "SELECT COUNT(*) FROM calendar_posts WHERE job_id = ? AND state IN ('queued', 'running')", (job_id,)
+            ).fetchone()[0]
+            if not remaining:
+                self._conn.execute("UPDATE calendar_jobs SET finished_at = ? WHERE id = ?", (time.time(), job_id))
+                self._conn.commit()
+
+calendar_service = CalendarService()
@@ -0,0 +1,192 @@
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+from app.core.config import settings
+from app.core.metrics import PROMPT_CONTEXT_TOKENS_TOTAL
+from app.core.prompts import PLATFORM_GUIDES, TOPIC_TEMPLATE
+
+# Han, kana, CJK punctuation and full-width forms each cost about one token
+CJK_CHAR = re.compile("[\u3000-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]")
+SEARCH_SEPARATOR = "\n---\n"
+# Shortest prefix/suffix match treated as splitter overlap rather than coincidence
+MIN_OVERLAP = 40
+# Overlap is 200 chars in DocumentProcessor; splitting on separators can stretch it slightly
+MAX_OVERLAP = 400
+# Share of the budget web search may take when brand context is also present
+SEARCH_BUDGET_SHARE = 0.4
+TRUNCATION_MARK = "…"
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count: one per CJK character, one per four other characters.
+
+    Close enough to cl100k/o200k and the Gemini and Claude tokenizers for
+    budgeting, and needs no tokenizer download.
+    """
+    if not text:
+        return 0
+    cjk = len(CJK_CHAR.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def _parse_budgets(spec: str) -> Dict[str, int]:
+    budgets = {}
+    for item in spec.split(","):
+        model, _, tokens = item.partition("=")
+        if model.strip() and tokens.strip():
+            budgets[model.strip()] = int(tokens)
+    return budgets
+
+
+MODEL_BUDGETS = _parse_budgets(settings.CONTEXT_TOKEN_BUDGETS)
+
+
+def budget_for(model: str) -> int:
+    return MODEL_BUDGETS.get(model, settings.CONTEXT_TOKEN_BUDGET)
+
+
+def _overlap(left: str, right: str) -> int:
+    """Length of the longest suffix of ``left`` that is a prefix of ``right``."""
+    for length in range(min(len(left), len(right), MAX_OVERLAP), MIN_OVERLAP - 1, -1):
+        if left.endswith(right[:length]):
+            return length
+    return 0
+
+
+def dedupe_chunks(chunks: List[str]) -> List[str]:
+    """Drop repeated and contained chunks and trim text shared with an earlier chunk's edges.
+
+    Neighbouring splitter chunks share up to 200 characters, so two adjacent
+    hits would otherwise send that text twice. Ranking order is kept.
+    """
+    kept: List[str] = []
+    for chunk in chunks:
+        chunk = chunk.strip()
+        if not chunk or any(chunk in other for other in kept):
+            continue
+        kept = [other for other in kept if other not in chunk]
+        for other in kept:
+            # other ... | shared | ... chunk
+            chunk = chunk[_overlap(other, chunk):]
+            # chunk ... | shared | ... other
+            trim = _overlap(chunk, other)
+            if trim:
+                chunk = chunk[:-trim]
+        chunk = chunk.strip()
+        if chunk:
+            kept.append(chunk)
+    return kept
+
+
+def truncate_to_tokens(text: str, budget: int) -> str:
+    if estimate_tokens(text) <= budget:
+        return text
+    if budget <= 0:
+        return ""
+    # Binary search on characters; estimate_tokens is monotonic in prefix length
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if estimate_tokens(text[:mid]) < budget:
+            low = mid
+        else:
+            high = mid - 1
+    return text[:low].rstrip() + TRUNCATION_MARK
+
+
+def fit_chunks(chunks: List[str], budget: int) -> List[str]:
+    """Keep chunks in rank order until the budget runs out; the last one may be cut."""
+    fitted = []
+    for chunk in chunks:
+        tokens = estimate_tokens(chunk)
+        if tokens <= budget:
+            fitted.append(chunk)
+            budget -= tokens
+            continue
+        # Only worth a partial chunk if a useful amount of it fits
+        if budget >= 50:
+            fitted.append(truncate_to_tokens(chunk, budget))
+        break
+    return fitted
+
+
+def compress_search_results(results: str, budget: int, per_result: int = 150) -> str:
+    """Keep each result's title and the start of its content; URLs are dropped, the writer never cites them."""
+    if not results.startswith("Title:"):
+        # Not SearchService's formatted output (e.g. a configuration notice)
+        return truncate_to_tokens(results, budget)
+
+    entries = []
+    for block in results.split(SEARCH_SEPARATOR):
+        title = content = ""
+        for line in block.strip().splitlines():
+            if line.startswith("Title:"):
+                title = line[len("Title:"):].strip()
+            elif line.startswith("Content:"):
+                content = line[len("Content:"):].strip()
+            elif content and not line.startswith("URL:"):
+                content += " " + line.strip()
+        if title or content:
+            entries.append(f"{title}：{truncate_to_tokens(content, per_result)}" if title else truncate_to_tokens(content, per_result))
+    return "\n".join(fit_chunks(entries, budget))
+
+
+@dataclass
+class PromptContext:
+    brand: str = ""
+    search: str = ""
+    brand_tokens_raw: int = 0
+    search_tokens_raw: int = 0
+
+    @property
+    def brand_tokens(self) -> int:
+        return estimate_tokens(self.brand)
+
+    @property
+    def search_tokens(self) -> int:
+        return estimate_tokens(self.search)
+
+    @property
+    def brand_tokens_saved(self) -> int:
+        return max(0, self.brand_tokens_raw - self.brand_tokens)
+
+    @property
+    def search_tokens_saved(self) -> int:
+        return max(0, self.search_tokens_raw - self.search_tokens)
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.brand_tokens_saved + self.search_tokens_saved
+
+
+def build_context(chunks: List[str], search_results: str = "", model: str = "gpt-4o") -> PromptContext:
+    """Assemble brand context and web search results within the model's context budget.
+
+    Search gets at most ``SEARCH_BUDGET_SHARE`` of the budget when there is
+    brand context too; whatever it leaves unused goes to the brand chunks.
+    """
+    budget = budget_for(model)
+    context = PromptContext(
+        brand_tokens_raw=estimate_tokens("\n".join(chunks)),
+        search_tokens_raw=estimate_tokens(search_results),
+    )
+    search_budget = int(budget * SEARCH_BUDGET_SHARE) if chunks else budget
+    context.search = compress_search_results(search_results, search_budget) if search_results else ""
+    context.brand = "\n".join(fit_chunks(dedupe_chunks(chunks), budget - context.search_tokens))
+
+    PROMPT_CONTEXT_TOKENS_TOTAL.inc(context.brand_tokens_raw + context.search_tokens_raw, stage="raw")
+    PROMPT_CONTEXT_TOKENS_TOTAL.inc(context.brand_tokens + context.search_tokens, stage="sent")
+    return context
+
+
+def copy_prompt(platform: str, topic: str, style: str, context: PromptContext, use_search: bool) -> Tuple[str, str]:
+    """Single-call copy prompt, split into the cacheable prefix (brand context, then platform guide) and the per-request part."""
+    # Brand context first: the same topic on several platforms shares it, the guide differs
+    prefix = PLATFORM_GUIDES[platform.lower()]
+    if context.brand:
+        prefix = f"品牌參考資訊：\n{context.brand}\n{prefix}"
+
+    prompt = TOPIC_TEMPLATE.format(topic=topic, style=style)
+    if use_search:
+        prompt = f"{prompt}\n\n最新時事資訊：\n{context.search}"
+    return prefix, prompt
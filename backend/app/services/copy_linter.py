@@ -0,0 +1,60 @@
+import re
+from dataclasses import dataclass, field
+from typing import List
+
+HASHTAG_PATTERN = re.compile(r"#[^\s#.,!?;:，。！？；：、]+")
+EMOJI_PATTERN = re.compile(
+    "[\U0001F300-\U0001FAFF\U00002600-\U000027BF\U0001F000-\U0001F02F\U0001F0A0-\U0001F0FF\U00002B00-\U00002BFF]"
+)
+CTA_KEYWORDS = [
+    "立即", "馬上", "現在就", "快來", "點擊", "點連結", "連結", "留言", "分享", "私訊", "追蹤", "按讚",
+    "報名", "預約", "購買", "下單", "搶購", "了解更多", "歡迎", "一起來", "告訴我們",
+]
+
+# Mirrors the platform traits spelled out in PLATFORM_PROMPTS plus each platform's hard length limit
+PLATFORM_RULES = {
+    "facebook": {"min_length": 80, "max_length": 2000, "hashtags": (0, 5), "require_emoji": False, "require_cta": True},
+    "instagram": {"min_length": 50, "max_length": 2200, "hashtags": (5, 10), "require_emoji": True, "require_cta": False},
+    "threads": {"min_length": 10, "max_length": 500, "hashtags": (0, 3), "require_emoji": False, "require_cta": False},
+}
+
+
+@dataclass
+class LintResult:
+    issues: List[str] = field(default_factory=list)
+
+    @property
+    def passed(self) -> bool:
+        return not self.issues
+
+    def as_critique(self) -> str:
+        return "\n".join(f"{i}. {issue}" for i, issue in enumerate(self.issues, start=1))
+
+
+def lint_copy(platform: str, text: str) -> LintResult:
+    """Check a draft against cheap, deterministic platform rules."""
+    rules = PLATFORM_RULES.get(platform.lower())
+    result = LintResult()
+    if rules is None:
+        return result
+
+    length = len(text.strip())
+    if length > rules["max_length"]:
+        result.issues.append(f"貼文長度 {length} 字超過 {platform} 上限 {rules['max_length']} 字，請精簡內容。")
+    elif length < rules["min_length"]:
+        result.issues.append(f"貼文只有 {length} 字，內容過短，請至少擴充到 {rules['min_length']} 字。")
+
+    hashtags = len(HASHTAG_PATTERN.findall(text))
+    low, high = rules["hashtags"]
+    if hashtags < low:
+        result.issues.append(f"請在結尾加入 {low}-{high} 個相關的 Hashtags（目前 {hashtags} 個）。")
+    elif hashtags > high:
+        result.issues.append(f"Hashtags 過多（{hashtags} 個），請減少到 {high} 個以內。")
+
+    if rules["require_emoji"] and not EMOJI_PATTERN.search(text):
+        result.issues.append("請加入適量的 Emoji 讓貼文更活潑。")
+
+    if rules["require_cta"] and not any(keyword in text for keyword in CTA_KEYWORDS):
+        result.issues.append("請在結尾加入明確的行動呼籲 (CTA)，例如留言、分享或點擊連結。")
+
+    return result
@@ -1,25 +1,189 @@
-import tempfile
-from typing import List
-from langchain_community.document_loaders import PyPDFLoader, TextLoader, CSVLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+import asyncio
+import multiprocessing
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import AsyncIterator, Iterator, List
+from app.core.config import settings
+
+TEXT_READ_SIZE = 64 * 1024
+# Batches a parser process may get ahead of the consumer before it blocks
+PARSE_READ_AHEAD = 2
 
 class DocumentProcessor:
-    def __init__(self):
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200
-        )
+    def __init__(self, parse_workers: int = 1):
+        self._text_splitter = None
+        self.parse_workers = parse_workers
+        self._pool = None
+        self._manager = None
+        self._pool_lock = threading.Lock()
 
-    async def process_file(self, file_path: str, file_type: str) -> List[str]:
+    @property
+    def text_splitter(self):
+        # Loaders and splitters are imported with the first upload, not at app start
+        if self._text_splitter is None:
+            from langchain_text_splitters import RecursiveCharacterTextSplitter
+            self._text_splitter = RecursiveCharacterTextSplitter(
+                chunk_size=1000,
+                chunk_overlap=200
+            )
+        return self._text_splitter
+
+    def warm_up(self):
+        self.text_splitter
+
+    def iter_chunks(self, file_path: str, file_type: str) -> Iterator[str]:
+        """Yield chunks as the file is read, holding one page, row or text block at a time."""
         if file_type == "pdf":
-            loader = PyPDFLoader(file_path)
+            yield from self._iter_pdf_chunks(file_path)
         elif file_type == "csv":
-            loader = CSVLoader(file_path)
+            from langchain_community.document_loaders import CSVLoader
+            # CSV rows are split independently, exactly as split_documents does
+            for doc in CSVLoader(file_path).lazy_load():
+                yield from self.text_splitter.split_text(doc.page_content)
         else:
-            loader = TextLoader(file_path)
-        
-        docs = loader.load()
-        split_docs = self.text_splitter.split_documents(docs)
-        return [doc.page_content for doc in split_docs]
+            yield from self._iter_text_chunks(file_path)
+
+    def _iter_pdf_chunks(self, file_path: str) -> Iterator[str]:
+        # pypdf directly rather than PyPDFLoader.lazy_load, which rebuilds the
+        # full page label list for every page it yields
+        from pypdf import PdfReader
+        with open(file_path, "rb") as f:
+            reader = PdfReader(f)
+            for page in reader.pages:
+                text = page.extract_text().strip()
+                if text:
+                    yield from self.text_splitter.split_text(text)
+
+    def _iter_text_chunks(self, file_path: str) -> Iterator[str]:
+        carry = ""
+        with open(file_path, encoding="utf-8") as f:
+            while True:
+                block = f.read(TEXT_READ_SIZE)
+                if not block:
+                    break
+                chunks = self.text_splitter.split_text(carry + block)
+                # The last chunk may continue in the next block, so it is re-split with it
+                carry = chunks.pop() if chunks else ""
+                yield from chunks
+        if carry:
+            yield carry
+
+    def iter_chunk_batches(self, file_path: str, file_type: str, batch_size: int) -> Iterator[List[str]]:
+        batch = []
+        for chunk in self.iter_chunks(file_path, file_type):
+            batch.append(chunk)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    async def stream_batches(
+        self, file_path: str, file_type: str, batch_size: int, in_process: bool = True
+    ) -> AsyncIterator[List[str]]:
+        """``iter_chunk_batches`` parsed ahead of the consumer, in a parser process by default.
+
+        pypdf and the splitters are pure Python and hold the GIL while they run,
+        so parsing in a thread still stalls the event loop for every batch. A
+        pool of parser processes parses instead and hands batches over through a
+        bounded queue; the consumer only waits on that queue, off the loop, in a
+        thread. Scripts that ingest must guard their entry point with
+        ``if __name__ == "__main__"``, as parser processes re-import it.
+        """
+        if not in_process:
+            batches = self.iter_chunk_batches(file_path, file_type, batch_size)
+            # Parse the next batch in a worker thread while the current one is being consumed
+            pending = asyncio.ensure_future(asyncio.to_thread(next, batches, None))
+            try:
+                while True:
+                    batch = await pending
+                    if batch is None:
+                        break
+                    pending = asyncio.ensure_future(asyncio.to_thread(next, batches, None))
+                    yield batch
+            finally:
+                pending.cancel()
+            return
+
+        # Starting the manager process blocks, so the first upload does it off the loop
+        pool, manager = await asyncio.to_thread(self._parser_pool)
+        batches, stop = manager.Queue(maxsize=PARSE_READ_AHEAD), manager.Event()
+        try:
+            future = pool.submit(_produce_batches, file_path, file_type, batch_size, batches, stop)
+        except BrokenProcessPool:
+            # A parser process died (out of memory, killed) and took the pool with it; the next job gets a new one
+            self.close()
+            raise
+        try:
+            while True:
+                kind, payload = await asyncio.to_thread(_receive, batches, future)
+                if kind == "done":
+                    break
+                if kind == "error":
+                    raise RuntimeError(payload)
+                yield payload
+        finally:
+            # Frees the pool worker if it is still parsing or waiting for room in the queue
+            stop.set()
+            if future.done() and not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+                self.close()
+
+    def _parser_pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                # spawn, not fork: the API process runs threads and an event loop that a fork would copy mid-flight.
+                # Workers live as long as the pool, so each pays the interpreter start once, not per upload
+                context = multiprocessing.get_context("spawn")
+                self._manager = context.Manager()
+                self._pool = ProcessPoolExecutor(max_workers=self.parse_workers, mp_context=context)
+            return self._pool, self._manager
+
+    def close(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._manager.shutdown()
+                self._pool = self._manager = None
+
+    def split_file(self, file_path: str, file_type: str) -> List[str]:
+        return list(self.iter_chunks(file_path, file_type))
+
+    async def process_file(self, file_path: str, file_type: str) -> List[str]:
+        return await asyncio.to_thread(self.split_file, file_path, file_type)
+
+def _produce_batches(file_path: str, file_type: str, batch_size: int, batches, stop):
+    # Runs in a parser process; gives up as soon as the consumer stops reading
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    try:
+        for batch in DocumentProcessor().iter_chunk_batches(file_path, file_type, batch_size):
+            if not put(("batch", batch)):
+                return
+        put(("done", None))
+    except Exception as e:
+        put(("error", f"{type(e).__name__}: {e}"))
+
+
+def _receive(batches, future) -> tuple:
+    while True:
+        try:
+            return batches.get(timeout=1)
+        except queue.Empty:
+            if future.done():
+                # Anything put before the task ended is in the queue by now
+                try:
+                    return batches.get_nowait()
+                except queue.Empty:
+                    error = future.exception()
+                    return "error", f"Parser process failed: {error!r}" if error else "Parser process stopped early"
 
-document_processor = DocumentProcessor()
+document_processor = DocumentProcessor(settings.INGESTION_WORKERS)
@@ -0,0 +1,196 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+DOCUMENT_COLUMNS = ["doc_id", "source", "version", "status", "chunks", "latest_version", "updated_at"]
+
+
+class DocumentRegistry:
+    """Brand documents, their versions and the chunks each version uses, in SQLite.
+
+    Chunks are stored once per collection (keyed by content hash), so several
+    documents or versions may share one. A chunk is live while a reference to
+    it comes from a document's committed version, or from a newer version that
+    is still being ingested; once nothing live refers to it, it can be removed
+    from the vector store and the keyword index.
+
+    ``latest_version`` is the last version handed out. Committing only moves a
+    document forward, so a slow upload can never overwrite a newer one, and
+    deleting a document retires every version handed out before the delete.
+    """
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "collection TEXT NOT NULL, doc_id TEXT NOT NULL, source TEXT NOT NULL, "
+            "version INTEGER NOT NULL DEFAULT 0, status TEXT NOT NULL DEFAULT 'pending', "
+            "chunks INTEGER NOT NULL DEFAULT 0, latest_version INTEGER NOT NULL DEFAULT 0, updated_at REAL NOT NULL, "
+            "PRIMARY KEY (collection, doc_id));"
+            "CREATE TABLE IF NOT EXISTS chunk_refs ("
+            "collection TEXT NOT NULL, doc_id TEXT NOT NULL, version INTEGER NOT NULL, content_hash TEXT NOT NULL, "
+            "PRIMARY KEY (collection, doc_id, version, content_hash));"
+            "CREATE INDEX IF NOT EXISTS chunk_refs_hash ON chunk_refs (collection, content_hash);"
+        )
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    def reserve_version(self, collection: str, doc_id: str, source: str) -> int:
+        """Next version number for a (re-)upload of ``doc_id``."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO documents (collection, doc_id, source, updated_at) VALUES (?, ?, ?, ?)",
+                (collection, doc_id, source, time.time())
+            )
+            self._conn.execute(
+                "UPDATE documents SET latest_version = latest_version + 1 WHERE collection = ? AND doc_id = ?",
+                (collection, doc_id)
+            )
+            row = self._conn.execute(
+                "SELECT latest_version FROM documents WHERE collection = ? AND doc_id = ?", (collection, doc_id)
+            ).fetchone()
+            self._conn.commit()
+        return row["latest_version"]
+
+    def add_refs(self, collection: str, doc_id: str, version: int, hashes: Iterable[str]):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO chunk_refs (collection, doc_id, version, content_hash) VALUES (?, ?, ?, ?)",
+                [(collection, doc_id, version, digest) for digest in set(hashes)]
+            )
+            self._conn.commit()
+
+    def commit(self, collection: str, doc_id: str, version: int, source: str) -> List[str]:
+        """Make ``version`` the document's current one; returns hashes whose references were dropped.
+
+        A version older than the committed one (or retired by a delete) is
+        dropped instead, so its own chunks are returned.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT version FROM documents WHERE collection = ? AND doc_id = ?", (collection, doc_id)
+            ).fetchone()
+            if row is None or version <= row["version"]:
+                dropped = self._drop_refs(collection, doc_id, "version = ?", version)
+            else:
+                chunks = self._conn.execute(
+                    "SELECT COUNT(*) FROM chunk_refs WHERE collection = ? AND doc_id = ? AND version = ?",
+                    (collection, doc_id, version)
+                ).fetchone()[0]
+                self._conn.execute(
+                    "UPDATE documents SET version = ?, status = 'active', source = ?, chunks = ?, updated_at = ? "
+                    "WHERE collection = ? AND doc_id = ?",
+                    (version, source, chunks, time.time(), collection, doc_id)
+                )
+                dropped = self._drop_refs(collection, doc_id, "version < ?", version)
+            self._conn.commit()
+        return dropped
+
+    def abandon(self, collection: str, doc_id: str, version: int) -> List[str]:
+        """Forget a version whose ingestion failed; returns the hashes it referenced."""
+        with self._lock:
+            dropped = self._drop_refs(collection, doc_id, "version = ?", version)
+            self._conn.commit()
+        return dropped
+
+    def delete(self, collection: str, doc_id: str) -> Optional[List[str]]:
+        """Mark a document deleted and drop every reference; None if it was never registered."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT latest_version FROM documents WHERE collection = ? AND doc_id = ? AND status != 'deleted'",
+                (collection, doc_id)
+            ).fetchone()
+            if row is None:
+                return None
+            # Versions still being ingested are at most latest_version, so none of them can commit afterwards
+            self._conn.execute(
+                "UPDATE documents SET status = 'deleted', version = latest_version, chunks = 0, updated_at = ? "
+                "WHERE collection = ? AND doc_id = ?",
+                (time.time(), collection, doc_id)
+            )
+            dropped = self._drop_refs(collection, doc_id)
+            self._conn.commit()
+        return dropped
+
+    def _drop_refs(self, collection: str, doc_id: str, condition: str = "1", *params) -> List[str]:
+        where = f"collection = ? AND doc_id = ? AND {condition}"
+        hashes = [row[0] for row in self._conn.execute(
+            f"SELECT DISTINCT content_hash FROM chunk_refs WHERE {where}", (collection, doc_id, *params)
+        )]
+        self._conn.execute(f"DELETE FROM chunk_refs WHERE {where}", (collection, doc_id, *params))
+        return hashes
+
+    def unreferenced(self, collection: str, hashes: List[str]) -> List[str]:
+        """The subset of ``hashes`` no live version refers to any more."""
+        if not hashes:
+            return []
+        live = set()
+        with self._lock:
+            for start in range(0, len(hashes), 500):
+                batch = hashes[start:start + 500]
+                live.update(row[0] for row in self._conn.execute(
+                    f"SELECT DISTINCT r.content_hash FROM chunk_refs r "
+                    f"JOIN documents d ON d.collection = r.collection AND d.doc_id = r.doc_id "
+                    f"WHERE r.collection = ? AND r.content_hash IN ({','.join('?' * len(batch))}) "
+                    f"AND (r.version > d.version OR (r.version = d.version AND d.status = 'active'))",
+                    (collection, *batch)
+                ))
+        return [digest for digest in hashes if digest not in live]
+
+    def live_hashes(self, collection: str) -> set:
+        with self._lock:
+            return {row[0] for row in self._conn.execute(
+                "SELECT DISTINCT r.content_hash FROM chunk_refs r "
+                "JOIN documents d ON d.collection = r.collection AND d.doc_id = r.doc_id "
+                "WHERE r.collection = ? AND (r.version > d.version OR (r.version = d.version AND d.status = 'active'))",
+                (collection,)
+            )}
+
+    def get(self, collection: str, doc_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(DOCUMENT_COLUMNS)} FROM documents WHERE collection = ? AND doc_id = ?",
+                (collection, doc_id)
+            ).fetchone()
+        return dict(row) if row is not None else None
+
+    def list(self, collection: str) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(DOCUMENT_COLUMNS)} FROM documents WHERE collection = ? AND status != 'deleted' "
+                f"ORDER BY doc_id",
+                (collection,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def registered_sources(self, collection: str) -> set:
+        """Sources uploaded with a document id, whether still current or since deleted."""
+        with self._lock:
+            return {row[0] for row in self._conn.execute(
+                "SELECT source FROM documents WHERE collection = ?", (collection,)
+            )}
+
+    def adopt(self, collection: str, doc_id: str, source: str, hashes: Iterable[str]) -> bool:
+        """Register chunks stored before documents had ids as version 1 of ``doc_id``, unless the id is taken."""
+        hashes = set(hashes)
+        with self._lock:
+            inserted = self._conn.execute(
+                "INSERT OR IGNORE INTO documents (collection, doc_id, source, version, status, chunks, latest_version, updated_at) "
+                "VALUES (?, ?, ?, 1, 'active', ?, 1, ?)",
+                (collection, doc_id, source, len(hashes), time.time())
+            ).rowcount
+            if not inserted:
+                return False
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO chunk_refs (collection, doc_id, version, content_hash) VALUES (?, ?, 1, ?)",
+                [(collection, doc_id, digest) for digest in hashes]
+            )
+            self._conn.commit()
+        return True
@@ -0,0 +1,127 @@
+import asyncio
+import hashlib
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+from langchain_core.embeddings import Embeddings
+from app.core.metrics import EMBEDDING_BATCH_SECONDS, EMBEDDING_TEXTS_TOTAL
+from app.core.tracing import span
+from app.services.cache_service import CacheStats, MemoryCacheBackend, normalize_text
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that keys vectors by content hash and embeds misses in batches.
+
+    Document vectors are persisted in ``backend`` without expiry, so identical
+    chunks are only ever sent to the provider once. Query vectors are kept in a
+    bounded in-memory LRU keyed by whitespace-normalized text, since topics repeat.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        backend,
+        namespace: str,
+        batch_size: int = 64,
+        max_concurrency: int = 4,
+        query_cache_entries: int = 2000
+    ):
+        self.embeddings = embeddings
+        self.backend = backend
+        self.namespace = namespace
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.query_backend = MemoryCacheBackend(query_cache_entries)
+
+    @property
+    def stats(self) -> CacheStats:
+        return self.backend.stats
+
+    @property
+    def query_stats(self) -> CacheStats:
+        return self.query_backend.stats
+
+    def _key(self, text: str) -> str:
+        return f"{self.namespace}:{content_hash(text)}"
+
+    def _lookup(self, texts: List[str]):
+        unique = list(dict.fromkeys(texts))
+        keys = {text: self._key(text) for text in unique}
+        found = self.backend.get_many(list(keys.values()))
+        vectors = {text: found[key] for text, key in keys.items() if key in found}
+        missing = [text for text in unique if text not in vectors]
+        self.stats.hits += len(vectors)
+        self.stats.misses += len(missing)
+        return vectors, missing
+
+    def _batches(self, texts: List[str]) -> List[List[str]]:
+        return [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+
+    def _embed_batch(self, batch: List[str]) -> List[List[float]]:
+        EMBEDDING_TEXTS_TOTAL.inc(len(batch), operation="documents")
+        with span("embedding.documents", texts=len(batch)), EMBEDDING_BATCH_SECONDS.time(operation="documents"):
+            return self.embeddings.embed_documents(batch)
+
+    def _store(self, vectors: dict, batch: List[str], embedded: List[List[float]]):
+        vectors.update(zip(batch, embedded))
+        self.backend.set_many([(self._key(text), vector) for text, vector in zip(batch, embedded)], 0)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors, missing = self._lookup(texts)
+        batches = self._batches(missing)
+        if len(batches) == 1:
+            self._store(vectors, batches[0], self._embed_batch(batches[0]))
+        elif batches:
+            with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+                for batch, embedded in zip(batches, pool.map(self._embed_batch, batches)):
+                    self._store(vectors, batch, embedded)
+        return [vectors[text] for text in texts]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors, missing = self._lookup(texts)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def embed_batch(batch: List[str]):
+            EMBEDDING_TEXTS_TOTAL.inc(len(batch), operation="documents")
+            async with semaphore:
+                with span("embedding.documents", texts=len(batch)), EMBEDDING_BATCH_SECONDS.time(operation="documents"):
+                    embedded = await self.embeddings.aembed_documents(batch)
+            self._store(vectors, batch, embedded)
+
+        await asyncio.gather(*(embed_batch(batch) for batch in self._batches(missing)))
+        return [vectors[text] for text in texts]
+
+    def _cached_query(self, text: str):
+        vector = self.query_backend.get(text)
+        if vector is None:
+            self.query_stats.misses += 1
+            return None
+        self.query_stats.hits += 1
+        return vector.tolist()
+
+    def _store_query(self, text: str, vector: List[float]) -> List[float]:
+        # array("d") holds the same float64 values in an eighth of a list of Python floats
+        self.query_backend.set(text, array("d", vector), 0)
+        return vector
+
+    def embed_query(self, text: str) -> List[float]:
+        text = normalize_text(text)
+        vector = self._cached_query(text)
+        if vector is not None:
+            return vector
+        EMBEDDING_TEXTS_TOTAL.inc(operation="query")
+        with span("embedding.query"), EMBEDDING_BATCH_SECONDS.time(operation="query"):
+            return self._store_query(text, self.embeddings.embed_query(text))
+
+    async def aembed_query(self, text: str) -> List[float]:
+        text = normalize_text(text)
+        vector = self._cached_query(text)
+        if vector is not None:
+            return vector
+        EMBEDDING_TEXTS_TOTAL.inc(operation="query")
+        with span("embedding.query"), EMBEDDING_BATCH_SECONDS.time(operation="query"):
+            return self._store_query(text, await self.embeddings.aembed_query(text))
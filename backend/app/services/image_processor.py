@@ -0,0 +1,89 @@
+import asyncio
+import hashlib
+import io
+from dataclasses import dataclass
+from PIL import Image, ImageOps
+from app.core.config import settings
+
+
+@dataclass
+class PreparedImage:
+    data: bytes
+    mime_type: str
+    width: int
+    height: int
+    original_bytes: int
+    content_hash: str
+    perceptual_hash: str
+
+
+def difference_hash(image: Image.Image, size: int = 8) -> str:
+    """64-bit dHash: stable across re-encoding and resizing of the same picture."""
+    small = image.convert("L").resize((size + 1, size), Image.Resampling.LANCZOS)
+    pixels = list(small.getdata())
+    bits = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            right = pixels[row * (size + 1) + col + 1]
+            bits = (bits << 1) | (left > right)
+    return f"{bits:016x}"
+
+
+class ImageProcessor:
+    def __init__(
+        self,
+        max_side: int = settings.VISION_MAX_SIDE,
+        max_short_side: int = settings.VISION_MAX_SHORT_SIDE,
+        quality: int = settings.VISION_JPEG_QUALITY
+    ):
+        self.max_side = max_side
+        self.max_short_side = max_short_side
+        self.quality = quality
+
+    def _target_size(self, width: int, height: int):
+        long_side, short_side = max(width, height), min(width, height)
+        scale = min(1.0, self.max_side / long_side, self.max_short_side / short_side)
+        return max(1, round(width * scale)), max(1, round(height * scale))
+
+    def prepare_sync(self, contents: bytes) -> PreparedImage:
+        image = Image.open(io.BytesIO(contents))
+        source_format, original_size = image.format, image.size
+        target = self._target_size(*original_size)
+        # Let the JPEG decoder downscale by powers of two while decoding
+        image.draft("RGB", target)
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ("RGBA", "LA", "P"):
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, "white")
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+
+        target = self._target_size(*image.size)
+        if target != image.size:
+            image = image.resize(target, Image.Resampling.LANCZOS)
+
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=self.quality, optimize=True)
+        data, mime_type = buffer.getvalue(), "image/jpeg"
+        if source_format == "JPEG" and image.size == original_size and len(contents) <= len(data):
+            # Already a small JPEG: re-encoding would only cost quality
+            data = contents
+
+        return PreparedImage(
+            data=data,
+            mime_type=mime_type,
+            width=image.width,
+            height=image.height,
+            original_bytes=len(contents),
+            content_hash=hashlib.sha256(contents).hexdigest(),
+            perceptual_hash=difference_hash(image),
+        )
+
+    async def prepare(self, contents: bytes) -> PreparedImage:
+        # Decoding and resizing are CPU-bound; keep them off the event loop
+        return await asyncio.to_thread(self.prepare_sync, contents)
+
+image_processor = ImageProcessor()
@@ -0,0 +1,186 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import aclosing
+from typing import Any, Dict, Optional
+from app.core.config import settings
+from app.services.document_processor import document_processor
+from app.services.rag_service import rag_service
+
+JOB_COLUMNS = [
+    "id", "status", "collection_name", "source", "doc_id", "version", "file_path", "file_type",
+    "chunks_total", "chunks_processed", "chunks_added", "chunks_skipped",
+    "error", "created_at", "started_at", "finished_at",
+]
+
+class IngestionService:
+    """SQLite-backed queue of brand document ingestion jobs.
+
+    Chunks are parsed batch by batch in a child process, a couple of batches
+    ahead of embedding, so embedding starts with the first page, memory stays
+    flat and parsing never stalls the event loop.
+    Jobs left queued or running by a previous process are picked up again on
+    start; re-running a job is safe because chunks are deduplicated by content
+    hash on insert. A job with a ``doc_id`` uploads a new version of that
+    document, which replaces the previous version once the job completes.
+    """
+
+    def __init__(self, db_path: str = settings.INGESTION_DB_PATH, upload_dir: str = settings.INGESTION_UPLOAD_DIR):
+        self.upload_dir = upload_dir
+        os.makedirs(upload_dir, exist_ok=True)
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS ingestion_jobs ("
+            "id TEXT PRIMARY KEY, status TEXT NOT NULL, collection_name TEXT NOT NULL, source TEXT NOT NULL, "
+            "file_path TEXT NOT NULL, file_type TEXT NOT NULL, chunks_total INTEGER, "
+            "chunks_processed INTEGER NOT NULL DEFAULT 0, chunks_added INTEGER NOT NULL DEFAULT 0, "
+            "chunks_skipped INTEGER NOT NULL DEFAULT 0, error TEXT, created_at REAL NOT NULL, "
+            "started_at REAL, finished_at REAL)"
+        )
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(ingestion_jobs)")}
+        # Databases created before document versioning
+        for column, kind in (("doc_id", "TEXT"), ("version", "INTEGER")):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE ingestion_jobs ADD COLUMN {column} {kind}")
+        self._conn.commit()
+        self._lock = threading.Lock()
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers = []
+
+    def new_upload_path(self, file_ext: str) -> str:
+        return os.path.join(self.upload_dir, f"{uuid.uuid4().hex}.{file_ext}")
+
+    def _update(self, job_id: str, **fields):
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE ingestion_jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+            self._conn.commit()
+
+    def submit(
+        self, file_path: str, file_type: str, source: str, collection_name: str, doc_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        job_id = uuid.uuid4().hex
+        version = rag_service.documents.reserve_version(collection_name, doc_id, source) if doc_id else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO ingestion_jobs (id, status, collection_name, source, doc_id, version, file_path, file_type, created_at) "
+                "VALUES (?, 'queued', ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, collection_name, source, doc_id, version, file_path, file_type, time.time())
+            )
+            self._conn.commit()
+        if self._queue is not None:
+            self._queue.put_nowait(job_id)
+        return self.get_job(job_id)
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(JOB_COLUMNS)} FROM ingestion_jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job.pop("file_path")
+        elapsed = None
+        if job["started_at"]:
+            elapsed = (job["finished_at"] or time.time()) - job["started_at"]
+        job["elapsed_seconds"] = round(elapsed, 3) if elapsed is not None else None
+        job["chunks_per_second"] = round(job["chunks_processed"] / elapsed, 2) if elapsed else 0.0
+        return job
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        with self._lock:
+            self._conn.execute("UPDATE ingestion_jobs SET status = 'queued' WHERE status = 'running'")
+            self._conn.commit()
+            pending = self._conn.execute(
+                "SELECT id FROM ingestion_jobs WHERE status = 'queued' ORDER BY created_at"
+            ).fetchall()
+        for row in pending:
+            self._queue.put_nowait(row["id"])
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(settings.INGESTION_WORKERS)]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        document_processor.close()
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except Exception as e:
+                print(f"❌ Ingestion job {job_id} failed: {e}")
+                self._update(job_id, status="failed", error=str(e), finished_at=time.time())
+                await self._abandon(job_id)
+            finally:
+                self._queue.task_done()
+
+    @staticmethod
+    def _remove_upload(file_path: str):
+        # Kept only while the job may still run: removed on completion or final failure, not on shutdown
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+    async def _abandon(self, job_id: str):
+        with self._lock:
+            job = self._conn.execute("SELECT * FROM ingestion_jobs WHERE id = ?", (job_id,)).fetchone()
+        if job is None:
+            return
+        self._remove_upload(job["file_path"])
+        # A failed version never becomes current; drop whatever chunks only it had stored
+        if job["doc_id"]:
+            try:
+                await rag_service.abandon_document(job["collection_name"], job["doc_id"], job["version"])
+            except Exception as e:
+                print(f"⚠️ Could not clean up chunks of failed job {job_id}: {e}")
+
+    async def _run(self, job_id: str):
+        with self._lock:
+            job = self._conn.execute("SELECT * FROM ingestion_jobs WHERE id = ?", (job_id,)).fetchone()
+        if job is None or job["status"] != "queued":
+            return
+
+        self._update(
+            job_id, status="running", started_at=time.time(), finished_at=None, error=None,
+            chunks_processed=0, chunks_added=0, chunks_skipped=0
+        )
+        processed = added = skipped = 0
+        batches = document_processor.stream_batches(
+            job["file_path"], job["file_type"], settings.INGESTION_BATCH_SIZE, settings.INGESTION_PARSE_IN_PROCESS
+        )
+        # Closed on failure too, so the parser process never outlives its job
+        async with aclosing(batches):
+            async for batch in batches:
+                result = await rag_service.add_documents(
+                    collection_name=job["collection_name"],
+                    texts=batch,
+                    metadatas=[{"source": job["source"]} for _ in batch],
+                    doc_id=job["doc_id"],
+                    version=job["version"]
+                )
+                if result.get("error"):
+                    raise RuntimeError(result["error"])
+                processed += len(batch)
+                added += result["added"]
+                skipped += result["skipped"]
+                self._update(job_id, chunks_processed=processed, chunks_added=added, chunks_skipped=skipped)
+
+        if job["doc_id"]:
+            removed = await rag_service.commit_document(job["collection_name"], job["doc_id"], job["version"], job["source"])
+            if removed:
+                print(f"🧹 {job['doc_id']} v{job['version']}: removed {removed} chunks only older versions used")
+        self._update(job_id, status="completed", chunks_total=processed, finished_at=time.time())
+        self._remove_upload(job["file_path"])
+
+ingestion_service = IngestionService()
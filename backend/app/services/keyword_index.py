@@ -0,0 +1,179 @@
+import math
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+
+# Han, kana and compatibility ideographs are indexed as overlapping bigrams; everything else by word
+CJK_RANGES = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff"
+TOKEN_PATTERN = re.compile(f"[{CJK_RANGES}]+|[a-z0-9]+(?:[-_.][a-z0-9]+)*")
+CJK_PATTERN = re.compile(f"[{CJK_RANGES}]")
+
+
+def normalize(text: str) -> str:
+    # NFKC folds full-width letters and digits (ＳＫＵ１２３) into their ASCII forms
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text or "")).strip().lower()
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(normalize(text)):
+        run = match.group()
+        if CJK_PATTERN.match(run) and len(run) > 1:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return tokens
+
+
+# A single Latin/digit code with at least one digit: SKU-00042, ab12, iphone15
+CODE_PATTERN = re.compile(r"(?=[a-z0-9._-]*[0-9])[a-z0-9]+(?:[-_.][a-z0-9]+)*")
+
+
+def is_lookup_query(query: str, max_length: int = 32) -> bool:
+    """Product-code-like queries (SKUs, model numbers) where a verbatim hit is the answer.
+
+    Short CJK phrases ("咖啡", "母親節優惠") are topics rather than codes, so they don't count.
+    """
+    phrase = normalize(query)
+    return len(phrase) <= max_length and CODE_PATTERN.fullmatch(phrase) is not None
+
+
+class KeywordIndex:
+    """Per-collection BM25 inverted index stored in SQLite.
+
+    Documents are keyed by content hash, matching the vector store's dedup key,
+    and keep their text so keyword hits can be returned without touching Chroma.
+    """
+
+    def __init__(self, path: str, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS collections ("
+            "name TEXT PRIMARY KEY, doc_count INTEGER NOT NULL DEFAULT 0, total_length INTEGER NOT NULL DEFAULT 0);"
+            "CREATE TABLE IF NOT EXISTS docs ("
+            "collection TEXT NOT NULL, doc_id TEXT NOT NULL, length INTEGER NOT NULL, text TEXT NOT NULL, "
+            "PRIMARY KEY (collection, doc_id));"
+            "CREATE TABLE IF NOT EXISTS postings ("
+            "collection TEXT NOT NULL, term TEXT NOT NULL, doc_id TEXT NOT NULL, tf INTEGER NOT NULL, "
+            "PRIMARY KEY (collection, term, doc_id));"
+            # Lets a removed document's postings be found without scanning its collection
+            "CREATE INDEX IF NOT EXISTS postings_doc ON postings (collection, doc_id);"
+        )
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    def has_collection(self, collection: str) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM collections WHERE name = ?", (collection,)).fetchone()
+        return row is not None
+
+    def add(self, collection: str, documents: Iterable[Tuple[str, str]]):
+        """Index ``(doc_id, text)`` pairs; ids already present are ignored."""
+        with self._lock:
+            self._conn.execute("INSERT OR IGNORE INTO collections (name) VALUES (?)", (collection,))
+            added = total_length = 0
+            for doc_id, text in documents:
+                terms = Counter(tokenize(text))
+                length = sum(terms.values())
+                inserted = self._conn.execute(
+                    "INSERT OR IGNORE INTO docs (collection, doc_id, length, text) VALUES (?, ?, ?, ?)",
+                    (collection, doc_id, length, text)
+                ).rowcount
+                if not inserted:
+                    continue
+                self._conn.executemany(
+                    "INSERT INTO postings (collection, term, doc_id, tf) VALUES (?, ?, ?, ?)",
+                    [(collection, term, doc_id, tf) for term, tf in terms.items()]
+                )
+                added += 1
+                total_length += length
+            self._conn.execute(
+                "UPDATE collections SET doc_count = doc_count + ?, total_length = total_length + ? WHERE name = ?",
+                (added, total_length, collection)
+            )
+            self._conn.commit()
+
+    def remove(self, collection: str, doc_ids: Iterable[str]) -> int:
+        """Drop documents and their postings; unknown ids are ignored."""
+        with self._lock:
+            removed = total_length = 0
+            for doc_id in doc_ids:
+                row = self._conn.execute(
+                    "SELECT length FROM docs WHERE collection = ? AND doc_id = ?", (collection, doc_id)
+                ).fetchone()
+                if row is None:
+                    continue
+                self._conn.execute("DELETE FROM docs WHERE collection = ? AND doc_id = ?", (collection, doc_id))
+                self._conn.execute("DELETE FROM postings WHERE collection = ? AND doc_id = ?", (collection, doc_id))
+                removed += 1
+                total_length += row[0]
+            self._conn.execute(
+                "UPDATE collections SET doc_count = doc_count - ?, total_length = total_length - ? WHERE name = ?",
+                (removed, total_length, collection)
+            )
+            self._conn.commit()
+        return removed
+
+    def drop(self, collection: str):
+        with self._lock:
+            for table, column in (("postings", "collection"), ("docs", "collection"), ("collections", "name")):
+                self._conn.execute(f"DELETE FROM {table} WHERE {column} = ?", (collection,))
+            self._conn.commit()
+
+    def vacuum(self):
+        with self._lock:
+            self._conn.execute("VACUUM")
+
+    def search(self, collection: str, query: str, limit: int = 10) -> List[Dict]:
+        """BM25-ranked hits as ``{"doc_id", "text", "score", "exact"}``; ``exact`` means the whole query appears verbatim."""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        placeholders = ",".join("?" * len(terms))
+        with self._lock:
+            stats = self._conn.execute(
+                "SELECT doc_count, total_length FROM collections WHERE name = ?", (collection,)
+            ).fetchone()
+            if not stats or not stats[0]:
+                return []
+            rows = self._conn.execute(
+                f"SELECT p.term, p.doc_id, p.tf, d.length FROM postings p "
+                f"JOIN docs d ON d.collection = p.collection AND d.doc_id = p.doc_id "
+                f"WHERE p.collection = ? AND p.term IN ({placeholders})",
+                (collection, *terms)
+            ).fetchall()
+
+        doc_count, total_length = stats
+        average_length = total_length / doc_count or 1.0
+        document_frequency = Counter(term for term, _, _, _ in rows)
+        scores: Dict[str, float] = {}
+        for term, doc_id, tf, length in rows:
+            df = document_frequency[term]
+            idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+            norm = tf + self.k1 * (1 - self.b + self.b * length / average_length)
+            scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+
+        top = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+        if not top:
+            return []
+        with self._lock:
+            texts = dict(self._conn.execute(
+                f"SELECT doc_id, text FROM docs WHERE collection = ? AND doc_id IN ({','.join('?' * len(top))})",
+                (collection, *(doc_id for doc_id, _ in top))
+            ).fetchall())
+
+        phrase = normalize(query)
+        return [
+            {"doc_id": doc_id, "text": texts[doc_id], "score": score, "exact": phrase in normalize(texts[doc_id])}
+            for doc_id, score in top
+        ]
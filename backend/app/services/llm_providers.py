@@ -0,0 +1,529 @@
+import asyncio
+import base64
+import datetime
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, List, Optional, Tuple, Union
+import httpx
+from app.core.config import settings
+from app.core.prompts import VARIANTS_JSON_TEMPLATE
+from app.services.context_service import estimate_tokens
+
+PREFIX_SEPARATOR = "\n\n"
+# Gemini context caches remembered per process; older ones simply expire server-side
+GEMINI_MAX_CONTEXT_CACHES = 256
+# Completion budget per attached image; packed carousel requests scale with the image count
+VISION_MAX_TOKENS_PER_IMAGE = 500
+# Anthropic completion budget per requested copy variant
+MAX_TOKENS_PER_VARIANT = 1024
+
+
+@dataclass
+class LLMResult:
+    text: str
+    provider: str
+    model: str
+    input_tokens: int = 0
+    output_tokens: int = 0
+    # Prompt tokens the provider served from its prefix cache / wrote into it; input_tokens includes both
+    cached_input_tokens: int = 0
+    cache_write_tokens: int = 0
+    cached: bool = False
+    # Alternative completions from one variants request; ``text`` is the first of them
+    variants: List[str] = field(default_factory=list)
+
+
+@dataclass
+class TokenUsage:
+    calls: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cached_input_tokens: int = 0
+    cache_write_tokens: int = 0
+
+    def add(self, result: LLMResult):
+        self.calls += 1
+        self.input_tokens += result.input_tokens
+        self.output_tokens += result.output_tokens
+        self.cached_input_tokens += result.cached_input_tokens
+        self.cache_write_tokens += result.cache_write_tokens
+
+    def as_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "cached_input_tokens": self.cached_input_tokens,
+            "cache_write_tokens": self.cache_write_tokens,
+            "cached_input_ratio": round(self.cached_input_tokens / self.input_tokens, 4) if self.input_tokens else 0.0,
+        }
+
+
+_usage: ContextVar[Optional[TokenUsage]] = ContextVar("llm_usage", default=None)
+
+
+@contextmanager
+def track_usage():
+    """Sum provider token usage for every LLM call made in this context (and tasks it spawns)."""
+    usage = TokenUsage()
+    token = _usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _usage.reset(token)
+
+
+def current_usage() -> Optional[TokenUsage]:
+    return _usage.get()
+
+
+def record_usage(result: LLMResult):
+    usage = _usage.get()
+    if usage is not None:
+        usage.add(result)
+
+
+def join_prompt(prefix: str, prompt: str) -> str:
+    return f"{prefix}{PREFIX_SEPARATOR}{prompt}" if prefix else prompt
+
+
+def prefix_key(*parts: str) -> str:
+    return hashlib.sha256("\x00".join(parts).encode("utf-8")).hexdigest()[:32]
+
+
+def variants_prompt(prompt: str, count: int) -> str:
+    return VARIANTS_JSON_TEMPLATE.format(prompt=prompt, count=count)
+
+
+def parse_variants(text: str) -> List[str]:
+    """Non-empty strings of a ``{"variants": [...]}`` answer; empty if it isn't one."""
+    start, end = text.find("{"), text.rfind("}")
+    if start < 0 or end < start:
+        return []
+    try:
+        data = json.loads(text[start:end + 1])
+    except json.JSONDecodeError:
+        return []
+    variants = data.get("variants") if isinstance(data, dict) else None
+    if not isinstance(variants, list):
+        return []
+    return [item.strip() for item in variants if isinstance(item, str) and item.strip()]
+
+
+class BaseProvider:
+    """Async provider backend with a per-provider concurrency limit.
+
+    ``prefix`` is the static part of the user prompt (platform guide, brand
+    context) and is always sent before ``prompt`` so provider-side prefix
+    caches can reuse it. Streams may end with an ``LLMResult`` carrying only
+    token usage; the router consumes it and never forwards it as text.
+    """
+
+    name = ""
+    label = ""
+    default_model = ""
+    vision_model = ""
+
+    def __init__(self, max_concurrency: int):
+        self.max_concurrency = max_concurrency
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+
+    @property
+    def available(self) -> bool:
+        return True
+
+    async def generate(self, prompt: str, system_prompt: str, model: str, prefix: str = "") -> LLMResult:
+        async with self.semaphore:
+            return await self._generate(prompt, system_prompt, model, prefix)
+
+    async def stream(
+        self, prompt: str, system_prompt: str, model: str, prefix: str = ""
+    ) -> AsyncIterator[Union[str, LLMResult]]:
+        # The concurrency slot is held until the stream is exhausted or closed
+        async with self.semaphore:
+            async for delta in self._stream(prompt, system_prompt, model, prefix):
+                yield delta
+
+    async def generate_variants(self, prompt: str, system_prompt: str, model: str, prefix: str, count: int) -> LLMResult:
+        """Up to ``count`` alternative completions from one request, in ``variants``."""
+        async with self.semaphore:
+            return await self._generate_variants(prompt, system_prompt, model, prefix, count)
+
+    async def analyze_image(self, image: bytes, mime_type: str, prompt: str) -> LLMResult:
+        return await self.analyze_images([(image, mime_type)], prompt)
+
+    async def analyze_images(self, images: List[Tuple[bytes, str]], prompt: str) -> LLMResult:
+        """One request with every ``(bytes, mime_type)`` image attached after the prompt, in order."""
+        async with self.semaphore:
+            return await self._analyze_images(images, prompt)
+
+    async def _generate(self, prompt: str, system_prompt: str, model: str, prefix: str) -> LLMResult:
+        raise NotImplementedError
+
+    async def _stream(self, prompt: str, system_prompt: str, model: str, prefix: str) -> AsyncIterator[Union[str, LLMResult]]:
+        # Providers without native streaming emit the whole completion as one delta
+        result = await self._generate(prompt, system_prompt, model, prefix)
+        yield result.text
+        yield result
+
+    async def _generate_variants(self, prompt: str, system_prompt: str, model: str, prefix: str, count: int) -> LLMResult:
+        # Asked for as a JSON list after the prefix, so the prefix stays cacheable
+        result = await self._generate(variants_prompt(prompt, count), system_prompt, model, prefix)
+        return self._with_variants(result)
+
+    @staticmethod
+    def _with_variants(result: LLMResult) -> LLMResult:
+        result.variants = parse_variants(result.text)
+        if result.variants:
+            result.text = result.variants[0]
+        return result
+
+    async def _analyze_images(self, images: List[Tuple[bytes, str]], prompt: str) -> LLMResult:
+        raise NotImplementedError
+
+    def warm_up(self):
+        """Build the SDK client ahead of the first request; clients are otherwise created lazily."""
+
+    async def aclose(self):
+        pass
+
+
+def _pooled_limits(max_concurrency: int) -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=max_concurrency,
+        max_keepalive_connections=max_concurrency,
+        keepalive_expiry=settings.LLM_KEEPALIVE_SECONDS,
+    )
+
+
+class OpenAIProvider(BaseProvider):
+    name = "openai"
+    label = "OpenAI"
+    default_model = "gpt-4o"
+    vision_model = "gpt-4o"
+
+    def __init__(self, api_key: str = settings.OPENAI_API_KEY, max_concurrency: int = settings.OPENAI_MAX_CONCURRENCY):
+        super().__init__(max_concurrency)
+        self.api_key = api_key
+        self._client = None
+
+    @property
+    def available(self) -> bool:
+        return bool(self.api_key)
+
+    @property
+    def client(self):
+        # The SDK takes about a second to import, so it is loaded with the first request
+        if self._client is None and self.api_key:
+            import openai
+            self._client = openai.AsyncOpenAI(
+                api_key=self.api_key,
+                timeout=settings.LLM_TIMEOUT_SECONDS,
+                http_client=openai.DefaultAsyncHttpxClient(limits=_pooled_limits(self.max_concurrency)),
+            )
+        return self._client
+
+    def warm_up(self):
+        self.client
+
+    def _request(self, prompt: str, system_prompt: str, model: str, prefix: str) -> dict:
+        request = {
+            "model": model,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": join_prompt(prefix, prompt)}
+            ],
+        }
+        if prefix and settings.LLM_PREFIX_CACHE_ENABLED:
+            # Caching is automatic past 1024 tokens; the key routes equal prefixes to the same cache
+            request["prompt_cache_key"] = prefix_key(model, system_prompt, prefix)
+        return request
+
+    def _to_result(self, text: str, usage, model: str) -> LLMResult:
+        details = getattr(usage, "prompt_tokens_details", None)
+        return LLMResult(
+            text=text,
+            provider=self.name,
+            model=model,
+            input_tokens=usage.prompt_tokens if usage else 0,
+            output_tokens=usage.completion_tokens if usage else 0,
+            cached_input_tokens=getattr(details, "cached_tokens", 0) or 0,
+        )
+
+    async def _generate(self, prompt: str, system_prompt: str, model: str, prefix: str) -> LLMResult:
+        response = await self.client.chat.completions.create(**self._request(prompt, system_prompt, model, prefix))
+        return self._to_result(response.choices[0].message.content, response.usage, model)
+
+    async def _generate_variants(self, prompt: str, system_prompt: str, model: str, prefix: str, count: int) -> LLMResult:
+        # Native n: the prompt is processed once and billed once, only the completions multiply
+        response = await self.client.chat.completions.create(**self._request(prompt, system_prompt, model, prefix), n=count)
+        result = self._to_result(response.choices[0].message.content, response.usage, model)
+        result.variants = [choice.message.content for choice in response.choices if choice.message.content]
+        return result
+
+    async def _stream(self, prompt: str, system_prompt: str, model: str, prefix: str) -> AsyncIterator[Union[str, LLMResult]]:
+        stream = await self.client.chat.completions.create(
+            **self._request(prompt, system_prompt, model, prefix),
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+            if chunk.usage:
+                yield self._to_result("", chunk.usage, model)
+
+    async def _analyze_images(self, images: List[Tuple[bytes, str]], prompt: str) -> LLMResult:
+        # The chat API only takes images as URLs, so this is the one place bytes are base64-encoded
+        content = [{"type": "text", "text": prompt}]
+        for image, mime_type in images:
+            image_url = f"data:{mime_type};base64,{base64.b64encode(image).decode('utf-8')}"
+            content.append({"type": "image_url", "image_url": {"url": image_url}})
+        response = await self.client.chat.completions.create(
+            model=self.vision_model,
+            messages=[{"role": "user", "content": content}],
+            max_tokens=VISION_MAX_TOKENS_PER_IMAGE * len(images),
+        )
+        usage = response.usage
+        return LLMResult(
+            text=response.choices[0].message.content,
+            provider=self.name,
+            model=self.vision_model,
+            input_tokens=usage.prompt_tokens if usage else 0,
+            output_tokens=usage.completion_tokens if usage else 0,
+        )
+
+    async def aclose(self):
+        if self._client:
+            await self._client.close()
+
+
+class AnthropicProvider(BaseProvider):
+    name = "anthropic"
+    label = "Anthropic"
+    default_model = "claude-3-sonnet-20240229"
+
+    def __init__(self, api_key: str = settings.ANTHROPIC_API_KEY, max_concurrency: int = settings.ANTHROPIC_MAX_CONCURRENCY):
+        super().__init__(max_concurrency)
+        self.api_key = api_key
+        self._client = None
+
+    @property
+    def available(self) -> bool:
+        return bool(self.api_key)
+
+    @property
+    def client(self):
+        if self._client is None and self.api_key:
+            import anthropic
+            self._client = anthropic.AsyncAnthropic(
+                api_key=self.api_key,
+                timeout=settings.LLM_TIMEOUT_SECONDS,
+                http_client=anthropic.DefaultAsyncHttpxClient(limits=_pooled_limits(self.max_concurrency)),
+            )
+        return self._client
+
+    def warm_up(self):
+        self.client
+
+    def _request(self, prompt: str, system_prompt: str, model: str, prefix: str, max_tokens: int = 1024) -> dict:
+        content = prompt
+        if prefix:
+            prefix_block = {"type": "text", "text": prefix}
+            if settings.LLM_PREFIX_CACHE_ENABLED:
+                # One breakpoint after the static segments caches system prompt + prefix together
+                prefix_block["cache_control"] = {"type": "ephemeral"}
+            content = [prefix_block, {"type": "text", "text": prompt}]
+        return {
+            "model": model,
+            "max_tokens": max_tokens,
+            "system": system_prompt,
+            "messages": [
+                {"role": "user", "content": content}
+            ],
+        }
+
+    def _to_result(self, text: str, usage, model: str) -> LLMResult:
+        cache_read = getattr(usage, "cache_read_input_tokens", 0) or 0
+        cache_write = getattr(usage, "cache_creation_input_tokens", 0) or 0
+        return LLMResult(
+            text=text,
+            provider=self.name,
+            model=model,
+            # Anthropic's input_tokens excludes cached segments; count the whole prompt like the others do
+            input_tokens=usage.input_tokens + cache_read + cache_write,
+            output_tokens=usage.output_tokens,
+            cached_input_tokens=cache_read,
+            cache_write_tokens=cache_write,
+        )
+
+    async def _generate(self, prompt: str, system_prompt: str, model: str, prefix: str) -> LLMResult:
+        response = await self.client.messages.create(**self._request(prompt, system_prompt, model, prefix))
+        return self._to_result(response.content[0].text, response.usage, model)
+
+    async def _generate_variants(self, prompt: str, system_prompt: str, model: str, prefix: str, count: int) -> LLMResult:
+        request = self._request(variants_prompt(prompt, count), system_prompt, model, prefix, MAX_TOKENS_PER_VARIANT * count)
+        response = await self.client.messages.create(**request)
+        return self._with_variants(self._to_result(response.content[0].text, response.usage, model))
+
+    async def _stream(self, prompt: str, system_prompt: str, model: str, prefix: str) -> AsyncIterator[Union[str, LLMResult]]:
+        async with self.client.messages.stream(**self._request(prompt, system_prompt, model, prefix)) as stream:
+            async for delta in stream.text_stream:
+                yield delta
+            message = await stream.get_final_message()
+        yield self._to_result("", message.usage, model)
+
+    async def aclose(self):
+        if self._client:
+            await self._client.close()
+
+
+class GoogleProvider(BaseProvider):
+    name = "google"
+    label = "Google"
+    default_model = "gemini-3-flash-preview"
+    vision_model = "gemini-3-flash-preview"
+
+    def __init__(self, api_key: str = settings.GOOGLE_API_KEY, max_concurrency: int = settings.GOOGLE_MAX_CONCURRENCY):
+        super().__init__(max_concurrency)
+        self.api_key = api_key
+        self._genai = None
+        # Explicit context caches by prefix key: (cache name, local expiry); None marks a failed create
+        self._context_caches: "OrderedDict[str, Optional[tuple]]" = OrderedDict()
+        self._cache_locks: Dict[str, asyncio.Lock] = {}
+
+    @property
+    def available(self) -> bool:
+        return bool(self.api_key)
+
+    @property
+    def genai(self):
+        """The SDK module, imported and configured on first use."""
+        if self._genai is None:
+            import google.generativeai as genai
+            # The async gRPC channel is created once by the SDK and shared by every GenerativeModel
+            genai.configure(api_key=self.api_key)
+            self._genai = genai
+        return self._genai
+
+    def warm_up(self):
+        if self.api_key:
+            self.genai
+
+    async def _cached_content(self, model: str, system_prompt: str, prefix: str) -> Optional[str]:
+        """Name of an explicit context cache holding system prompt + prefix, created on first use.
+
+        Explicit caches are billed for storage, so only prefixes long enough to
+        be worth it get one; shorter ones still benefit from Gemini's implicit
+        caching because the prefix is sent first.
+        """
+        if estimate_tokens(system_prompt) + estimate_tokens(prefix) < settings.GEMINI_CONTEXT_CACHE_MIN_TOKENS:
+            return None
+
+        key = prefix_key(model, system_prompt, prefix)
+        lock = self._cache_locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            entry = self._context_caches.get(key, ())
+            if key in self._context_caches:
+                self._context_caches.move_to_end(key)
+            if entry is None:
+                return None
+            if entry and entry[1] > time.monotonic():
+                return entry[0]
+            ttl = settings.GEMINI_CONTEXT_CACHE_TTL_SECONDS
+            try:
+                from google.generativeai import caching as genai_caching
+                cached = await asyncio.to_thread(
+                    genai_caching.CachedContent.create,
+                    model=model,
+                    system_instruction=system_prompt,
+                    contents=[prefix],
+                    ttl=datetime.timedelta(seconds=ttl),
+                )
+            except Exception as e:
+                # e.g. below the model's minimum cacheable size; don't retry this prefix
+                print(f"⚠️ Gemini context cache unavailable for {model}: {e}")
+                self._remember(key, None)
+                return None
+            # Expire locally a little early so a request never races the server-side expiry
+            self._remember(key, (cached.name, time.monotonic() + ttl * 0.9))
+            return cached.name
+
+    def _remember(self, key: str, entry: Optional[tuple]):
+        self._context_caches[key] = entry
+        while len(self._context_caches) > GEMINI_MAX_CONTEXT_CACHES:
+            evicted, _ = self._context_caches.popitem(last=False)
+            self._cache_locks.pop(evicted, None)
+
+    async def _model(self, prompt: str, system_prompt: str, model: str, prefix: str):
+        # Use gemini-3-flash-preview by default if model is gpt-4o or other provider specific
+        if not model.startswith("gemini"):
+            model = self.default_model
+
+        cache_name = None
+        if prefix and settings.LLM_PREFIX_CACHE_ENABLED:
+            cache_name = await self._cached_content(model, system_prompt, prefix)
+        if cache_name:
+            return self.genai.GenerativeModel.from_cached_content(cached_content=cache_name), prompt, model
+        model_instance = self.genai.GenerativeModel(
+            model_name=model,
+            system_instruction=system_prompt
+        )
+        return model_instance, join_prompt(prefix, prompt), model
+
+    async def _generate(self, prompt: str, system_prompt: str, model: str, prefix: str) -> LLMResult:
+        model_instance, contents, model = await self._model(prompt, system_prompt, model, prefix)
+        response = await model_instance.generate_content_async(contents)
+        return self._to_result(response.text, response, model)
+
+    async def _generate_variants(self, prompt: str, system_prompt: str, model: str, prefix: str, count: int) -> LLMResult:
+        model_instance, contents, model = await self._model(variants_prompt(prompt, count), system_prompt, model, prefix)
+        # JSON mode keeps the answer parseable without fences or commentary
+        response = await model_instance.generate_content_async(
+            contents, generation_config={"response_mime_type": "application/json"}
+        )
+        return self._with_variants(self._to_result(response.text, response, model))
+
+    async def _stream(self, prompt: str, system_prompt: str, model: str, prefix: str) -> AsyncIterator[Union[str, LLMResult]]:
+        model_instance, contents, model = await self._model(prompt, system_prompt, model, prefix)
+        response = await model_instance.generate_content_async(contents, stream=True)
+        last = None
+        async for chunk in response:
+            last = chunk
+            if chunk.parts:
+                yield chunk.text
+        if last is not None:
+            # Usage metadata on the final chunk covers the whole response
+            yield self._to_result("", last, model)
+
+    async def _analyze_images(self, images: List[Tuple[bytes, str]], prompt: str) -> LLMResult:
+        # Raw bytes go up as inline blobs; no base64 or PIL round-trip on our side
+        model_instance = self.genai.GenerativeModel(self.vision_model)
+        parts = [prompt] + [{"mime_type": mime_type, "data": image} for image, mime_type in images]
+        response = await model_instance.generate_content_async(parts)
+        return self._to_result(response.text, response, self.vision_model)
+
+    def _to_result(self, text: str, response, model: str) -> LLMResult:
+        usage = getattr(response, "usage_metadata", None)
+        return LLMResult(
+            text=text,
+            provider=self.name,
+            model=model,
+            input_tokens=getattr(usage, "prompt_token_count", 0) or 0,
+            output_tokens=getattr(usage, "candidates_token_count", 0) or 0,
+            cached_input_tokens=getattr(usage, "cached_content_token_count", 0) or 0,
+        )
+
+
+def default_providers() -> dict:
+    return {
+        # Declaration order is the routing tie-break before any latency has been measured
+        "openai": OpenAIProvider(),
+        "google": GoogleProvider(),
+        "anthropic": AnthropicProvider(),
+    }
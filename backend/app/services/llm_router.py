@@ -0,0 +1,340 @@
+import asyncio
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+from app.core.config import settings
+from app.core.metrics import LLM_REQUEST_SECONDS, LLM_TOKENS_TOTAL
+from app.core.tracing import record_span, span
+from app.services.llm_providers import BaseProvider, LLMResult, record_usage
+
+AUTO = "auto"
+
+# Task classes are routed independently: a provider can be fast at text and slow at vision
+TASK_TEXT = "text"
+TASK_STREAM = "stream"
+TASK_VISION = "vision"
+
+
+class ProviderUnavailableError(RuntimeError):
+    pass
+
+
+@dataclass
+class Route:
+    provider: str
+    model: str
+    backend: BaseProvider
+
+
+class RouteStats:
+    """Rolling latency and error window for one task/provider/model."""
+
+    def __init__(self, window: int):
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+
+    def record(self, latency: float, ok: bool):
+        self.outcomes.append(ok)
+        if ok:
+            self.latencies.append(latency)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    @property
+    def error_rate(self) -> float:
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+    def score(self) -> float:
+        # Expected time to a successful answer; unmeasured routes score 0 so they get sampled
+        p50 = self.percentile(0.5) or 0.0
+        return p50 / max(0.1, 1.0 - self.error_rate)
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures, then lets a single probe through once the cooldown ends."""
+
+    def __init__(self, failure_threshold: int, cooldown: float):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+
+    @property
+    def ready(self) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open":
+            return time.monotonic() - self.opened_at >= self.cooldown
+        return not self._probing
+
+    def begin(self):
+        if self.state == "open" and self.ready:
+            self.state = "half_open"
+        if self.state == "half_open":
+            self._probing = True
+
+    def abandon(self):
+        self._probing = False
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probing = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                print(f"⚡ Circuit opened after {self.failures} failures")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+
+class LLMRouter:
+    """Picks provider backends per task class from live latency and error stats.
+
+    An explicitly requested provider is tried first while its breaker is closed;
+    the remaining healthy providers follow, fastest first. ``provider="auto"``
+    goes straight to the fastest healthy provider. With hedging enabled, a
+    request still running past its route's p95 is raced against the next
+    candidate and the loser is cancelled.
+    """
+
+    def __init__(
+        self,
+        providers: Dict[str, BaseProvider],
+        window: int = settings.LLM_ROUTER_WINDOW,
+        failure_threshold: int = settings.LLM_BREAKER_FAILURE_THRESHOLD,
+        cooldown: float = settings.LLM_BREAKER_COOLDOWN_SECONDS,
+        hedge: bool = settings.LLM_HEDGE_ENABLED,
+        hedge_min_samples: int = settings.LLM_HEDGE_MIN_SAMPLES
+    ):
+        self.window = window
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.hedge = hedge
+        self.hedge_min_samples = hedge_min_samples
+        self.providers = providers
+
+    @property
+    def providers(self) -> Dict[str, BaseProvider]:
+        return self._providers
+
+    @providers.setter
+    def providers(self, providers: Dict[str, BaseProvider]):
+        self._providers = providers
+        self._stats: Dict[tuple, RouteStats] = {}
+        self._breakers: Dict[tuple, CircuitBreaker] = {}
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def _route_stats(self, task: str, route: Route) -> RouteStats:
+        key = (task, route.provider, route.model)
+        if key not in self._stats:
+            self._stats[key] = RouteStats(self.window)
+        return self._stats[key]
+
+    def _breaker(self, route: Route) -> CircuitBreaker:
+        key = (route.provider, route.model)
+        if key not in self._breakers:
+            self._breakers[key] = CircuitBreaker(self.failure_threshold, self.cooldown)
+        return self._breakers[key]
+
+    def routes(self, task: str, provider: str = AUTO, model: str = "") -> List[Route]:
+        """Configured routes for a task: the requested provider first, then the rest by score."""
+        candidates = []
+        for name, backend in self.providers.items():
+            default_model = backend.vision_model if task == TASK_VISION else backend.default_model
+            if not backend.available or not default_model:
+                continue
+            # A model name only means something to the provider it was requested for
+            route_model = model if name == provider and model and task != TASK_VISION else default_model
+            candidates.append(Route(name, route_model, backend))
+
+        return sorted(
+            candidates,
+            key=lambda route: (route.provider != provider, self._route_stats(task, route).score())
+        )
+
+    def _require_routes(self, task: str, provider: str, model: str) -> List[Route]:
+        routes = self.routes(task, provider, model)
+        healthy = [route for route in routes if self._breaker(route).ready]
+        if not healthy:
+            if routes:
+                raise ProviderUnavailableError("All LLM providers are failing; retry after the circuit cooldown.")
+            raise ProviderUnavailableError("No LLM provider configured.")
+        return healthy
+
+    def _record(self, task: str, route: Route, latency: float, ok: bool):
+        self._route_stats(task, route).record(latency, ok)
+        LLM_REQUEST_SECONDS.observe(
+            latency, task=task, provider=route.provider, model=route.model, outcome="ok" if ok else "error"
+        )
+        breaker = self._breaker(route)
+        if ok:
+            breaker.record_success()
+        else:
+            breaker.record_failure()
+
+    def _hedge_after(self, task: str, route: Route) -> Optional[float]:
+        stats = self._route_stats(task, route)
+        if not self.hedge or len(stats.latencies) < self.hedge_min_samples:
+            return None
+        return stats.percentile(0.95)
+
+    async def _attempt(self, task: str, route: Route, call: Callable[[BaseProvider, str], Awaitable[Any]]):
+        breaker = self._breaker(route)
+        breaker.begin()
+        start = time.perf_counter()
+        try:
+            with span(f"llm.{task}", provider=route.provider, model=route.model):
+                result = await call(route.backend, route.model)
+        except asyncio.CancelledError:
+            # Losing a hedge race says nothing about the provider's health
+            breaker.abandon()
+            raise
+        except Exception:
+            self._record(task, route, time.perf_counter() - start, ok=False)
+            raise
+        self._record(task, route, time.perf_counter() - start, ok=True)
+        if isinstance(result, LLMResult):
+            self._count_tokens(route, result)
+        return result
+
+    def _count_tokens(self, route: Route, result: LLMResult):
+        for direction, tokens in (
+            ("input", result.input_tokens),
+            ("output", result.output_tokens),
+            ("cached_input", result.cached_input_tokens),
+            ("cache_write", result.cache_write_tokens),
+        ):
+            LLM_TOKENS_TOTAL.inc(tokens, provider=route.provider, model=route.model, direction=direction)
+        record_usage(result)
+
+    async def _next_delta(self, route: Route, stream: AsyncIterator) -> Optional[str]:
+        # Usage-only results from the provider are counted here and never reach the caller
+        async for item in stream:
+            if not isinstance(item, LLMResult):
+                return item
+            self._count_tokens(route, item)
+        return None
+
+    async def call(self, task: str, provider: str, model: str, call: Callable[[BaseProvider, str], Awaitable[Any]]):
+        """Run ``call(backend, model)`` on the best route, falling back (and hedging) across the rest."""
+        routes = self._require_routes(task, provider, model)
+        pending: Dict[asyncio.Future, tuple] = {}
+        error = None
+
+        def launch(route: Route):
+            pending[asyncio.ensure_future(self._attempt(task, route, call))] = (route, time.monotonic())
+
+        try:
+            while routes or pending:
+                if not pending:
+                    launch(routes.pop(0))
+
+                timeout = None
+                if routes and len(pending) == 1:
+                    (route, started), = pending.values()
+                    hedge_after = self._hedge_after(task, route)
+                    if hedge_after is not None:
+                        timeout = max(0.0, started + hedge_after - time.monotonic())
+
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Slower than this route's p95: race the next candidate against it
+                    self.hedges += 1
+                    launch(routes.pop(0))
+                    continue
+
+                for future in done:
+                    route, started = pending.pop(future)
+                    if future.exception() is None:
+                        if any(started > other for _, other in pending.values()):
+                            self.hedge_wins += 1
+                        return future.result()
+                    error = future.exception()
+                    print(f"⚠️ {route.backend.label} ({route.model}) failed, trying next provider: {error}")
+            raise error
+        finally:
+            for future in pending:
+                future.cancel()
+
+    async def stream(
+        self, provider: str, model: str, open_stream: Callable[[BaseProvider, str], AsyncIterator[str]]
+    ) -> AsyncIterator[str]:
+        """Stream from the best route; falls back only while nothing has been emitted yet."""
+        error = None
+        for route in self._require_routes(TASK_STREAM, provider, model):
+            breaker = self._breaker(route)
+            breaker.begin()
+            start = time.perf_counter()
+            stream = open_stream(route.backend, route.model)
+            try:
+                try:
+                    first = await self._next_delta(route, stream)
+                except asyncio.CancelledError:
+                    breaker.abandon()
+                    raise
+                except Exception as e:
+                    self._record(TASK_STREAM, route, time.perf_counter() - start, ok=False)
+                    print(f"⚠️ {route.backend.label} ({route.model}) failed, trying next provider: {e}")
+                    error = e
+                    continue
+
+                # Streams are ranked by time to first token
+                self._record(TASK_STREAM, route, time.perf_counter() - start, ok=True)
+                if first is not None:
+                    yield first
+                    try:
+                        async for delta in stream:
+                            if isinstance(delta, LLMResult):
+                                self._count_tokens(route, delta)
+                            else:
+                                yield delta
+                    except Exception:
+                        breaker.record_failure()
+                        raise
+                return
+            finally:
+                await stream.aclose()
+                # Recorded after the fact: a span made current inside a generator would leak into the consumer
+                record_span("llm.stream", start, provider=route.provider, model=route.model)
+        raise error
+
+    def collect_metrics(self) -> list:
+        circuits = [
+            ({"provider": provider, "model": model}, 1 if breaker.state == "open" else 0)
+            for (provider, model), breaker in self._breakers.items()
+        ]
+        return [
+            ("llm_circuit_open", "gauge", "1 while a provider/model circuit breaker is open.", circuits),
+            ("llm_hedged_requests_total", "counter", "Requests raced against a second provider.", [({}, self.hedges)]),
+            ("llm_hedge_wins_total", "counter", "Hedged requests won by the second provider.", [({}, self.hedge_wins)]),
+        ]
+
+    def snapshot(self) -> List[dict]:
+        rows = []
+        for (task, provider, model), stats in self._stats.items():
+            if not stats.outcomes:
+                continue
+            p50, p95 = stats.percentile(0.5), stats.percentile(0.95)
+            rows.append({
+                "task": task,
+                "provider": provider,
+                "model": model,
+                "samples": len(stats.outcomes),
+                "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+                "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+                "error_rate": round(stats.error_rate, 4),
+                "circuit": self._breakers[(provider, model)].state,
+            })
+        return rows
@@ -1,120 +1,264 @@
-from typing import Optional
-from openai import OpenAI
-from anthropic import Anthropic
-import google.generativeai as genai
+import asyncio
 import base64
-import io
-from PIL import Image
+from contextlib import aclosing
+from dataclasses import asdict
+from typing import AsyncIterator, List, Optional, Tuple, Union
 from app.core.config import settings
+from app.core.metrics import registry
+from app.services.cache_service import MemoryCacheBackend, SQLiteCacheBackend, ResponseCache
+from app.services.llm_providers import LLMResult, default_providers, join_prompt, prefix_key
+from app.services.llm_router import AUTO, TASK_STREAM, TASK_TEXT, TASK_VISION, LLMRouter, ProviderUnavailableError
+from app.services.single_flight import SingleFlight
+
+def build_response_cache() -> Optional[ResponseCache]:
+    if not settings.LLM_CACHE_ENABLED:
+        return None
+    if settings.LLM_CACHE_BACKEND == "sqlite":
+        backend = SQLiteCacheBackend(settings.LLM_CACHE_PATH, settings.LLM_CACHE_MAX_ENTRIES)
+    else:
+        backend = MemoryCacheBackend(settings.LLM_CACHE_MAX_ENTRIES)
+
+    embed = None
+    if settings.LLM_CACHE_SEMANTIC_THRESHOLD > 0:
+        async def embed(text: str):
+            from app.services.rag_service import rag_service
+            return await rag_service.embeddings.aembed_query(text)
+
+    return ResponseCache(
+        backend,
+        ttl=settings.LLM_CACHE_TTL_SECONDS,
+        embed=embed,
+        semantic_threshold=settings.LLM_CACHE_SEMANTIC_THRESHOLD
+    )
 
 class LLMService:
-    def __init__(self):
-        self.openai_client = OpenAI(api_key=settings.OPENAI_API_KEY) if settings.OPENAI_API_KEY else None
-        self.anthropic_client = Anthropic(api_key=settings.ANTHROPIC_API_KEY) if settings.ANTHROPIC_API_KEY else None
-        
-        self.google_available = False
-        if settings.GOOGLE_API_KEY:
-            genai.configure(api_key=settings.GOOGLE_API_KEY)
-            self.google_available = True
+    def __init__(self, providers: dict = None, cache: Optional[ResponseCache] = None):
+        self.router = LLMRouter(providers if providers is not None else default_providers())
+        self.cache = cache if cache is not None else build_response_cache()
+        self.flights = SingleFlight()
+
+    @property
+    def providers(self) -> dict:
+        return self.router.providers
+
+    @providers.setter
+    def providers(self, providers: dict):
+        self.router.providers = providers
+
+    def _check(self, provider: str, task: str) -> Optional[str]:
+        if provider != AUTO and provider not in self.providers:
+            return "Unsupported provider."
+        if not self.router.routes(task):
+            backend = self.providers.get(provider)
+            return f"{backend.label} API key not configured." if backend else "No LLM provider configured."
+        return None
+
+    async def generate(
+        self,
+        prompt: str,
+        system_prompt: str = "You are a helpful social media assistant.",
+        model: str = "gpt-4o",
+        provider: str = "openai",
+        use_cache: bool = True,
+        prefix: str = ""
+    ) -> LLMResult:
+        """``prefix`` (platform guide, brand context) is sent ahead of ``prompt`` so providers can reuse their cached prefix."""
+        error = self._check(provider, TASK_TEXT)
+        if error:
+            return LLMResult(text=error, provider=provider, model=model)
+
+        if use_cache and self.cache is not None:
+            cached = await self.cache.get(provider, model, system_prompt, join_prompt(prefix, prompt))
+            if cached is not None:
+                return LLMResult(**{**cached, "cached": True})
+
+        call = lambda: self._generate(prompt, system_prompt, model, provider, use_cache, prefix)
+        if not (use_cache and settings.SINGLE_FLIGHT_ENABLED):
+            # Bypassing the cache asks for a fresh completion, so it is not shared with a concurrent caller either
+            return await call()
+        result, _ = await self.flights.do(prefix_key(TASK_TEXT, provider, model, system_prompt, prefix, prompt), call)
+        return result
+
+    async def _generate(
+        self, prompt: str, system_prompt: str, model: str, provider: str, use_cache: bool, prefix: str
+    ) -> LLMResult:
+        result = await self.router.call(
+            TASK_TEXT, provider, model,
+            lambda backend, route_model: backend.generate(prompt, system_prompt, route_model, prefix)
+        )
+        if use_cache and self.cache is not None:
+            await self.cache.set(provider, model, system_prompt, join_prompt(prefix, prompt), asdict(result))
+        return result
+
+    async def generate_variants(
+        self,
+        prompt: str,
+        count: int,
+        system_prompt: str = "You are a helpful social media assistant.",
+        model: str = "gpt-4o",
+        provider: str = "openai",
+        use_cache: bool = True,
+        prefix: str = ""
+    ) -> LLMResult:
+        """``count`` alternative completions in ``variants``, from one provider request where possible.
+
+        Whatever the provider doesn't return in that request (no JSON it can
+        parse, fewer items than asked) is filled by concurrent single generations.
+        """
+        error = self._check(provider, TASK_TEXT)
+        if error:
+            return LLMResult(text=error, provider=provider, model=model, variants=[error])
+
+        # The count is part of the request, so it is part of the cache key too
+        cache_prompt = join_prompt(prefix, prompt) + f"\x00variants={count}"
+        if use_cache and self.cache is not None:
+            cached = await self.cache.get(provider, model, system_prompt, cache_prompt)
+            # A semantic hit may be a plain generation with no variants stored
+            if cached is not None and len(cached.get("variants", [])) >= count:
+                return LLMResult(**{**cached, "cached": True})
+
+        call = lambda: self._generate_variants(prompt, count, system_prompt, model, provider, use_cache, prefix, cache_prompt)
+        if not (use_cache and settings.SINGLE_FLIGHT_ENABLED):
+            return await call()
+        key = prefix_key(TASK_TEXT, provider, model, system_prompt, prefix, prompt, f"variants={count}")
+        result, _ = await self.flights.do(key, call)
+        return result
+
+    async def _generate_variants(
+        self, prompt: str, count: int, system_prompt: str, model: str, provider: str,
+        use_cache: bool, prefix: str, cache_prompt: str
+    ) -> LLMResult:
+        result = await self.router.call(
+            TASK_TEXT, provider, model,
+            lambda backend, route_model: backend.generate_variants(prompt, system_prompt, route_model, prefix, count)
+        )
+        variants = result.variants[:count]
+        missing = count - len(variants)
+        if missing:
+            print(f"⚠️ Provider returned {len(variants)} of {count} variants; generating {missing} separately")
+            extra = await asyncio.gather(*(
+                self.router.call(
+                    TASK_TEXT, provider, model,
+                    lambda backend, route_model: backend.generate(prompt, system_prompt, route_model, prefix)
+                )
+                for _ in range(missing)
+            ))
+            variants += [item.text for item in extra]
+        result.variants = variants
+        result.text = variants[0]
+        if use_cache and self.cache is not None:
+            await self.cache.set(provider, model, system_prompt, cache_prompt, asdict(result))
+        return result
+
+    async def stream_text(
+        self,
+        prompt: str,
+        system_prompt: str = "You are a helpful social media assistant.",
+        model: str = "gpt-4o",
+        provider: str = "openai",
+        use_cache: bool = True,
+        prefix: str = ""
+    ) -> AsyncIterator[str]:
+        error = self._check(provider, TASK_STREAM)
+        if error:
+            yield error
+            return
+
+        if use_cache and self.cache is not None:
+            cached = await self.cache.get(provider, model, system_prompt, join_prompt(prefix, prompt))
+            if cached is not None:
+                yield cached["text"]
+                return
+
+        if use_cache and settings.SINGLE_FLIGHT_ENABLED:
+            # Late joiners replay the deltas already streamed, then follow the live stream
+            deltas = self.flights.stream(
+                prefix_key(TASK_STREAM, provider, model, system_prompt, prefix, prompt),
+                lambda: self._stream(prompt, system_prompt, model, provider, use_cache, prefix)
+            )
+        else:
+            deltas = self._stream(prompt, system_prompt, model, provider, use_cache, prefix)
+        # Closed as soon as this caller stops reading, so a shared stream knows it has one subscriber fewer
+        async with aclosing(deltas):
+            async for delta in deltas:
+                yield delta
+
+    async def _stream(
+        self, prompt: str, system_prompt: str, model: str, provider: str, use_cache: bool, prefix: str
+    ) -> AsyncIterator[str]:
+        parts = []
+        deltas = self.router.stream(
+            provider, model,
+            lambda backend, route_model: backend.stream(prompt, system_prompt, route_model, prefix)
+        )
+        async for delta in deltas:
+            parts.append(delta)
+            yield delta
+        if use_cache and self.cache is not None:
+            # Only completed streams are cached; a disconnected client leaves no partial entry
+            result = LLMResult(text="".join(parts), provider=provider, model=model)
+            await self.cache.set(provider, model, system_prompt, join_prompt(prefix, prompt), asdict(result))
 
     async def generate_text(
         self, 
         prompt: str, 
         system_prompt: str = "You are a helpful social media assistant.",
         model: str = "gpt-4o",
-        provider: str = "openai"
+        provider: str = "openai",
+        use_cache: bool = True,
+        prefix: str = ""
     ) -> str:
-        # Auto-fallback logic
-        if provider == "openai" and not self.openai_client:
-            if self.google_available:
-                provider = "google"
-                model = "gemini-3-flash-preview"
-            elif self.anthropic_client:
-                provider = "anthropic"
-                model = "claude-3-sonnet-20240229"
-
-        if provider == "openai":
-            if not self.openai_client:
-                return "OpenAI API key not configured."
-            
-            response = self.openai_client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": prompt}
-                ]
-            )
-            return response.choices[0].message.content
-        
-        elif provider == "anthropic":
-            if not self.anthropic_client:
-                return "Anthropic API key not configured."
-            
-            response = self.anthropic_client.messages.create(
-                model=model,
-                max_tokens=1024,
-                system=system_prompt,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ]
-            )
-            return response.content[0].text
-            
-        elif provider == "google":
-            if not self.google_available:
-                return "Google API key not configured."
-            
-            # Use gemini-3-flash-preview by default if model is gpt-4o or other provider specific
-            if not model.startswith("gemini"):
-                model = "gemini-3-flash-preview"
-                
-            model_instance = genai.GenerativeModel(
-                model_name=model,
-                system_instruction=system_prompt
-            )
-            response = model_instance.generate_content(prompt)
-            return response.text
-        
-        return "Unsupported provider."
-
-    async def analyze_image(self, image_url: str, prompt: str = "請描述這張圖片的內容、氛圍、顏色以及適合的社群媒體主題。") -> str:
-        # Try OpenAI first
-        if self.openai_client:
-            response = self.openai_client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": prompt},
-                            {
-                                "type": "image_url",
-                                "image_url": {"url": image_url},
-                            },
-                        ],
-                    }
-                ],
-                max_tokens=500,
-            )
-            return response.choices[0].message.content
-            
-        # Fallback to Google
-        if self.google_available:
-            try:
-                # Parse data URI
-                if image_url.startswith("data:image"):
-                    header, encoded = image_url.split(",", 1)
-                    data = base64.b64decode(encoded)
-                    image = Image.open(io.BytesIO(data))
-                    
-                    model = genai.GenerativeModel('gemini-3-flash-preview')
-                    response = model.generate_content([prompt, image])
-                    return response.text
-                else:
-                    return "Image URL format not supported for Google provider (only data URI)."
-            except Exception as e:
-                return f"Google Vision analysis failed: {str(e)}"
-
-        return "No Vision API provider configured (OpenAI or Google)."
+        result = await self.generate(
+            prompt, system_prompt=system_prompt, model=model, provider=provider, use_cache=use_cache, prefix=prefix
+        )
+        return result.text
+
+    async def analyze_image(
+        self,
+        image: Union[bytes, str],
+        prompt: str = "請描述這張圖片的內容、氛圍、顏色以及適合的社群媒體主題。",
+        mime_type: str = "image/jpeg",
+        provider: str = AUTO
+    ) -> str:
+        """Raises instead of returning an error text, so callers never mistake one for an analysis."""
+        if isinstance(image, str):
+            # Accept a data URI for callers that still build one
+            if not image.startswith("data:image"):
+                raise ValueError("Image URL format not supported (only data URI).")
+            header, encoded = image.split(",", 1)
+            mime_type = header[len("data:"):].split(";")[0]
+            image = base64.b64decode(encoded)
+
+        if not self.router.routes(TASK_VISION):
+            raise ProviderUnavailableError("No Vision API provider configured (OpenAI or Google).")
+
+        result = await self.router.call(
+            TASK_VISION, provider, "",
+            lambda backend, route_model: backend.analyze_image(image, mime_type, prompt)
+        )
+        return result.text
+
+    async def analyze_images(self, images: List[Tuple[bytes, str]], prompt: str, provider: str = AUTO) -> str:
+        """Several ``(bytes, mime_type)`` images in one multimodal request."""
+        if not self.router.routes(TASK_VISION):
+            raise ProviderUnavailableError("No Vision API provider configured (OpenAI or Google).")
+
+        result = await self.router.call(
+            TASK_VISION, provider, "",
+            lambda backend, route_model: backend.analyze_images(images, prompt)
+        )
+        return result.text
+
+    def warm_up(self):
+        for backend in self.providers.values():
+            if backend.available:
+                backend.warm_up()
+
+    async def aclose(self):
+        for backend in self.providers.values():
+            await backend.aclose()
 
 llm_service = LLMService()
+registry.register_cache("llm_responses", lambda: llm_service.cache.stats if llm_service.cache else None)
+registry.collector(lambda: llm_service.router.collect_metrics())
+registry.register_single_flight("llm", lambda: llm_service.flights.stats)
@@ -1,40 +1,479 @@
+import asyncio
+import hashlib
 import os
-from typing import List, Dict, Any
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from langchain_chroma import Chroma
+import re
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, List, Dict, Any, Optional
 from app.core.config import settings
+from app.core.metrics import CHROMA_OPERATION_SECONDS, RETRIEVAL_SECONDS, registry
+from app.core.tracing import span
+from app.services.cache_service import MemoryCacheBackend, SQLiteCacheBackend, normalize_text
+from app.services.document_registry import DocumentRegistry
+from app.services.embedding_service import CachedEmbeddings, content_hash
+from app.services.keyword_index import KeywordIndex, is_lookup_query
+from app.services.single_flight import SingleFlight
+
+if TYPE_CHECKING:
+    from langchain_chroma import Chroma
+
+DEFAULT_COLLECTION = "brand_knowledge"
+# Compaction builds the new collection under STAGING and parks the old one under RETIRED until the swap is done
+STAGING_SUFFIX = "-compact"
+RETIRED_SUFFIX = "-retired"
+EMBEDDING_MODEL = "models/text-embedding-004"
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[str]:
+    """Merge ranked lists by summed 1 / (k + rank); robust to BM25 and cosine scores living on different scales."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
 
 class RAGService:
-    def __init__(self):
-        # Use Google Embeddings
-        self.embeddings = GoogleGenerativeAIEmbeddings(
-            model="models/text-embedding-004",
-            google_api_key=settings.GOOGLE_API_KEY
-        )
-        
-        # Use Local ChromaDB
-        self.persist_directory = "./chroma_db"
-        self.vector_store = Chroma(
-            collection_name="brand_knowledge",
-            embedding_function=self.embeddings,
-            persist_directory=self.persist_directory
+    def __init__(
+        self,
+        embeddings=None,
+        persist_directory: Optional[str] = None,
+        embedding_cache_path: Optional[str] = None,
+        keyword_index_path: Optional[str] = None,
+        document_registry_path: Optional[str] = None
+    ):
+        # Chroma, the embeddings client and their SDKs take seconds to import and open,
+        # so both are built on first use (or by warm_up) rather than here
+        self._base_embeddings = embeddings
+        self._embedding_cache_path = embedding_cache_path or settings.EMBEDDING_CACHE_PATH
+        self._embeddings = None
+        self.persist_directory = persist_directory or settings.CHROMA_PERSIST_DIRECTORY
+        self._client = None
+        self.max_open_collections = settings.CHROMA_MAX_OPEN_COLLECTIONS
+        self._stores: "OrderedDict[str, Chroma]" = OrderedDict()
+        self._recovered = set()
+
+        # Local BM25 index next to Chroma; keyword and exact hits never need an embedding call.
+        # A store opened at an explicit directory keeps its index inside it, so the two can't drift apart
+        if keyword_index_path is None:
+            keyword_index_path = (
+                os.path.join(persist_directory, "keyword_index.sqlite3") if persist_directory else settings.KEYWORD_INDEX_PATH
+            )
+        self.keyword_index = KeywordIndex(keyword_index_path)
+        self._keyword_ready = set()
+
+        # Document ids, versions and which chunks each version uses; decides when a chunk can go
+        if document_registry_path is None:
+            document_registry_path = (
+                os.path.join(persist_directory, "documents.sqlite3") if persist_directory else settings.DOCUMENT_REGISTRY_PATH
+            )
+        self.documents = DocumentRegistry(document_registry_path)
+        # Held while checking which chunks exist and adding them, and while removing unreferenced ones
+        self._write_locks: Dict[str, asyncio.Lock] = {}
+
+        # Keys carry a per-collection generation; bumping it on insert retires every cached result and flight at once
+        self.result_cache = MemoryCacheBackend(settings.RETRIEVAL_CACHE_MAX_ENTRIES) if settings.RETRIEVAL_CACHE_ENABLED else None
+        self._generations: Dict[str, int] = {}
+        self.flights = SingleFlight()
+
+    @property
+    def embeddings(self):
+        if self._embeddings is None:
+            # Use Google Embeddings
+            embeddings = self._base_embeddings
+            if embeddings is None:
+                from langchain_google_genai import GoogleGenerativeAIEmbeddings
+                embeddings = GoogleGenerativeAIEmbeddings(
+                    model=EMBEDDING_MODEL,
+                    google_api_key=settings.GOOGLE_API_KEY
+                )
+            if settings.EMBEDDING_CACHE_ENABLED:
+                embeddings = CachedEmbeddings(
+                    embeddings,
+                    SQLiteCacheBackend(self._embedding_cache_path, settings.EMBEDDING_CACHE_MAX_ENTRIES),
+                    namespace=EMBEDDING_MODEL,
+                    batch_size=settings.EMBEDDING_BATCH_SIZE,
+                    max_concurrency=settings.EMBEDDING_MAX_CONCURRENCY,
+                    query_cache_entries=settings.QUERY_EMBEDDING_CACHE_MAX_ENTRIES
+                )
+            self._embeddings = embeddings
+        return self._embeddings
+
+    @property
+    def client(self):
+        if self._client is None:
+            import chromadb
+            # Use Local ChromaDB; one persistent client shared by every collection
+            self._client = chromadb.PersistentClient(path=self.persist_directory)
+        return self._client
+
+    def warm_up(self):
+        self.embeddings
+        self.get_store(DEFAULT_COLLECTION)
+
+    @staticmethod
+    def collection_for(brand_id: Optional[str] = None) -> str:
+        if not brand_id:
+            return DEFAULT_COLLECTION
+        # Chroma names allow [a-zA-Z0-9._-] and must start and end with an alphanumeric
+        if re.fullmatch(r"[A-Za-z0-9][A-Za-z0-9_-]{0,62}[A-Za-z0-9]|[A-Za-z0-9]", brand_id):
+            return f"brand_{brand_id}"
+        return f"brand_{hashlib.sha1(brand_id.encode('utf-8')).hexdigest()[:16]}"
+
+    def get_store(self, collection_name: str) -> "Chroma":
+        store = self._stores.get(collection_name)
+        if store is not None:
+            self._stores.move_to_end(collection_name)
+            return store
+
+        if collection_name not in self._recovered:
+            # Before Chroma would create an empty collection in place of one a compaction left mid-swap
+            self._recover_compaction(collection_name)
+        from langchain_chroma import Chroma
+        # Chroma handles collection creation automatically
+        store = Chroma(
+            client=self.client,
+            collection_name=collection_name,
+            embedding_function=self.embeddings
         )
+        self._stores[collection_name] = store
+        while len(self._stores) > self.max_open_collections:
+            self._stores.popitem(last=False)
+        return store
+
+    def _existing_hashes(self, store: "Chroma", hashes: List[str]) -> set:
+        existing = set()
+        for start in range(0, len(hashes), 500):
+            with span("chroma.get"), CHROMA_OPERATION_SECONDS.time(operation="get"):
+                found = store.get(where={"content_hash": {"$in": hashes[start:start + 500]}}, include=["metadatas"])
+            existing.update(meta["content_hash"] for meta in found["metadatas"] if meta)
+        return existing
+
+    def _ensure_keyword_index(self, collection_name: str):
+        if collection_name in self._keyword_ready:
+            return
+        if not self.keyword_index.has_collection(collection_name):
+            # Collections written before the keyword index existed are indexed once from Chroma
+            found = self.get_store(collection_name).get(include=["documents", "metadatas"])
+            self.keyword_index.add(collection_name, [
+                ((metadata or {}).get("content_hash") or content_hash(text), text)
+                for text, metadata in zip(found["documents"], found["metadatas"])
+            ])
+        self._keyword_ready.add(collection_name)
+
+    def _index_keywords(self, collection_name: str, documents: List[tuple]):
+        self._ensure_keyword_index(collection_name)
+        self.keyword_index.add(collection_name, documents)
 
-    async def add_documents(self, collection_name: str, texts: List[str], metadatas: List[Dict[str, Any]]):
+    def _keyword_search(self, collection_name: str, query: str, limit: int) -> List[Dict[str, Any]]:
+        self._ensure_keyword_index(collection_name)
+        return self.keyword_index.search(collection_name, query, limit)
+
+    def _result_key(self, collection_name: str, query: str, limit: int, mode: str) -> str:
+        digest = hashlib.sha1(normalize_text(query).encode("utf-8")).hexdigest()
+        return f"{collection_name}:{self._generations.get(collection_name, 0)}:{mode}:{limit}:{digest}"
+
+    def _invalidate_results(self, collection_name: str):
+        # Bumped even without a result cache: single-flight keys carry the generation too
+        self._generations[collection_name] = self._generations.get(collection_name, 0) + 1
+        if self.result_cache is not None:
+            self.result_cache.stats.invalidations += 1
+
+    async def add_documents(
+        self,
+        collection_name: str,
+        texts: List[str],
+        metadatas: List[Dict[str, Any]],
+        doc_id: Optional[str] = None,
+        version: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """Store new chunks; with ``doc_id`` every chunk, stored now or already, is recorded under that version."""
         try:
-            # Chroma handles collection creation automatically
-            self.vector_store.add_texts(texts=texts, metadatas=metadatas)
-            return True
+            store = self.get_store(collection_name)
+            hashes = [content_hash(text) for text in texts]
+            if doc_id is not None:
+                # Referenced before the existence check, so a concurrent cleanup keeps shared chunks
+                await asyncio.to_thread(self.documents.add_refs, collection_name, doc_id, version, hashes)
+
+            async with self._write_lock(collection_name):
+                # Skip chunks already stored in this collection, including repeats within the upload
+                seen = await asyncio.to_thread(self._existing_hashes, store, list(set(hashes)))
+                new_texts, new_metadatas = [], []
+                for text, metadata, digest in zip(texts, metadatas, hashes):
+                    if digest in seen:
+                        continue
+                    seen.add(digest)
+                    new_texts.append(text)
+                    new_metadata = {**metadata, "content_hash": digest}
+                    if doc_id is not None:
+                        # The first document to store a chunk; later versions and documents may share it
+                        new_metadata.update(doc_id=doc_id, version=version)
+                    new_metadatas.append(new_metadata)
+
+                if new_texts:
+                    try:
+                        # Keyword index first: it is idempotent, so a failed Chroma write can simply be retried
+                        await asyncio.to_thread(
+                            self._index_keywords, collection_name,
+                            [(metadata["content_hash"], text) for text, metadata in zip(new_texts, new_metadatas)]
+                        )
+                        # Embedding runs batched and cached inside the store's embedding function
+                        with span("chroma.add", collection=collection_name, chunks=len(new_texts)), \
+                                CHROMA_OPERATION_SECONDS.time(operation="add"):
+                            await store.aadd_texts(
+                                texts=new_texts, metadatas=new_metadatas,
+                                ids=[metadata["content_hash"] for metadata in new_metadatas]
+                            )
+                    finally:
+                        # Even a partial write may have changed what a query returns
+                        self._invalidate_results(collection_name)
+            return {"added": len(new_texts), "skipped": len(texts) - len(new_texts)}
         except Exception as e:
             print(f"Error adding documents: {e}")
-            return False
+            return {"added": 0, "skipped": 0, "error": str(e)}
 
-    async def query_similar(self, collection_name: str, query: str, limit: int = 3) -> List[str]:
+    def _write_lock(self, collection_name: str) -> asyncio.Lock:
+        return self._write_locks.setdefault(collection_name, asyncio.Lock())
+
+    def _delete_chunks(self, store: "Chroma", collection_name: str, hashes: List[str]):
+        for start in range(0, len(hashes), 500):
+            batch = hashes[start:start + 500]
+            with span("chroma.delete"), CHROMA_OPERATION_SECONDS.time(operation="delete"):
+                # By metadata: chunks stored before ids were content hashes have random ids
+                store.delete(where={"content_hash": {"$in": batch}})
+            self.keyword_index.remove(collection_name, batch)
+
+    async def _remove_unreferenced(self, collection_name: str, hashes: List[str]) -> int:
+        """Delete the chunks among ``hashes`` that no live document version uses any more."""
+        if not hashes:
+            return 0
+        async with self._write_lock(collection_name):
+            garbage = await asyncio.to_thread(self.documents.unreferenced, collection_name, hashes)
+            if garbage:
+                try:
+                    await asyncio.to_thread(self._delete_chunks, self.get_store(collection_name), collection_name, garbage)
+                finally:
+                    self._invalidate_results(collection_name)
+        return len(garbage)
+
+    async def commit_document(self, collection_name: str, doc_id: str, version: int, source: str) -> int:
+        """Make a fully ingested version current and remove the chunks only older versions used."""
+        dropped = await asyncio.to_thread(self.documents.commit, collection_name, doc_id, version, source)
+        return await self._remove_unreferenced(collection_name, dropped)
+
+    async def abandon_document(self, collection_name: str, doc_id: str, version: int) -> int:
+        dropped = await asyncio.to_thread(self.documents.abandon, collection_name, doc_id, version)
+        return await self._remove_unreferenced(collection_name, dropped)
+
+    async def delete_document(self, collection_name: str, doc_id: str) -> Optional[int]:
+        """Remove a document's chunks unless another document shares them; None if it doesn't exist."""
+        dropped = await asyncio.to_thread(self.documents.delete, collection_name, doc_id)
+        if dropped is None:
+            return None
+        return await self._remove_unreferenced(collection_name, dropped)
+
+    def list_documents(self, collection_name: str) -> List[Dict[str, Any]]:
+        return self.documents.list(collection_name)
+
+    def compact(self, collection_name: str) -> Dict[str, Any]:
+        """Rebuild a collection with only live chunks. Offline: nothing else may use the store meanwhile.
+
+        Keeps chunks of current document versions, plus chunks stored before
+        documents had ids unless their source has since been uploaded with one;
+        those are registered as version 1 of a document named after the source.
+        Stored embeddings are copied, so nothing is re-embedded. The new
+        collection replaces the old one, which leaves no deleted entries
+        behind in its HNSW index, and the keyword index is rebuilt to match.
+        """
+        self._recover_compaction(collection_name)
+        collection = self._get_collection(collection_name)
+        if collection is None:
+            return {"collection": collection_name, "chunks_before": 0, "chunks_after": 0, "adopted": {}}
+
+        live = self.documents.live_hashes(collection_name)
+        registered = self.documents.registered_sources(collection_name)
+        kept: Dict[str, tuple] = {}
+        legacy: Dict[str, List[str]] = {}
+        total = 0
+        for offset in range(0, collection.count(), 1000):
+            page = collection.get(limit=1000, offset=offset, include=["documents", "metadatas", "embeddings"])
+            for text, metadata, embedding in zip(page["documents"], page["metadatas"], page["embeddings"]):
+                total += 1
+                metadata = dict(metadata or {})
+                digest = metadata.setdefault("content_hash", content_hash(text))
+                if digest in kept:
+                    continue
+                if digest not in live:
+                    source = metadata.get("source", "")
+                    if "doc_id" in metadata or source in registered:
+                        # Superseded or deleted version, or a pre-versioning copy of a re-uploaded source
+                        continue
+                    legacy.setdefault(source, []).append(digest)
+                kept[digest] = (text, metadata, embedding)
+
+        adopted = {}
+        for source, hashes in legacy.items():
+            if source and self.documents.adopt(collection_name, source, source, hashes):
+                adopted[source] = len(hashes)
+
+        staging = self.client.create_collection(collection_name + STAGING_SUFFIX, metadata=collection.metadata)
+        items = list(kept.items())
+        for start in range(0, len(items), 1000):
+            batch = items[start:start + 1000]
+            staging.add(
+                ids=[digest for digest, _ in batch],
+                documents=[text for _, (text, _, _) in batch],
+                metadatas=[metadata for _, (_, metadata, _) in batch],
+                embeddings=[embedding for _, (_, _, embedding) in batch],
+            )
+        # Renames only, so a crash at any point leaves a complete copy that _recover_compaction can find
+        collection.modify(name=collection_name + RETIRED_SUFFIX)
+        staging.modify(name=collection_name)
+        self.client.delete_collection(collection_name + RETIRED_SUFFIX)
+        self._stores.pop(collection_name, None)
+
+        self.keyword_index.drop(collection_name)
+        self.keyword_index.add(collection_name, [(digest, text) for digest, (text, _, _) in items])
+        self._keyword_ready.add(collection_name)
+        self._invalidate_results(collection_name)
+        return {"collection": collection_name, "chunks_before": total, "chunks_after": len(items), "adopted": adopted}
+
+    def _get_collection(self, name: str):
+        from chromadb.errors import NotFoundError
         try:
-            results = self.vector_store.similarity_search(query, k=limit)
-            return [doc.page_content for doc in results]
+            return self.client.get_collection(name)
+        except (NotFoundError, ValueError):
+            return None
+
+    def _recover_compaction(self, collection_name: str):
+        """Finish or undo a compaction of ``collection_name`` that stopped part-way."""
+        self._recovered.add(collection_name)
+        staging = self._get_collection(collection_name + STAGING_SUFFIX)
+        retired = self._get_collection(collection_name + RETIRED_SUFFIX)
+        if retired is None:
+            if staging is not None:
+                # Stopped while building the new collection; the live one was never touched
+                self.client.delete_collection(staging.name)
+            return
+        live = self._get_collection(collection_name)
+        if live is not None and staging is not None:
+            print(f"⚠️ {collection_name} has both {staging.name} and {retired.name} left from a compaction; leaving them for manual review")
+            return
+        if live is None:
+            # Stopped between the two renames. The staging copy was complete before the old one was
+            # moved aside; without it, the old collection goes back
+            (staging or retired).modify(name=collection_name)
+            print(f"♻️ Restored {collection_name} from an interrupted compaction")
+        if live is not None or staging is not None:
+            self.client.delete_collection(retired.name)
+        # The keyword index may still describe the other copy; it is rebuilt from Chroma on next use
+        self.keyword_index.drop(collection_name)
+        self._keyword_ready.discard(collection_name)
+        self._stores.pop(collection_name, None)
+        self._invalidate_results(collection_name)
+
+    def vacuum(self):
+        """Give the space of removed chunks back to the filesystem (offline, after ``compact``)."""
+        self.keyword_index.vacuum()
+        path = os.path.join(self.persist_directory, "chroma.sqlite3")
+        if os.path.exists(path):
+            # A separate connection; Chroma's own is idle while nothing else uses the store
+            conn = sqlite3.connect(path)
+            try:
+                conn.execute("VACUUM")
+            finally:
+                conn.close()
+
+    async def search(self, collection_name: str, query: str, limit: int = 3, mode: Optional[str] = None) -> Dict[str, Any]:
+        """Retrieve brand knowledge, reporting which path ran and per-stage latency.
+
+        ``hybrid`` first consults the keyword index: when at least ``limit`` chunks
+        contain the query verbatim, or any do and the query is a product code or
+        SKU, those verbatim hits are returned without embedding the query.
+        Otherwise keyword and vector rankings are merged with reciprocal rank fusion.
+        """
+        mode = mode or settings.RETRIEVAL_MODE
+        start = time.perf_counter()
+        key = self._result_key(collection_name, query, limit, mode)
+        if self.result_cache is not None:
+            cached = self.result_cache.get(key)
+            if cached is not None:
+                self.result_cache.stats.hits += 1
+                elapsed = time.perf_counter() - start
+                RETRIEVAL_SECONDS.observe(elapsed, mode=mode, path="cache")
+                return {
+                    **cached, "cached": True, "embedding_skipped": True,
+                    "timings_ms": {"total_ms": round(elapsed * 1000, 2)}
+                }
+            self.result_cache.stats.misses += 1
+
+        cache_key = key if self.result_cache is not None else None
+        if not settings.SINGLE_FLIGHT_ENABLED:
+            return await self._search(collection_name, query, limit, mode, cache_key)
+        # The key carries the collection generation, so a search started after new documents never joins an older one
+        result, shared = await self.flights.do(key, lambda: self._search(collection_name, query, limit, mode, cache_key))
+        if not shared:
+            return result
+        RETRIEVAL_SECONDS.observe(time.perf_counter() - start, mode=mode, path="coalesced")
+        return {**result, "coalesced": True}
+
+    async def _search(self, collection_name: str, query: str, limit: int, mode: str, cache_key: Optional[str]) -> Dict[str, Any]:
+        start = time.perf_counter()
+        timings, results, path = {}, [], mode
+        candidates = max(limit * 4, 10)
+        keyword_texts = []
+        try:
+            if mode in ("keyword", "hybrid"):
+                stage = time.perf_counter()
+                with span("keyword.search", collection=collection_name):
+                    hits = await asyncio.to_thread(self._keyword_search, collection_name, query, candidates)
+                timings["keyword_ms"] = round((time.perf_counter() - stage) * 1000, 2)
+                # Verbatim matches outrank partial term overlap
+                hits.sort(key=lambda hit: not hit["exact"])
+                keyword_texts = [hit["text"] for hit in hits]
+                exact = [hit["text"] for hit in hits if hit["exact"]]
+                if mode == "keyword":
+                    results = keyword_texts[:limit]
+                elif len(exact) >= limit or (exact and is_lookup_query(query)):
+                    # Partial term overlap never skips vector search; only verbatim hits are returned
+                    results, path = exact[:limit], "exact"
+
+            if mode == "vector" or (mode == "hybrid" and path != "exact"):
+                stage = time.perf_counter()
+                store = self.get_store(collection_name)
+                with span("chroma.query", collection=collection_name), CHROMA_OPERATION_SECONDS.time(operation="query"):
+                    docs = await store.asimilarity_search(query, k=limit if mode == "vector" else candidates)
+                timings["vector_ms"] = round((time.perf_counter() - stage) * 1000, 2)
+                vector_texts = [doc.page_content for doc in docs]
+                if mode == "vector":
+                    results = vector_texts
+                else:
+                    results, path = reciprocal_rank_fusion([keyword_texts, vector_texts])[:limit], "fused"
         except Exception as e:
             print(f"Error querying documents: {e}")
-            return []
+            # Degraded answers are never cached
+            cache_key = None
+            if keyword_texts and not results:
+                # Vector search is down; local keyword hits are better than nothing
+                results, path = keyword_texts[:limit], "keyword_fallback"
+
+        elapsed = time.perf_counter() - start
+        RETRIEVAL_SECONDS.observe(elapsed, mode=mode, path=path)
+        timings["total_ms"] = round(elapsed * 1000, 2)
+        if cache_key is not None:
+            self.result_cache.set(cache_key, {"results": results, "mode": mode, "path": path}, settings.RETRIEVAL_CACHE_TTL_SECONDS)
+        return {
+            "results": results, "mode": mode, "path": path, "cached": False,
+            "embedding_skipped": "vector_ms" not in timings, "timings_ms": timings
+        }
+
+    async def query_similar(self, collection_name: str, query: str, limit: int = 3, mode: Optional[str] = None) -> List[str]:
+        return (await self.search(collection_name, query, limit, mode))["results"]
 
 rag_service = RAGService()
+# Read the built embeddings only, so a metrics scrape never loads the SDK
+registry.register_cache("embeddings", lambda: getattr(rag_service._embeddings, "stats", None))
+registry.register_cache("query_embeddings", lambda: getattr(rag_service._embeddings, "query_stats", None))
+registry.register_cache("retrieval_results", lambda: rag_service.result_cache.stats if rag_service.result_cache else None)
+registry.register_single_flight("retrieval", lambda: rag_service.flights.stats)
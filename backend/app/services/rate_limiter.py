@@ -0,0 +1,100 @@
+import asyncio
+import time
+from typing import Dict, Optional, Tuple
+from app.core.config import settings
+from app.core.metrics import RATE_LIMIT_WAIT_SECONDS
+
+
+class TokenBucket:
+    """Refills ``per_minute`` units per minute, bursting up to one minute's worth; 0 disables the limit.
+
+    The level may go negative when a request turns out larger than estimated;
+    later requests then wait for the debt to refill.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        if self.capacity <= 0:
+            return 0.0
+        self._refill()
+        # A request larger than the whole bucket only has to wait for a full one
+        deficit = min(amount, self.capacity) - self.level
+        return max(0.0, deficit / self.rate)
+
+    def consume(self, amount: float):
+        if self.capacity > 0:
+            self._refill()
+            self.level -= amount
+
+
+class ProviderRateLimiter:
+    """Requests-per-minute and tokens-per-minute buckets per provider.
+
+    Waiters for one provider are served in arrival order, so whoever the
+    scheduler dequeued first also gets the next free slot.
+    """
+
+    def __init__(self, limits: Dict[str, Tuple[float, float]]):
+        self._buckets = {
+            provider: (TokenBucket(requests), TokenBucket(tokens)) for provider, (requests, tokens) in limits.items()
+        }
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    def _provider_buckets(self, provider: str) -> Tuple[TokenBucket, TokenBucket]:
+        if provider not in self._buckets:
+            self._buckets[provider] = (TokenBucket(0), TokenBucket(0))
+        return self._buckets[provider]
+
+    def wait_time(self, provider: str, tokens: int) -> float:
+        requests, token_bucket = self._provider_buckets(provider)
+        return max(requests.wait_time(1), token_bucket.wait_time(tokens))
+
+    async def acquire(self, provider: str, tokens: int):
+        start = time.perf_counter()
+        async with self._locks.setdefault(provider, asyncio.Lock()):
+            while True:
+                wait = self.wait_time(provider, tokens)
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            requests, token_bucket = self._provider_buckets(provider)
+            requests.consume(1)
+            token_bucket.consume(tokens)
+        RATE_LIMIT_WAIT_SECONDS.observe(time.perf_counter() - start, provider=provider)
+
+    def settle(self, provider: str, estimated: int, actual: int, served_by: Optional[str] = None, cached: bool = False):
+        """Correct the buckets once the request is done.
+
+        A response cache hit never reached a provider, so the reservation is
+        given back. When the router fell back to ``served_by``, the reserved
+        provider keeps the request it failed but gets its tokens back, and
+        ``served_by`` is charged for the request it actually answered.
+        """
+        requests, token_bucket = self._provider_buckets(provider)
+        if cached:
+            requests.consume(-1)
+            token_bucket.consume(-estimated)
+        elif served_by and served_by != provider:
+            token_bucket.consume(-estimated)
+            served_requests, served_tokens = self._provider_buckets(served_by)
+            served_requests.consume(1)
+            served_tokens.consume(actual or estimated)
+        elif actual:
+            token_bucket.consume(actual - estimated)
+
+
+rate_limiter = ProviderRateLimiter({
+    "openai": (settings.OPENAI_REQUESTS_PER_MINUTE, settings.OPENAI_TOKENS_PER_MINUTE),
+    "anthropic": (settings.ANTHROPIC_REQUESTS_PER_MINUTE, settings.ANTHROPIC_TOKENS_PER_MINUTE),
+    "google": (settings.GOOGLE_REQUESTS_PER_MINUTE, settings.GOOGLE_TOKENS_PER_MINUTE),
+})
@@ -1,19 +1,49 @@
 import os
-from tavily import TavilyClient
+import time
 from app.core.config import settings
+from app.core.metrics import SEARCH_REQUEST_SECONDS, registry
+from app.core.tracing import span
+from app.services.cache_service import normalize_text
+from app.services.single_flight import SingleFlight
 
 class SearchService:
     def __init__(self):
         self.api_key = os.getenv("TAVILY_API_KEY", "")
-        self.client = TavilyClient(api_key=self.api_key) if self.api_key else None
+        self._client = None
+        self.flights = SingleFlight()
+
+    @property
+    def client(self):
+        if self._client is None and self.api_key:
+            from tavily import AsyncTavilyClient
+            self._client = AsyncTavilyClient(api_key=self.api_key)
+        return self._client
+
+    @client.setter
+    def client(self, client):
+        self._client = client
+
+    def warm_up(self):
+        self.client
 
     async def search(self, query: str, search_depth: str = "basic"):
         if not self.client:
             return "Tavily API key not configured."
-        
-        # Tavily's search is synchronous, but we can wrap it if needed. 
-        # For simplicity in this async environment:
-        response = self.client.search(query=query, search_depth=search_depth)
+        if not settings.SINGLE_FLIGHT_ENABLED:
+            return await self._search(query, search_depth)
+        result, _ = await self.flights.do(
+            f"{search_depth}:{normalize_text(query)}", lambda: self._search(query, search_depth)
+        )
+        return result
+
+    async def _search(self, query: str, search_depth: str) -> str:
+        start, outcome = time.perf_counter(), "error"
+        try:
+            with span("tavily.search", depth=search_depth):
+                response = await self.client.search(query=query, search_depth=search_depth)
+            outcome = "ok"
+        finally:
+            SEARCH_REQUEST_SECONDS.observe(time.perf_counter() - start, outcome=outcome)
         
         results = []
         for result in response.get("results", []):
@@ -22,3 +52,4 @@ class SearchService:
         return "\n---\n".join(results)
 
 search_service = SearchService()
+registry.register_single_flight("search", lambda: search_service.flights.stats)
@@ -0,0 +1,127 @@
+import asyncio
+from dataclasses import dataclass, asdict
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+
+@dataclass
+class FlightStats:
+    calls: int = 0
+    coalesced: int = 0
+    failures: int = 0
+    cancellations: int = 0
+
+    def as_dict(self) -> dict:
+        data = asdict(self)
+        data["coalesced_ratio"] = round(self.coalesced / self.calls, 4) if self.calls else 0.0
+        return data
+
+
+class _Flight:
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.waiters = 0
+        # Streams only: every item so far, so late subscribers replay from the start
+        self.items: List[Any] = []
+        self.finished = False
+        self.error: Optional[BaseException] = None
+        self.updated = asyncio.Event()
+
+    def notify(self):
+        self.updated.set()
+        self.updated = asyncio.Event()
+
+
+class SingleFlight:
+    """Shares one in-progress upstream call between concurrent callers with the same key.
+
+    The first caller starts the call as a task and later callers await that
+    task. A caller that is cancelled (client disconnect, timeout) only stops
+    waiting; the upstream call is cancelled once no caller is left. Failures
+    reach every caller and are never remembered, so the next call after one
+    goes upstream again. Completed results are not kept either; that is the
+    caches' job.
+    """
+
+    def __init__(self):
+        self.stats = FlightStats()
+        self._calls: Dict[str, _Flight] = {}
+        self._streams: Dict[str, _Flight] = {}
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._calls) + len(self._streams)
+
+    def _join(self, flights: Dict[str, _Flight], key: str) -> Tuple[_Flight, bool]:
+        self.stats.calls += 1
+        flight = flights.get(key)
+        if flight is not None:
+            self.stats.coalesced += 1
+            return flight, True
+        flight = flights[key] = _Flight()
+        return flight, False
+
+    def _start(self, flights: Dict[str, _Flight], key: str, flight: _Flight, coro: Awaitable):
+        flight.task = asyncio.ensure_future(coro)
+
+        def finished(task: asyncio.Task):
+            if flights.get(key) is flight:
+                del flights[key]
+            if task.cancelled():
+                self.stats.cancellations += 1
+            elif task.exception() is not None:
+                # Retrieving it here also keeps asyncio from logging it when no caller is left
+                self.stats.failures += 1
+
+        flight.task.add_done_callback(finished)
+
+    def _leave(self, flights: Dict[str, _Flight], key: str, flight: _Flight):
+        flight.waiters -= 1
+        if not flight.waiters and not flight.task.done():
+            # Nobody is left to use the result; later callers start a fresh call
+            if flights.get(key) is flight:
+                del flights[key]
+            flight.task.cancel()
+
+    async def do(self, key: str, call: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Result of ``call()``, or of the identical call already running; also whether it was shared."""
+        flight, shared = self._join(self._calls, key)
+        if not shared:
+            self._start(self._calls, key, flight, call())
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task), shared
+        finally:
+            self._leave(self._calls, key, flight)
+
+    async def stream(self, key: str, open_stream: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+        """Every item of ``open_stream()``, fanned out to all concurrent subscribers of the key."""
+        flight, shared = self._join(self._streams, key)
+        if not shared:
+            async def pump():
+                try:
+                    async for item in open_stream():
+                        flight.items.append(item)
+                        flight.notify()
+                except BaseException as e:
+                    flight.error = e
+                    raise
+                finally:
+                    flight.finished = True
+                    flight.notify()
+
+            self._start(self._streams, key, flight, pump())
+        flight.waiters += 1
+        try:
+            index = 0
+            while True:
+                if index < len(flight.items):
+                    index += 1
+                    yield flight.items[index - 1]
+                elif flight.finished:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                else:
+                    await flight.updated.wait()
+        finally:
+            self._leave(self._streams, key, flight)
@@ -0,0 +1,75 @@
+from typing import Dict, List, Optional
+from app.services.cache_service import cosine, normalize_text
+from app.services.copy_linter import lint_copy
+from app.services.embedding_service import CachedEmbeddings
+from app.services.rag_service import rag_service
+
+# Score lost per lint issue, and per unit of similarity to a variant already ranked above
+LINT_ISSUE_PENALTY = 0.25
+DIVERSITY_WEIGHT = 0.5
+
+
+def _bigrams(text: str) -> set:
+    text = normalize_text(text)
+    return {text[i:i + 2] for i in range(len(text) - 1)} or {text}
+
+
+def lexical_similarity(a: str, b: str) -> float:
+    """Character-bigram Jaccard, the fallback when embeddings are unavailable."""
+    left, right = _bigrams(a), _bigrams(b)
+    return len(left & right) / len(left | right)
+
+
+def rank_variants(platform: Optional[str], texts: List[str], vectors: Optional[List[List[float]]] = None) -> List[Dict]:
+    """Order candidates best first: lint-clean ones, each as unlike the ones above it as possible.
+
+    Greedy maximal marginal relevance: every pick maximizes its lint quality
+    minus ``DIVERSITY_WEIGHT`` times its similarity to the closest variant
+    already picked. Exact duplicates (after whitespace normalization) are dropped.
+    """
+    seen, candidates = set(), []
+    for i, text in enumerate(texts):
+        key = normalize_text(text)
+        if key and key not in seen:
+            seen.add(key)
+            issues = lint_copy(platform, text).issues if platform else []
+            candidates.append({"index": i, "content": text, "issues": issues, "quality": 1.0 - LINT_ISSUE_PENALTY * len(issues)})
+
+    def similarity(a: dict, b: dict) -> float:
+        if vectors is not None:
+            return cosine(vectors[a["index"]], vectors[b["index"]])
+        return lexical_similarity(a["content"], b["content"])
+
+    ranked = []
+    while candidates:
+        for candidate in candidates:
+            candidate["similarity"] = max((similarity(candidate, picked) for picked in ranked), default=0.0)
+        best = max(candidates, key=lambda c: (c["quality"] - DIVERSITY_WEIGHT * c["similarity"], -c["index"]))
+        candidates.remove(best)
+        ranked.append(best)
+
+    return [
+        {
+            "content": item["content"],
+            "issues": item["issues"],
+            "quality": round(item["quality"], 4),
+            # Similarity to the closest variant ranked above this one
+            "similarity": round(item["similarity"], 4)
+        }
+        for item in ranked
+    ]
+
+
+async def rank_candidates(platform: Optional[str], texts: List[str]) -> List[Dict]:
+    """``rank_variants`` with embedding similarity, falling back to lexical similarity."""
+    vectors = None
+    if len(set(texts)) > 1:
+        try:
+            # The model behind the embedding cache: throwaway drafts would otherwise stay in it for good
+            embeddings = rag_service.embeddings
+            if isinstance(embeddings, CachedEmbeddings):
+                embeddings = embeddings.embeddings
+            vectors = await embeddings.aembed_documents(texts)
+        except Exception as e:
+            print(f"⚠️ Embeddings unavailable for variant ranking, using lexical similarity: {e}")
+    return rank_variants(platform, texts, vectors)
@@ -0,0 +1,192 @@
+import asyncio
+import hashlib
+import json
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+from app.core.config import settings
+from app.core.metrics import registry
+from app.core.prompts import CAROUSEL_PACKED_TEMPLATE, CAROUSEL_SUMMARY_TEMPLATE, VISION_ANALYSIS_PROMPT
+from app.services.cache_service import MemoryCacheBackend
+from app.services.image_processor import PreparedImage, image_processor
+from app.services.llm_router import AUTO, TASK_TEXT, ProviderUnavailableError
+from app.services.llm_service import llm_service
+
+# dHash bits allowed to differ for two uploads to count as the same picture. Carousel slides, product
+# shots on plain backgrounds and flat graphics are often only a few bits apart, so this stays tight
+PERCEPTUAL_MAX_DISTANCE = 1
+# ...and their aspect ratios must agree this closely (relative), so a crop or another layout never matches
+PERCEPTUAL_ASPECT_TOLERANCE = 0.01
+
+
+def prompt_hash(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
+
+
+def parse_packed(text: str, count: int) -> Optional[dict]:
+    """The ``{"images": [...], "summary": ...}`` answer of a packed request, or None if unusable."""
+    start, end = text.find("{"), text.rfind("}")
+    if start < 0 or end < start:
+        return None
+    try:
+        data = json.loads(text[start:end + 1])
+    except json.JSONDecodeError:
+        return None
+    images = data.get("images") if isinstance(data, dict) else None
+    if not isinstance(images, list) or len(images) != count:
+        return None
+    return {"images": [str(item) for item in images], "summary": str(data.get("summary") or "")}
+
+
+class VisionService:
+    """Preprocesses uploads and reuses analyses of pictures already seen.
+
+    Lookups match the exact upload bytes. With ``VISION_PERCEPTUAL_CACHE`` they
+    then try any cached picture with the same aspect ratio whose perceptual hash
+    is within ``PERCEPTUAL_MAX_DISTANCE`` bits, so re-saved or resized copies of
+    the same image don't trigger another vision call. It is opt-in because a
+    64-bit dHash can't tell apart slides that differ only in small text.
+    """
+
+    def __init__(self):
+        self.cache = MemoryCacheBackend(settings.VISION_CACHE_MAX_ENTRIES)
+        self._perceptual: "OrderedDict[str, tuple]" = OrderedDict()
+
+    @property
+    def stats(self):
+        return self.cache.stats
+
+    def _find_similar(self, prompt_hash: str, perceptual_hash: int, aspect: float) -> Optional[str]:
+        for key, (prompt, candidate, candidate_aspect) in reversed(self._perceptual.items()):
+            if prompt != prompt_hash or abs(candidate_aspect - aspect) > PERCEPTUAL_ASPECT_TOLERANCE * aspect:
+                continue
+            if bin(candidate ^ perceptual_hash).count("1") <= PERCEPTUAL_MAX_DISTANCE:
+                value = self.cache.get(key)
+                if value is not None:
+                    return value
+                # Entry expired or was evicted from the backend
+                self._perceptual.pop(key, None)
+                return None
+        return None
+
+    def _lookup(self, image: PreparedImage, prompt_key: str) -> Optional[str]:
+        analysis = self.cache.get(f"{image.content_hash}:{prompt_key}")
+        if analysis is None and settings.VISION_PERCEPTUAL_CACHE:
+            analysis = self._find_similar(prompt_key, int(image.perceptual_hash, 16), image.width / image.height)
+        if analysis is not None:
+            self.stats.hits += 1
+        else:
+            self.stats.misses += 1
+        return analysis
+
+    def _remember(self, image: PreparedImage, prompt_key: str, analysis: str):
+        key = f"{image.content_hash}:{prompt_key}"
+        self.cache.set(key, analysis, settings.VISION_CACHE_TTL_SECONDS)
+        self._perceptual[key] = (prompt_key, int(image.perceptual_hash, 16), image.width / image.height)
+        while len(self._perceptual) > settings.VISION_CACHE_MAX_ENTRIES:
+            self._perceptual.popitem(last=False)
+
+    @staticmethod
+    def _describe(image: PreparedImage) -> Dict[str, int]:
+        return {
+            "width": image.width,
+            "height": image.height,
+            "bytes": len(image.data),
+            "original_bytes": image.original_bytes
+        }
+
+    async def analyze(self, contents: bytes, prompt: str) -> Dict[str, Any]:
+        image = await image_processor.prepare(contents)
+        prompt_key = prompt_hash(prompt)
+
+        analysis = self._lookup(image, prompt_key)
+        cached = analysis is not None
+        if not cached:
+            analysis = await llm_service.analyze_image(image.data, prompt, mime_type=image.mime_type)
+            self._remember(image, prompt_key, analysis)
+
+        return {"analysis": analysis, "cached": cached, "image": self._describe(image)}
+
+    async def analyze_carousel(self, contents_list: List[bytes], pack: bool = True) -> Dict[str, Any]:
+        """Per-image analyses plus a carousel summary for several uploads.
+
+        Images not found in the cache go to the provider ``VISION_IMAGES_PER_REQUEST``
+        at a time in one multimodal request each, so a whole carousel costs about one
+        round-trip. A packed answer that can't be parsed is redone one image per
+        request. Either way at most ``VISION_BATCH_CONCURRENCY`` requests run at once.
+        """
+        images = await asyncio.gather(*(image_processor.prepare(contents) for contents in contents_list))
+        prompt_key = prompt_hash(VISION_ANALYSIS_PROMPT)
+        analyses: List[Optional[str]] = [self._lookup(image, prompt_key) for image in images]
+        cached = [analysis is not None for analysis in analyses]
+        misses = [i for i, analysis in enumerate(analyses) if analysis is None]
+
+        semaphore = asyncio.Semaphore(max(1, settings.VISION_BATCH_CONCURRENCY))
+        requests = {"packed": 0, "single": 0, "summary": 0}
+        summaries: List[str] = []
+
+        async def single(index: int):
+            async with semaphore:
+                requests["single"] += 1
+                image = images[index]
+                analyses[index] = await llm_service.analyze_image(
+                    image.data, VISION_ANALYSIS_PROMPT, mime_type=image.mime_type
+                )
+
+        async def packed(indexes: List[int]):
+            async with semaphore:
+                requests["packed"] += 1
+                text = await llm_service.analyze_images(
+                    [(images[i].data, images[i].mime_type) for i in indexes],
+                    CAROUSEL_PACKED_TEMPLATE.format(count=len(indexes))
+                )
+            parsed = parse_packed(text, len(indexes))
+            if parsed is None:
+                print(f"⚠️ Packed vision answer for {len(indexes)} images was not usable; analyzing them one by one")
+                await asyncio.gather(*(single(i) for i in indexes))
+                return
+            for i, analysis in zip(indexes, parsed["images"]):
+                analyses[i] = analysis
+            if len(indexes) == len(images) and parsed["summary"]:
+                summaries.append(parsed["summary"])
+
+        per_request = max(1, settings.VISION_IMAGES_PER_REQUEST)
+        if pack and per_request > 1 and len(misses) > 1:
+            chunks = [misses[i:i + per_request] for i in range(0, len(misses), per_request)]
+            await asyncio.gather(*(packed(chunk) if len(chunk) > 1 else single(chunk[0]) for chunk in chunks))
+        else:
+            await asyncio.gather(*(single(i) for i in misses))
+
+        for i in misses:
+            self._remember(images[i], prompt_key, analyses[i])
+
+        # The summary depends on the whole set and its order, so it is cached under all the images' hashes
+        summary_key = "carousel:" + prompt_hash(":".join(image.content_hash for image in images)) + f":{prompt_key}"
+        if summaries:
+            summary = summaries[0]
+        elif not misses and self.cache.get(summary_key) is not None:
+            summary = self.cache.get(summary_key)
+        else:
+            # Cache hits or several packed chunks: summarize from the per-image analyses.
+            # generate_text answers a missing provider with an error text, which must not be cached as a summary
+            if not llm_service.router.routes(TASK_TEXT):
+                raise ProviderUnavailableError("No LLM provider configured.")
+            requests["summary"] += 1
+            listing = "\n\n".join(f"第 {i + 1} 張：{analysis}" for i, analysis in enumerate(analyses))
+            summary = await llm_service.generate_text(
+                CAROUSEL_SUMMARY_TEMPLATE.format(analyses=listing),
+                system_prompt="You are a professional social media visual analyst.",
+                provider=AUTO
+            )
+        self.cache.set(summary_key, summary, settings.VISION_CACHE_TTL_SECONDS)
+
+        return {
+            "summary": summary,
+            "images": [
+                {"index": i, "analysis": analyses[i], "cached": cached[i], "image": self._describe(image)}
+                for i, image in enumerate(images)
+            ],
+            "requests": requests
+        }
+
+vision_service = VisionService()
+registry.register_cache("vision", lambda: vision_service.stats)
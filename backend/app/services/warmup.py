@@ -0,0 +1,43 @@
+import asyncio
+import time
+from app.core.config import settings
+from app.services.document_processor import document_processor
+from app.services.llm_service import llm_service
+from app.services.rag_service import rag_service
+from app.services.search_service import search_service
+from app.services.workflow_service import workflow_service
+
+WARMUP_TARGETS = {
+    "llm": lambda: llm_service.warm_up(),
+    "rag": lambda: rag_service.warm_up(),
+    "workflow": lambda: workflow_service.warm_up(),
+    "search": lambda: search_service.warm_up(),
+    "documents": lambda: document_processor.warm_up(),
+}
+
+
+def _warm_up(names: list):
+    for name in names:
+        start = time.perf_counter()
+        try:
+            WARMUP_TARGETS[name]()
+            print(f"🔥 Warmed up {name} in {time.perf_counter() - start:.2f}s")
+        except Exception as e:
+            # The service still initializes on first use, so a failed warm-up never blocks startup
+            print(f"⚠️ Warm-up of {name} failed: {e}")
+
+
+async def warm_up(targets: str = None):
+    """Build the services named in ``SERVICE_WARMUP`` before the app starts serving."""
+    targets = settings.SERVICE_WARMUP if targets is None else targets
+    names = [name.strip() for name in targets.split(",") if name.strip()]
+    if "all" in names:
+        names = list(WARMUP_TARGETS)
+    unknown = [name for name in names if name not in WARMUP_TARGETS]
+    if unknown:
+        print(f"⚠️ Unknown SERVICE_WARMUP entries ignored: {', '.join(unknown)}")
+    names = [name for name in names if name in WARMUP_TARGETS]
+    if names:
+        # Imports and client construction block, so they run off the event loop; one
+        # thread keeps them sequential, which avoids contending on the import lock
+        await asyncio.to_thread(_warm_up, names)
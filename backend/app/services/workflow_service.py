@@ -1,42 +1,93 @@
-from typing import TypedDict, List, Annotated
+from typing import TypedDict, List, Annotated, AsyncIterator, Optional
 import operator
-from langgraph.graph import StateGraph, END
+import random
+import time
+from app.core.config import settings
+from app.core.metrics import WORKFLOW_NODE_SECONDS
+from app.core.tracing import span
+from app.services.context_service import build_context
+from app.services.copy_linter import lint_copy
 from app.services.llm_service import llm_service
+from app.services.rag_service import rag_service, DEFAULT_COLLECTION
 from app.services.search_service import search_service
-from app.core.prompts import PLATFORM_PROMPTS
+from app.core.prompts import PLATFORM_GUIDES
+
+MAX_REVISIONS = 2
 
 class AgentState(TypedDict):
     platform: str
     topic: str
     style: str
     context: str
+    context_used: List[str]
+    collection_name: str
+    use_rag: bool
     search_results: str
     use_search: bool
+    use_cache: bool
     plan: str
     draft: str
     critique: str
     final_copy: str
     revision_count: int
+    editor_mode: str
+    review: str
+    brand_tokens_saved: int
+    search_tokens_saved: int
+    llm_calls_saved: Annotated[int, operator.add]
+    tokens_saved: Annotated[int, operator.add]
     logs: Annotated[List[str], operator.add]
 
+def search_query(topic: str) -> str:
+    """The web search the searcher node runs for ``topic``; callers that search ahead of the graph use it too."""
+    return f"最新關於 {topic} 的趨勢與新聞"
+
 class WorkflowService:
     def __init__(self):
-        self.workflow = self._create_workflow()
+        self._workflow = None
+
+    @property
+    def workflow(self):
+        # langgraph takes over a second to import, so the graph is compiled with the first agent request
+        if self._workflow is None:
+            self._workflow = self._create_workflow()
+        return self._workflow
+
+    def warm_up(self):
+        self.workflow
 
     def _create_workflow(self):
+        from langgraph.graph import StateGraph, START, END
         workflow = StateGraph(AgentState)
 
         # Define nodes
-        workflow.add_node("searcher", self.searcher_node)
-        workflow.add_node("planner", self.planner_node)
-        workflow.add_node("writer", self.writer_node)
-        workflow.add_node("editor", self.editor_node)
-
-        # Define edges
-        workflow.set_entry_point("searcher")
-        workflow.add_edge("searcher", "planner")
+        workflow.add_node("searcher", self._timed("searcher", self.searcher_node))
+        workflow.add_node("retriever", self._timed("retriever", self.retriever_node))
+        workflow.add_node("context", self._timed("context", self.context_node))
+        workflow.add_node("planner", self._timed("planner", self.planner_node))
+        workflow.add_node("writer", self._timed("writer", self.writer_node))
+        workflow.add_node("linter", self._timed("linter", self.linter_node))
+        workflow.add_node("editor", self._timed("editor", self.editor_node))
+
+        # Define edges: web search and brand retrieval are independent and run concurrently
+        workflow.add_edge(START, "searcher")
+        workflow.add_edge(START, "retriever")
+        # Both are compressed once to the context budget and reused by every later prompt
+        workflow.add_edge(["searcher", "retriever"], "context")
+        workflow.add_edge("context", "planner")
         workflow.add_edge("planner", "writer")
-        workflow.add_edge("writer", "editor")
+        workflow.add_edge("writer", "linter")
+
+        # Local checks first; the LLM editor only sees drafts that pass them, and only when configured
+        workflow.add_conditional_edges(
+            "linter",
+            lambda state: state["review"],
+            {
+                "rewrite": "writer",
+                "editor": "editor",
+                "done": END
+            }
+        )
         
         workflow.add_conditional_edges(
             "editor",
@@ -49,60 +100,163 @@ class WorkflowService:
 
         return workflow.compile()
 
+    def _timed(self, name: str, node):
+        async def run(state: AgentState):
+            start = time.perf_counter()
+            with span(f"node.{name}", revision=state.get("revision_count", 0)):
+                update = await node(state)
+            elapsed = time.perf_counter() - start
+            WORKFLOW_NODE_SECONDS.observe(elapsed, node=name)
+            elapsed_ms = elapsed * 1000
+            update["logs"] = update.get("logs", []) + [f"⏱ {name}: {elapsed_ms:.0f} ms"]
+            return update
+        return run
+
     async def searcher_node(self, state: AgentState):
         if not state.get("use_search"):
             return {"search_results": "", "logs": ["Searcher: 跳過聯網搜尋。"]}
+        if state.get("search_results"):
+            return {"logs": ["Searcher: 使用已取得的聯網搜尋結果。"]}
         
-        query = f"最新關於 {state['topic']} 的趨勢與新聞"
-        results = await search_service.search(query)
+        results = await search_service.search(search_query(state['topic']))
         return {
             "search_results": results,
             "logs": ["Searcher: 已完成聯網搜尋，獲取最新時事資訊。"]
         }
 
+    async def _generate_streamed(
+        self, node: str, prompt: str, system_prompt: str, revision: int = 0, use_cache: bool = True, prefix: str = ""
+    ) -> str:
+        from langgraph.config import get_stream_writer
+        # Tokens are forwarded to stream_workflow consumers; under ainvoke the writer is a no-op
+        writer = get_stream_writer()
+        parts = []
+        async for delta in llm_service.stream_text(prompt, system_prompt=system_prompt, use_cache=use_cache, prefix=prefix):
+            parts.append(delta)
+            writer({"type": "token", "node": node, "revision": revision, "text": delta})
+        return "".join(parts)
+
+    async def retriever_node(self, state: AgentState):
+        if not state.get("use_rag") or state.get("context") or state.get("context_used"):
+            return {"logs": ["Retriever: 跳過品牌知識檢索。"]}
+
+        results = await rag_service.query_similar(state.get("collection_name") or DEFAULT_COLLECTION, state['topic'])
+        return {
+            "context": "\n".join(results),
+            "context_used": results,
+            "logs": [f"Retriever: 已檢索 {len(results)} 筆品牌知識。"]
+        }
+
+    async def context_node(self, state: AgentState):
+        chunks = state.get("context_used") or ([state["context"]] if state.get("context") else [])
+        context = build_context(chunks, state.get("search_results", ""))
+        return {
+            "context": context.brand,
+            "search_results": context.search,
+            "brand_tokens_saved": context.brand_tokens_saved,
+            "search_tokens_saved": context.search_tokens_saved,
+            "logs": [
+                f"Context: 品牌知識 {context.brand_tokens_raw}→{context.brand_tokens} tokens，"
+                f"聯網搜尋 {context.search_tokens_raw}→{context.search_tokens} tokens。"
+            ]
+        }
+
+    # Prompts put the segments shared across requests (instructions, brand context, platform) in
+    # the prefix and the per-request ones after it, so providers can serve the prefix from cache
     async def planner_node(self, state: AgentState):
-        prompt = f"""
-        你是一位社群媒體策略師。請針對以下主題與平台，規劃貼文的結構與重點。
+        prefix = f"""
+        你是一位社群媒體策略師。請針對主題與平台，規劃貼文的結構與重點，並嘗試結合搜尋到的時事資訊（如果有）。
+        品牌背景：{state['context']}
         平台：{state['platform']}
+        """
+        prompt = f"""
         主題：{state['topic']}
         風格：{state['style']}
-        品牌背景：{state['context']}
         聯網搜尋結果：{state.get('search_results', '無')}
         
-        請輸出貼文的規劃大綱，並嘗試結合搜尋到的時事資訊（如果有）。
+        請輸出貼文的規劃大綱。
         """
-        plan = await llm_service.generate_text(prompt, system_prompt="你是一位專業的社群媒體策略師。")
+        plan = await self._generate_streamed(
+            "planner",
+            prompt,
+            system_prompt="你是一位專業的社群媒體策略師。",
+            use_cache=state.get("use_cache", True),
+            prefix=prefix
+        )
         return {
             "plan": plan,
+            "tokens_saved": state.get("brand_tokens_saved", 0) + state.get("search_tokens_saved", 0),
             "logs": ["Planner: 已完成貼文結構規劃（已結合時事資訊）。"]
         }
 
     async def writer_node(self, state: AgentState):
-        template = PLATFORM_PROMPTS.get(state['platform'].lower(), "{topic}")
-        prompt = f"""
+        # Everything but the critique is identical across revisions, so rewrites reuse the cached prefix
+        prefix = f"""
+        品牌背景：{state['context']}
+        {PLATFORM_GUIDES.get(state['platform'].lower(), '')}
         根據以下規劃大綱撰寫貼文：
         規劃大綱：{state['plan']}
-        
-        品牌背景：{state['context']}
         風格要求：{state['style']}
-        
-        請撰寫正式的貼文內容。
         """
+        prompt = "請撰寫正式的貼文內容。"
         if state.get('critique'):
             prompt += f"\n\n請參考以下修改建議進行優化：\n{state['critique']}"
             
-        draft = await llm_service.generate_text(prompt, system_prompt="你是一位擅長撰寫社群文案的作家。")
+        draft = await self._generate_streamed(
+            "writer",
+            prompt,
+            system_prompt="你是一位擅長撰寫社群文案的作家。",
+            revision=state.get('revision_count', 0) + 1,
+            use_cache=state.get("use_cache", True),
+            prefix=prefix
+        )
         return {
             "draft": draft,
+            # Every revision resends the brand context
+            "tokens_saved": state.get("brand_tokens_saved", 0),
             "logs": [f"Writer: 已生成第 {state.get('revision_count', 0) + 1} 版草稿。"]
         }
 
+    def _wants_llm_editor(self, state: AgentState) -> bool:
+        if state.get("editor_mode") == "strict":
+            return True
+        return random.random() < settings.EDITOR_LLM_SAMPLE_RATE
+
+    async def linter_node(self, state: AgentState):
+        lint = lint_copy(state['platform'], state['draft'])
+        revision_count = state.get('revision_count', 0)
+
+        if not lint.passed:
+            # Each failed lint round replaces an editor LLM critique with a local one
+            revision_count += 1
+            if revision_count >= MAX_REVISIONS:
+                return {
+                    "final_copy": state['draft'],
+                    "revision_count": revision_count,
+                    "review": "done",
+                    "llm_calls_saved": 1,
+                    "logs": [f"Linter: 已達修改上限，以目前草稿定稿（仍有 {len(lint.issues)} 項未符合規範）。"]
+                }
+            return {
+                "critique": lint.as_critique(),
+                "revision_count": revision_count,
+                "review": "rewrite",
+                "llm_calls_saved": 1,
+                "logs": [f"Linter: 發現 {len(lint.issues)} 項問題，退回修改：{lint.issues[0]}"]
+            }
+
+        if self._wants_llm_editor(state):
+            return {"review": "editor", "logs": ["Linter: 規則檢查通過，交由編輯審核。"]}
+        return {
+            "final_copy": state['draft'],
+            "review": "done",
+            "llm_calls_saved": 1,
+            "logs": ["Linter: 規則檢查通過，文案已定稿（略過 LLM 編輯審核）。"]
+        }
+
     async def editor_node(self, state: AgentState):
-        prompt = f"""
-        你是一位嚴格的社群媒體編輯。請審查以下貼文草稿：
-        草稿：{state['draft']}
-        
-        審查標準：
+        prefix = f"""
+        你是一位嚴格的社群媒體編輯。請依下列標準審查貼文草稿：
         1. 是否符合平台 {state['platform']} 的特性？
         2. 語氣是否符合 {state['style']}？
         3. 是否有錯字或語句不通順？
@@ -110,11 +264,17 @@ class WorkflowService:
         如果草稿已經非常完美，請回覆 "PASS"。
         如果需要修改，請提供具體的修改建議。
         """
-        critique = await llm_service.generate_text(prompt, system_prompt="你是一位專業的社群媒體編輯。")
+        prompt = f"草稿：{state['draft']}"
+        critique = await llm_service.generate_text(
+            prompt,
+            system_prompt="你是一位專業的社群媒體編輯。",
+            use_cache=state.get("use_cache", True),
+            prefix=prefix
+        )
         
         revision_count = state.get('revision_count', 0) + 1
         
-        if "PASS" in critique.upper() or revision_count >= 2:
+        if "PASS" in critique.upper() or revision_count >= MAX_REVISIONS:
             return {
                 "final_copy": state['draft'],
                 "revision_count": revision_count,
@@ -132,17 +292,79 @@ class WorkflowService:
             return "end"
         return "continue"
 
-    async def run_workflow(self, platform: str, topic: str, style: str, context: str = "", use_search: bool = False):
-        initial_state = {
+    def _initial_state(self, platform: str, topic: str, style: str, **options):
+        return {
             "platform": platform,
             "topic": topic,
             "style": style,
-            "context": context,
-            "use_search": use_search,
+            "context": options.get("context", ""),
+            "context_used": options.get("context_used") or [],
+            "search_results": options.get("search_results", ""),
+            "collection_name": options.get("collection_name", DEFAULT_COLLECTION),
+            "use_rag": options.get("use_rag", False),
+            "use_search": options.get("use_search", False),
+            "use_cache": options.get("use_cache", True),
+            "editor_mode": options.get("editor_mode", "lint"),
             "revision_count": 0,
+            "brand_tokens_saved": 0,
+            "search_tokens_saved": 0,
+            "llm_calls_saved": 0,
+            "tokens_saved": 0,
             "logs": []
         }
+
+    async def run_workflow(
+        self, platform: str, topic: str, style: str, context: str = "", use_search: bool = False,
+        use_cache: bool = True, use_rag: bool = False, collection_name: str = DEFAULT_COLLECTION,
+        search_results: str = "", editor_mode: str = "lint", context_used: Optional[List[str]] = None
+    ):
+        initial_state = self._initial_state(
+            platform, topic, style, context=context, use_search=use_search, use_cache=use_cache,
+            use_rag=use_rag, collection_name=collection_name, search_results=search_results,
+            editor_mode=editor_mode, context_used=context_used
+        )
         result = await self.workflow.ainvoke(initial_state)
+        result["logs"].append(
+            f"本次執行省下 {result['llm_calls_saved']} 次 LLM 呼叫、約 {result['tokens_saved']} 個 context tokens。"
+        )
         return result
 
+    async def stream_workflow(
+        self, platform: str, topic: str, style: str, context: str = "", use_search: bool = False,
+        use_cache: bool = True, use_rag: bool = False, collection_name: str = DEFAULT_COLLECTION,
+        search_results: str = "", editor_mode: str = "lint", context_used: Optional[List[str]] = None
+    ) -> AsyncIterator[dict]:
+        """Yield token, context and log events as nodes progress, then a final done event."""
+        initial_state = self._initial_state(
+            platform, topic, style, context=context, use_search=use_search, use_cache=use_cache,
+            use_rag=use_rag, collection_name=collection_name, search_results=search_results,
+            editor_mode=editor_mode, context_used=context_used
+        )
+        final_copy = ""
+        llm_calls_saved = tokens_saved = 0
+        logs = []
+        async for mode, chunk in self.workflow.astream(initial_state, stream_mode=["updates", "custom"]):
+            if mode == "custom":
+                yield chunk
+                continue
+            for node, update in chunk.items():
+                if not update:
+                    continue
+                if "context_used" in update:
+                    yield {"type": "context", "context_used": update["context_used"]}
+                for message in update.get("logs", []):
+                    logs.append(message)
+                    yield {"type": "log", "node": node, "message": message}
+                llm_calls_saved += update.get("llm_calls_saved", 0)
+                tokens_saved += update.get("tokens_saved", 0)
+                if update.get("final_copy"):
+                    final_copy = update["final_copy"]
+        summary = f"本次執行省下 {llm_calls_saved} 次 LLM 呼叫、約 {tokens_saved} 個 context tokens。"
+        logs.append(summary)
+        yield {"type": "log", "node": "workflow", "message": summary}
+        yield {
+            "type": "done", "content": final_copy, "logs": logs,
+            "llm_calls_saved": llm_calls_saved, "tokens_saved": tokens_saved
+        }
+
 workflow_service = WorkflowService()
@@ -0,0 +1,145 @@
+"""Bulk content calendar throughput and resume check against fake providers.
+
+Run from the backend directory:
+
+    python -m benchmarks.calendar_bulk --topics 30 --rpm 60
+
+* ``sequential``: one ``/api/copy/generate`` call after another, the way a
+  calendar is filled in by hand or by a simple script (timed on a sample).
+* ``bulk``: the same topic/platform pairs as one calendar job, for a single
+  provider and for ``provider="auto"``, with every provider limited to
+  ``--rpm`` requests per minute (buckets start full, so the first minute's
+  worth goes out at once). Throughput should be bound by the rate limit
+  rather than by 1 / latency.
+* ``resume``: the service is stopped halfway through a job, with posts in
+  flight, and a fresh one is started on the same database; every post should
+  end up completed exactly once.
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+from benchmarks.fakes import FakeTavilyClient, fake_providers
+import httpx
+from app.core.config import settings
+from app.main import app
+from app.services.calendar_service import CalendarService, normalize_items
+from app.services.llm_service import llm_service
+from app.services.rate_limiter import rate_limiter
+from app.services.search_service import search_service
+
+PLATFORMS = ["facebook", "instagram", "threads"]
+
+
+def calendar_items(topics: int) -> list:
+    rows = [
+        {"topic": f"第{i}週主打活動", "date": f"2026-11-{i % 28 + 1:02d}", "priority": i % 3}
+        for i in range(topics)
+    ]
+    return normalize_items(rows, PLATFORMS)
+
+
+async def wait_for(service: CalendarService, job_id: str) -> dict:
+    while True:
+        job = service.get_job(job_id)
+        if job["status"] not in ("queued", "running"):
+            return job
+        await asyncio.sleep(0.05)
+
+
+async def sequential(items: list) -> float:
+    start = time.perf_counter()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for item in items:
+            response = await client.post("/api/copy/generate", json={
+                "platform": item["platform"], "topic": item["topic"], "use_rag": False, "use_cache": False
+            })
+            response.raise_for_status()
+    return time.perf_counter() - start
+
+
+async def bulk(workdir: str, items: list, provider: str) -> dict:
+    service = CalendarService(os.path.join(workdir, f"calendar_{provider}.sqlite3"))
+    await service.start()
+    try:
+        job = service.submit(items, {"provider": provider, "use_rag": False, "use_cache": False})
+        return await wait_for(service, job["id"])
+    finally:
+        await service.stop()
+
+
+async def resume(workdir: str, items: list) -> dict:
+    settings.CALENDAR_WORKERS = 4
+    db_path = os.path.join(workdir, "calendar_resume.sqlite3")
+    calls_before = sum(backend.calls for backend in llm_service.providers.values())
+    service = CalendarService(db_path)
+    await service.start()
+    job = service.submit(items, {"provider": "auto", "use_rag": False, "use_cache": False})
+    while service.get_job(job["id"])["completed"] < len(items) // 2:
+        await asyncio.sleep(0.02)
+    await service.stop()
+    interrupted = service.get_job(job["id"])
+
+    restarted = CalendarService(db_path)
+    await restarted.start()
+    try:
+        final = await wait_for(restarted, job["id"])
+    finally:
+        await restarted.stop()
+    posts = restarted.get_posts(job["id"])
+    return {
+        "completed_at_stop": interrupted["completed"],
+        "final": final,
+        "unique_posts": len({post["id"] for post in posts}),
+        "llm_calls": sum(backend.calls for backend in llm_service.providers.values()) - calls_before,
+    }
+
+
+async def main(topics: int, rpm: int, latency: float, workers: int, sample: int):
+    workdir = tempfile.mkdtemp(prefix="bench_calendar_")
+    try:
+        llm_service.providers = fake_providers(latency=latency)
+        llm_service.cache = None
+        search_service.client = FakeTavilyClient(latency=0)
+        settings.CALENDAR_WORKERS = workers
+        items = calendar_items(topics)
+        print(f"{len(items)} posts, {latency * 1000:.0f} ms per call, {rpm} requests/min per provider, {workers} workers\n")
+
+        rate_limiter.__init__({name: (rpm, 0) for name in llm_service.providers})
+        elapsed = await sequential(items[:sample])
+        rate = min(sample / elapsed * 60, rpm)
+        print(f"{'sequential':<16}{elapsed / sample * len(items):>8.2f}s{rate:>10.1f} posts/min  (extrapolated from {sample})")
+
+        for provider in ("openai", "auto"):
+            rate_limiter.__init__({name: (rpm, 0) for name in llm_service.providers})
+            job = await bulk(workdir, items, provider)
+            print(
+                f"{'bulk ' + provider:<16}{job['elapsed_seconds']:>8.2f}s{job['posts_per_minute']:>10.1f} posts/min"
+                f"  ({job['completed']} completed, {job['failed']} failed)"
+            )
+
+        rate_limiter.__init__({name: (0, 0) for name in llm_service.providers})
+        result = await resume(workdir, items)
+        final = result["final"]
+        print(
+            f"\nresume: stopped at {result['completed_at_stop']}/{len(items)}, finished {final['completed']} completed / "
+            f"{final['failed']} failed, {result['unique_posts']} posts, {result['llm_calls']} LLM calls"
+        )
+        ok = final["completed"] == result["unique_posts"] == len(items)
+        print("resume OK" if ok else "resume MISMATCH")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--topics", type=int, default=30, help="calendar rows; each becomes one post per platform")
+    parser.add_argument("--rpm", type=int, default=60, help="requests per minute allowed per fake provider")
+    parser.add_argument("--latency", type=float, default=1.0)
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--sample", type=int, default=10, help="posts timed for the sequential baseline")
+    args = parser.parse_args()
+    asyncio.run(main(args.topics, args.rpm, args.latency, args.workers, args.sample))
@@ -0,0 +1,98 @@
+"""Request coalescing check: bursts of identical requests against fake backends.
+
+Run from the backend directory:
+
+    python -m benchmarks.coalescing --burst 50
+
+Each scenario fires ``--burst`` identical requests at once, the way editors
+hit the same campaign topic when it goes live, and counts the upstream calls
+(LLM, embedding, Tavily) with single-flight off and on. Response caches are
+empty at the start of every burst, so everything saved comes from requests
+joining one already in flight. The coalesced ratios are read back from
+``/metrics``.
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+from benchmarks.fakes import FakeEmbeddings, FakeTavilyClient, fake_providers
+import httpx
+from app.core.config import settings
+from app.main import app
+from app.services.document_processor import DocumentProcessor
+from app.services.llm_service import build_response_cache, llm_service
+from app.services.rag_service import rag_service
+from app.services.search_service import search_service
+
+BRAND = "coalesce"
+TEXT = "。".join(f"冬季新品第{i}款 限時優惠 會員禮盒" for i in range(200))
+SCENARIOS = {
+    "copy_single": ("post", "/api/copy/generate", {"platform": "instagram", "topic": "冬季新品上市", "brand_id": BRAND, "use_search": True}),
+    "copy_agent": ("post", "/api/copy/generate", {"platform": "threads", "topic": "冬季新品上市", "brand_id": BRAND, "use_agent": True}),
+    "search_knowledge": ("get", "/api/brand/search-knowledge", {"query": "冬季 新品 上市 活動", "brand_id": BRAND, "mode": "vector"}),
+}
+
+
+async def reset(workdir: str, run: int):
+    llm_service.providers = fake_providers(latency=0.3)
+    llm_service.cache = build_response_cache()
+    search_service.client = FakeTavilyClient(latency=0.3)
+    embeddings = FakeEmbeddings(latency=0.1)
+    rag_service.__init__(
+        embeddings=embeddings,
+        persist_directory=os.path.join(workdir, f"chroma{run}"),
+        embedding_cache_path=os.path.join(workdir, f"embeddings{run}.sqlite3"),
+        keyword_index_path=os.path.join(workdir, f"keywords{run}.sqlite3"),
+    )
+    chunks = DocumentProcessor().text_splitter.split_text(TEXT)
+    await rag_service.add_documents(rag_service.collection_for(BRAND), chunks, [{"source": "bench"} for _ in chunks])
+    embeddings.calls = 0
+    return embeddings
+
+
+async def burst(client: httpx.AsyncClient, scenario: str, size: int) -> float:
+    method, path, payload = SCENARIOS[scenario]
+    start = time.perf_counter()
+    if method == "post":
+        requests = [client.post(path, json=payload) for _ in range(size)]
+    else:
+        requests = [client.get(path, params=payload) for _ in range(size)]
+    for response in await asyncio.gather(*requests):
+        response.raise_for_status()
+    return time.perf_counter() - start
+
+
+async def main(size: int):
+    workdir = tempfile.mkdtemp(prefix="bench_coalesce_")
+    run = 0
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            print(f"{'scenario':<18}{'coalescing':>11}{'wall s':>9}{'LLM':>7}{'embed':>7}{'search':>8}")
+            for scenario in SCENARIOS:
+                for enabled in (False, True):
+                    run += 1
+                    settings.SINGLE_FLIGHT_ENABLED = enabled
+                    embeddings = await reset(workdir, run)
+                    elapsed = await burst(client, scenario, size)
+                    llm_calls = sum(backend.calls for backend in llm_service.providers.values())
+                    print(
+                        f"{scenario:<18}{'on' if enabled else 'off':>11}{elapsed:>9.2f}{llm_calls:>7}"
+                        f"{embeddings.calls:>7}{search_service.client.calls:>8}"
+                    )
+            metrics = (await client.get("/metrics")).text
+        print()
+        for line in metrics.splitlines():
+            if line.startswith("singleflight_coalesced_ratio"):
+                print(line)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--burst", type=int, default=50, help="identical concurrent requests per scenario")
+    args = parser.parse_args()
+    asyncio.run(main(args.burst))
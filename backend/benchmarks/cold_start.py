@@ -0,0 +1,152 @@
+"""Cold start benchmark: import, startup and first-request time per route family.
+
+Run from the backend directory:
+
+    python -m benchmarks.cold_start
+    python -m benchmarks.cold_start --warmup all
+
+Every family runs in a fresh interpreter and reports:
+
+* ``import``: importing the family's endpoint module alone, then the rest of ``app.main``
+* ``startup``: the lifespan (``SERVICE_WARMUP`` plus the background queues)
+* ``first`` / ``second``: the first two requests of that family
+
+LLM, embedding and search backends are the deterministic fakes, so the first
+request pays for Chroma, langgraph and loaders but never for a provider SDK.
+The SDK import and client construction show up in ``--warmup llm`` (the child
+uses placeholder keys so real clients get built), and without warm-up that
+cost moves to the first LLM call.
+"""
+import argparse
+import asyncio
+import importlib
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+FAMILIES = {
+    "root": "copy",
+    "metrics": "copy",
+    "copy": "copy",
+    "agent": "copy",
+    "brand": "brand",
+    "vision": "vision",
+    "calendar": "calendar",
+}
+
+
+def request_for(family: str):
+    if family == "root":
+        return lambda client: client.get("/")
+    if family == "metrics":
+        return lambda client: client.get("/metrics")
+    if family in ("copy", "agent"):
+        payload = {"platform": "facebook", "topic": "冬季新品", "use_agent": family == "agent", "use_cache": False}
+        return lambda client: client.post("/api/copy/generate", json=payload)
+    if family == "brand":
+        return lambda client: client.get("/api/brand/search-knowledge", params={"query": "冬季新品 活動"})
+    if family == "vision":
+        from PIL import Image
+        buffer = io.BytesIO()
+        Image.new("RGB", (64, 64), "orange").save(buffer, "JPEG")
+        data = buffer.getvalue()
+        return lambda client: client.post("/api/vision/analyze", files={"file": ("photo.jpg", data, "image/jpeg")})
+    if family == "calendar":
+        payload = {"items": [{"topic": "冬季新品", "platform": "threads"}], "use_rag": False}
+        return lambda client: client.post("/api/calendar/jobs", json=payload)
+    raise ValueError(family)
+
+
+async def child(family: str):
+    timings = {}
+    start = time.perf_counter()
+    importlib.import_module(f"app.api.endpoints.{FAMILIES[family]}")
+    timings["import_module"] = time.perf_counter() - start
+    stage = time.perf_counter()
+    from app.main import app
+    timings["import_app"] = time.perf_counter() - stage
+
+    from benchmarks.fakes import FakeEmbeddings, FakeTavilyClient, fake_providers
+    import httpx
+    from app.services.llm_service import llm_service
+    from app.services.rag_service import rag_service
+    from app.services.search_service import search_service
+
+    workdir = tempfile.mkdtemp(prefix="bench_cold_")
+    rag_service.__init__(
+        embeddings=FakeEmbeddings(),
+        persist_directory=os.path.join(workdir, "chroma"),
+        embedding_cache_path=os.path.join(workdir, "embeddings.sqlite3"),
+        keyword_index_path=os.path.join(workdir, "keywords.sqlite3"),
+    )
+    search_service.client = FakeTavilyClient(latency=0)
+
+    stage = time.perf_counter()
+    async with app.router.lifespan_context(app):
+        timings["startup"] = time.perf_counter() - stage
+        # Swapped in after startup so --warmup llm builds the real SDK clients
+        real_providers = llm_service.providers
+        llm_service.providers = fake_providers(latency=0)
+        send = request_for(family)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            for name in ("first", "second"):
+                stage = time.perf_counter()
+                response = await send(client)
+                timings[name] = time.perf_counter() - stage
+                response.raise_for_status()
+        llm_service.providers = real_providers
+    shutil.rmtree(workdir, ignore_errors=True)
+    print(json.dumps({key: round(value, 3) for key, value in timings.items()}))
+
+
+def run(family: str, warmup: str, workdir: str) -> dict:
+    env = {
+        **os.environ,
+        "SERVICE_WARMUP": warmup,
+        # Placeholder keys: clients can be constructed, nothing is ever sent with them
+        "OPENAI_API_KEY": "bench", "ANTHROPIC_API_KEY": "bench", "GOOGLE_API_KEY": "bench", "TAVILY_API_KEY": "bench",
+        "CALENDAR_DB_PATH": os.path.join(workdir, "calendar.sqlite3"),
+        "INGESTION_DB_PATH": os.path.join(workdir, "ingestion.sqlite3"),
+    }
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.cold_start", "--child", family],
+        env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(families: list, warmup: str):
+    print(f"SERVICE_WARMUP={warmup!r}\n")
+    print(f"{'family':<10}{'module':>9}{'app':>9}{'startup':>10}{'first':>9}{'second':>9}{'ready+1st':>11}")
+    workdir = tempfile.mkdtemp(prefix="bench_cold_")
+    try:
+        for family in families:
+            report(family, run(family, warmup, workdir))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def report(family: str, t: dict):
+    total = t["import_module"] + t["import_app"] + t["startup"] + t["first"]
+    print(
+        f"{family:<10}{t['import_module']:>8.2f}s{t['import_app']:>8.2f}s{t['startup']:>9.2f}s"
+        f"{t['first']:>8.2f}s{t['second']:>8.2f}s{total:>10.2f}s"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--families", nargs="+", default=list(FAMILIES), choices=list(FAMILIES))
+    parser.add_argument("--warmup", default="", help="SERVICE_WARMUP for the child processes, e.g. all")
+    parser.add_argument("--child", choices=list(FAMILIES), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        asyncio.run(child(args.child))
+    else:
+        main(args.families, args.warmup)
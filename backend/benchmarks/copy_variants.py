@@ -0,0 +1,101 @@
+"""A/B copy benchmark: N separate generations versus one request with ``variants=N``.
+
+Run from the backend directory:
+
+    python -m benchmarks.copy_variants --variants 5
+
+``repeated`` is what editors did before: ``/api/copy/generate`` N times with
+``use_cache=false`` so each call comes back different, every one repeating
+brand retrieval, web search and prompt assembly. ``variants`` asks once.
+``fanout`` is ``variants`` against a provider whose variants answer can't be
+parsed, so the versions are generated by concurrent single calls instead.
+Reports wall time, upstream calls, provider input/output tokens and distinct
+versions returned; the fake answers a plain generation the same way every time,
+so ``repeated`` and ``fanout`` come back with a single distinct version here.
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+from benchmarks.fakes import FakeEmbeddings, FakeProvider, FakeTavilyClient
+import httpx
+from app.main import app
+from app.services.document_processor import DocumentProcessor
+from app.services.llm_service import build_response_cache, llm_service
+from app.services.rag_service import rag_service
+from app.services.search_service import search_service
+
+BRAND = "variants"
+TEXT = "。".join(f"冬季新品第{i}款 限時優惠 會員禮盒 門市活動" for i in range(120))
+PAYLOAD = {"platform": "instagram", "topic": "冬季新品上市", "brand_id": BRAND, "use_search": True, "use_cache": False}
+
+
+class UnparsableVariants(FakeProvider):
+    async def _generate_variants(self, prompt: str, system_prompt: str, model: str, prefix: str, count: int):
+        result = await self._generate(prompt, system_prompt, model, prefix)
+        return self._with_variants(result)
+
+
+async def reset(workdir: str, run: int, latency: float, provider_class=FakeProvider):
+    provider = provider_class(name="openai", latency=latency)
+    llm_service.providers = {"openai": provider}
+    llm_service.cache = build_response_cache()
+    search_service.client = FakeTavilyClient(latency=0.3)
+    embeddings = FakeEmbeddings(latency=0.05)
+    rag_service.__init__(
+        embeddings=embeddings,
+        persist_directory=os.path.join(workdir, f"chroma{run}"),
+        embedding_cache_path=os.path.join(workdir, f"embeddings{run}.sqlite3"),
+        keyword_index_path=os.path.join(workdir, f"keywords{run}.sqlite3"),
+    )
+    chunks = DocumentProcessor().text_splitter.split_text(TEXT)
+    await rag_service.add_documents(rag_service.collection_for(BRAND), chunks, [{"source": "bench"} for _ in chunks])
+    embeddings.calls = 0
+    return provider, embeddings
+
+
+async def main(variants: int, latency: float):
+    workdir = tempfile.mkdtemp(prefix="bench_variants_")
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            print(f"{variants} versions, {latency}s per LLM call\n")
+            print(f"{'mode':<10}{'wall s':>8}{'LLM':>6}{'search':>8}{'embed':>7}{'in tok':>9}{'out tok':>9}{'distinct':>10}")
+            for run, mode in enumerate(("repeated", "variants", "fanout")):
+                provider, embeddings = await reset(
+                    workdir, run, latency, UnparsableVariants if mode == "fanout" else FakeProvider
+                )
+                start = time.perf_counter()
+                if mode == "repeated":
+                    bodies = []
+                    for _ in range(variants):
+                        response = await client.post("/api/copy/generate", json=PAYLOAD)
+                        response.raise_for_status()
+                        bodies.append(response.json())
+                    texts = [body["content"] for body in bodies]
+                    usage = [body["usage"] for body in bodies]
+                else:
+                    response = await client.post("/api/copy/generate", json={**PAYLOAD, "variants": variants})
+                    response.raise_for_status()
+                    body = response.json()
+                    texts = [item["content"] for item in body["variants"]]
+                    usage = [body["usage"]]
+                elapsed = time.perf_counter() - start
+                input_tokens = sum(item["input_tokens"] for item in usage)
+                output_tokens = sum(item["output_tokens"] for item in usage)
+                print(
+                    f"{mode:<10}{elapsed:>8.2f}{provider.calls:>6}{search_service.client.calls:>8}{embeddings.calls:>7}"
+                    f"{input_tokens:>9}{output_tokens:>9}{len(set(texts)):>10}"
+                )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--variants", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=1.0, help="seconds per fake LLM call")
+    args = parser.parse_args()
+    asyncio.run(main(args.variants, args.latency))
@@ -0,0 +1,131 @@
+"""Brand document lifecycle benchmark: index size and query latency before and after compaction.
+
+Run from the backend directory:
+
+    python -m benchmarks.document_compaction --sections 400 --versions 8
+
+A brand guide of ``--sections`` chunks is uploaded ``--versions`` times, a
+third of its sections edited each time, in two stores:
+
+* ``appended``: uploads without a document id, as every upload worked before:
+  each version's edited chunks pile up next to the old ones. Then the current
+  version is uploaded once more with an id (what ``/upload-brand-info`` now
+  does by default) and the store is compacted, which drops the pre-versioning
+  copies of that source.
+* ``versioned``: every upload carries the document id, so each completed
+  version removes the chunks only older versions used; compaction then
+  rebuilds the collection to reclaim the space those deletes left behind.
+
+``stale@k`` is the share of top-k vector results that are not in the current
+version. Store size is the Chroma directory plus the keyword index.
+"""
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from benchmarks.fakes import FakeEmbeddings
+from app.compact import directory_size
+from app.services.rag_service import RAGService
+
+WORDS = ["新品", "限時", "優惠", "咖啡", "保養", "旅行", "健身", "會員", "禮盒", "門市", "季節", "口碑", "語氣", "配色", "標誌"]
+COLLECTION = "brand_lifecycle"
+SOURCE = "brand_guide.pdf"
+
+
+def guide(sections: int, version: int) -> list:
+    chunks = []
+    for i in range(sections):
+        rng = random.Random(i)
+        body = " ".join(rng.choice(WORDS) for _ in range(60))
+        # Each version rewrites the sections whose number matches it modulo 3
+        edit = version if version and i % 3 == version % 3 else 0
+        chunks.append(f"品牌指南第{i}節（修訂{edit}）{body}")
+    return chunks
+
+
+def make_service(directory: str) -> RAGService:
+    service = RAGService(
+        embeddings=FakeEmbeddings(),
+        persist_directory=os.path.join(directory, "chroma"),
+        embedding_cache_path=os.path.join(directory, "embeddings.sqlite3"),
+        keyword_index_path=os.path.join(directory, "keywords.sqlite3"),
+        document_registry_path=os.path.join(directory, "documents.sqlite3"),
+    )
+    # Measure the index itself, not the result cache
+    service.result_cache = None
+    return service
+
+
+async def upload(service: RAGService, chunks: list, doc_id: str = None):
+    metadatas = [{"source": SOURCE} for _ in chunks]
+    if doc_id is None:
+        await service.add_documents(COLLECTION, chunks, metadatas)
+        return
+    version = service.documents.reserve_version(COLLECTION, doc_id, SOURCE)
+    for start in range(0, len(chunks), 64):
+        await service.add_documents(COLLECTION, chunks[start:start + 64], metadatas[start:start + 64], doc_id, version)
+    await service.commit_document(COLLECTION, doc_id, version, SOURCE)
+
+
+async def measure(service: RAGService, directory: str, current: set, sections: int, queries: int, limit: int) -> dict:
+    rng = random.Random(1)
+    latencies, stale = [], 0
+    for _ in range(queries):
+        section = rng.randrange(sections)
+        query = f"品牌指南第{section}節 " + " ".join(rng.choice(WORDS) for _ in range(4))
+        start = time.perf_counter()
+        result = await service.search(COLLECTION, query, limit=limit, mode="vector")
+        latencies.append((time.perf_counter() - start) * 1000)
+        stale += sum(1 for text in result["results"] if text not in current)
+    size = directory_size(os.path.join(directory, "chroma")) + os.path.getsize(os.path.join(directory, "keywords.sqlite3"))
+    return {
+        "chunks": service.client.get_collection(COLLECTION).count(),
+        "mb": size / 1e6,
+        "p50": statistics.median(latencies),
+        "p95": sorted(latencies)[int(0.95 * (len(latencies) - 1))],
+        "stale": stale / (queries * limit),
+    }
+
+
+def report(store: str, stage: str, row: dict):
+    print(f"{store:<11}{stage:<18}{row['chunks']:>8}{row['mb']:>9.2f}{row['p50']:>9.2f}{row['p95']:>9.2f}{row['stale']:>9.2f}")
+
+
+async def main(sections: int, versions: int, queries: int, limit: int):
+    workdir = tempfile.mkdtemp(prefix="bench_compaction_")
+    current = set(guide(sections, versions - 1))
+    try:
+        print(f"{sections} sections, {versions} versions, {queries} queries\n")
+        print(f"{'store':<11}{'stage':<18}{'chunks':>8}{'MB':>9}{'p50 ms':>9}{'p95 ms':>9}{f'stale@{limit}':>9}")
+        for store in ("appended", "versioned"):
+            directory = os.path.join(workdir, store)
+            service = make_service(directory)
+            for version in range(versions):
+                await upload(service, guide(sections, version), doc_id=SOURCE if store == "versioned" else None)
+            if store == "appended":
+                report(store, "before", await measure(service, directory, current, sections, queries, limit))
+                await upload(service, guide(sections, versions - 1), doc_id=SOURCE)
+                report(store, "upload with id", await measure(service, directory, current, sections, queries, limit))
+            else:
+                report(store, "before", await measure(service, directory, current, sections, queries, limit))
+            service.compact(COLLECTION)
+            service.vacuum()
+            # A fresh instance, as after restarting the API on the compacted store
+            service = make_service(directory)
+            report(store, "compacted", await measure(service, directory, current, sections, queries, limit))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sections", type=int, default=400)
+    parser.add_argument("--versions", type=int, default=8)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(main(args.sections, args.versions, args.queries, args.limit))
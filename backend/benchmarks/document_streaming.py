@@ -0,0 +1,171 @@
+"""Peak memory and time to first chunk: eager split_file vs streaming iter_chunks.
+
+Run from the backend directory:
+
+    python -m benchmarks.document_streaming --pages 200 --rows 100000
+
+Every case runs in a fresh interpreter so peak RSS is not shared between cases.
+``peak rss MB`` is the growth of the process high-water mark over its baseline
+after imports; ``peak heap MB`` is the tracemalloc peak.
+
+A second table streams the PDF through ``stream_batches`` the way ingestion
+does, parsing in a thread or in a child process, while a ticker on the event
+loop sleeps 10 ms at a time: ``loop lag`` is how late it wakes up, which is
+what every other request on the API process waits on while a file parses.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+WORDS = ["brand", "story", "coffee", "season", "launch", "member", "store", "gift", "travel", "review"]
+
+
+def write_pdf(path: str, pages: int, lines_per_page: int = 50):
+    rng = random.Random(0)
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled once page ids are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_ids = []
+    for _ in range(pages):
+        lines = [" ".join(rng.choice(WORDS) for _ in range(12)) for _ in range(lines_per_page)]
+        text = " T* ".join(f"({line}) Tj" for line in lines)
+        stream = f"BT /F1 9 Tf 11 TL 40 800 Td {text} ET".encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        page_ids.append(len(objects))
+    kids = b" ".join(b"%d 0 R" % page_id for page_id in page_ids)
+    objects[1] = b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % pages
+
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(f.tell())
+            f.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+        xref = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        for offset in offsets:
+            f.write(b"%010d 00000 n \n" % offset)
+        f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+
+
+def write_csv(path: str, rows: int):
+    rng = random.Random(0)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("sku,name,description\n")
+        for i in range(rows):
+            f.write(f"SKU{i:06d},{rng.choice(WORDS)},{' '.join(rng.choice(WORDS) for _ in range(30))}\n")
+
+
+def rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+
+
+def run_case(mode: str, file_path: str, file_type: str) -> dict:
+    from app.services.document_processor import document_processor
+
+    baseline = rss_mb()
+    tracemalloc.start()
+    start = time.perf_counter()
+    first_chunk, chunks = None, 0
+    if mode == "eager":
+        texts = document_processor.split_file(file_path, file_type)
+        first_chunk = time.perf_counter() - start
+        chunks = len(texts)
+    else:
+        for _ in document_processor.iter_chunks(file_path, file_type):
+            if first_chunk is None:
+                first_chunk = time.perf_counter() - start
+            chunks += 1
+    total = time.perf_counter() - start
+    _, heap_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return {
+        "mode": mode,
+        "file_type": file_type,
+        "chunks": chunks,
+        "first_chunk_ms": round(first_chunk * 1000, 1),
+        "total_s": round(total, 2),
+        "peak_heap_mb": round(heap_peak / 1024 / 1024, 1),
+        "peak_rss_mb": round(max(peak_rss - baseline, 0), 1),
+    }
+
+
+async def loop_lag(file_path: str, file_type: str, in_process: bool) -> dict:
+    from app.services.document_processor import document_processor
+
+    lags, done = [], asyncio.Event()
+
+    async def ticker():
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(0.01)
+            lags.append((time.perf_counter() - start - 0.01) * 1000)
+
+    task = asyncio.create_task(ticker())
+    start, chunks = time.perf_counter(), 0
+    async for batch in document_processor.stream_batches(file_path, file_type, 64, in_process):
+        chunks += len(batch)
+    total = time.perf_counter() - start
+    done.set()
+    await task
+    lags.sort()
+    return {
+        "chunks": chunks,
+        "total_s": round(total, 2),
+        "p50_ms": round(statistics.median(lags), 1),
+        "p99_ms": round(lags[int(0.99 * (len(lags) - 1))], 1),
+        "max_ms": round(lags[-1], 1),
+    }
+
+
+def main(pages: int, rows: int):
+    directory = tempfile.mkdtemp(prefix="bench_docs_")
+    pdf_path, csv_path = os.path.join(directory, "brand.pdf"), os.path.join(directory, "catalog.csv")
+    write_pdf(pdf_path, pages)
+    write_csv(csv_path, rows)
+
+    print(f"{'type':<6}{'mode':<10}{'chunks':>8}{'first ms':>10}{'total s':>9}{'peak heap MB':>14}{'peak rss MB':>13}")
+    for file_path, file_type in ((pdf_path, "pdf"), (csv_path, "csv")):
+        for mode in ("eager", "stream"):
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.document_streaming", "--case", mode, file_path, file_type],
+                capture_output=True, text=True, check=True
+            ).stdout
+            r = json.loads(output.strip().splitlines()[-1])
+            print(f"{file_type:<6}{mode:<10}{r['chunks']:>8}{r['first_chunk_ms']:>10}{r['total_s']:>9}"
+                  f"{r['peak_heap_mb']:>14}{r['peak_rss_mb']:>13}")
+
+    print(f"\n{'parser':<10}{'chunks':>8}{'total s':>9}{'lag p50':>9}{'lag p99':>9}{'lag max':>9}  (ms, pdf)")
+    for label, in_process in (("thread", False), ("process", True)):
+        r = asyncio.run(loop_lag(pdf_path, "pdf", in_process))
+        print(f"{label:<10}{r['chunks']:>8}{r['total_s']:>9}{r['p50_ms']:>9}{r['p99_ms']:>9}{r['max_ms']:>9}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--case", nargs=3, metavar=("MODE", "PATH", "TYPE"))
+    args = parser.parse_args()
+    if args.case:
+        print(json.dumps(run_case(*args.case)))
+    else:
+        main(args.pages, args.rows)
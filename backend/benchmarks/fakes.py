@@ -0,0 +1,204 @@
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import time
+from collections import deque
+from dataclasses import replace
+
+# Importing app modules builds the service singletons, which need a Google key to construct the embeddings client
+os.environ.setdefault("GOOGLE_API_KEY", "benchmark-fake-key")
+
+from langchain_core.embeddings import Embeddings
+from app.services.context_service import estimate_tokens
+from app.services.llm_providers import BaseProvider, LLMResult, join_prompt
+
+
+VARIANT_ANGLES = ["限時優惠搶先看", "會員專屬禮遇", "幕後故事", "顧客真實心得", "新品開箱"]
+VARIANT_TAGS = ["新品", "限時優惠", "會員", "禮盒", "冬季", "門市", "口碑", "開箱"]
+
+
+class FakeProvider(BaseProvider):
+    """Deterministic local provider with configurable latency.
+
+    With ``blocking=True`` the latency is spent in ``time.sleep`` to reproduce a
+    synchronous SDK call stalling the event loop. ``failure_rate`` raises on that
+    share of calls and ``tail_rate`` stretches that share to ``tail_latency``.
+
+    Prompt caching is simulated the way OpenAI does it automatically: the
+    longest leading text shared with a recent request counts as cached, in
+    128-token blocks once at least ``prefix_cache_min_tokens`` match. It looks
+    at the text actually sent, so it measures the prompt layout rather than
+    trusting the ``prefix`` argument. Every request is kept in ``requests``.
+    Vision requests with several images take ``image_latency`` longer per extra
+    image, for the longer answer they produce.
+    """
+
+    label = "Fake"
+    default_model = "fake-model"
+    vision_model = "fake-vision"
+
+    def __init__(
+        self,
+        name: str = "fake",
+        latency: float = 0.2,
+        blocking: bool = False,
+        max_concurrency: int = 64,
+        failure_rate: float = 0.0,
+        tail_rate: float = 0.0,
+        tail_latency: float = 0.0,
+        seed: int = 0,
+        prefix_cache_min_tokens: int = 1024,
+        image_latency: float = 0.0,
+    ):
+        super().__init__(max_concurrency)
+        self.name = name
+        self.label = name
+        self.latency = latency
+        self.blocking = blocking
+        self.failure_rate = failure_rate
+        self.tail_rate = tail_rate
+        self.tail_latency = tail_latency
+        self.random = random.Random(seed)
+        self.prefix_cache_min_tokens = prefix_cache_min_tokens
+        self.image_latency = image_latency
+        self.calls = 0
+        self.requests = deque(maxlen=1000)
+        self._recent = deque(maxlen=256)
+
+    async def _sleep(self):
+        latency = self.latency
+        if self.tail_rate and self.random.random() < self.tail_rate:
+            latency = self.tail_latency
+        if self.blocking:
+            time.sleep(latency)
+        else:
+            await asyncio.sleep(latency)
+        if self.failure_rate and self.random.random() < self.failure_rate:
+            raise RuntimeError(f"{self.name} injected failure")
+
+    def _cached_tokens(self, text: str) -> int:
+        shared = max((len(os.path.commonprefix([text, seen])) for seen in self._recent), default=0)
+        self._recent.append(text)
+        tokens = estimate_tokens(text[:shared]) // 128 * 128
+        return tokens if tokens >= self.prefix_cache_min_tokens else 0
+
+    async def _generate(self, prompt: str, system_prompt: str, model: str, prefix: str = "") -> LLMResult:
+        self.calls += 1
+        text = f"{system_prompt}\n{join_prompt(prefix, prompt)}"
+        cached_tokens = self._cached_tokens(f"{model}\n{text}")
+        self.requests.append({
+            "model": model, "system_prompt": system_prompt, "prefix": prefix, "prompt": prompt,
+            "input_tokens": estimate_tokens(text), "cached_input_tokens": cached_tokens,
+        })
+        await self._sleep()
+        return LLMResult(
+            text=f"[{self.name}:{model}] PASS {prompt[:40]}",
+            provider=self.name,
+            model=model,
+            input_tokens=estimate_tokens(text),
+            output_tokens=32,
+            cached_input_tokens=cached_tokens,
+        )
+
+    async def _stream(self, prompt: str, system_prompt: str, model: str, prefix: str = ""):
+        result = await self._generate(prompt, system_prompt, model, prefix)
+        for word in result.text.split(" "):
+            yield word + " "
+        # Usage arrives after the text, as with the real streaming APIs
+        yield replace(result, text="")
+
+    async def _generate_variants(self, prompt: str, system_prompt: str, model: str, prefix: str, count: int) -> LLMResult:
+        result = await self._generate(prompt, system_prompt, model, prefix)
+        variants = []
+        for i in range(count):
+            # Versions differ in angle, CTA, emoji and hashtag count, so lint and diversity both matter
+            text = f"{VARIANT_ANGLES[i % len(VARIANT_ANGLES)]}｜{result.text}"
+            if i % 2 == 0:
+                text += " 立即留言告訴我們你的想法！"
+            if i % 3 == 0:
+                text += " ✨"
+            text += " " + " ".join(f"#{tag}" for tag in VARIANT_TAGS[:(i * 3) % len(VARIANT_TAGS) + 1])
+            variants.append(text)
+        # Answered as JSON the way non-OpenAI providers are asked to, fenced like chat models tend to
+        result.text = "```json\n" + json.dumps({"variants": variants}, ensure_ascii=False) + "\n```"
+        result.output_tokens *= count
+        return self._with_variants(result)
+
+    async def _analyze_images(self, images: list, prompt: str) -> LLMResult:
+        self.calls += 1
+        await self._sleep()
+        if self.image_latency and len(images) > 1:
+            await asyncio.sleep(self.image_latency * (len(images) - 1))
+        analyses = [f"[{self.name}] image analysis {hashlib.md5(image).hexdigest()[:8]}" for image, _ in images]
+        text = analyses[0]
+        if len(images) > 1:
+            # Packed carousel requests ask for JSON, fenced the way chat models tend to answer
+            text = "```json\n" + json.dumps({"images": analyses, "summary": f"[{self.name}] carousel summary"}, ensure_ascii=False) + "\n```"
+        return LLMResult(text=text, provider=self.name, model=self.vision_model)
+
+
+def fake_providers(latency: float = 0.2, blocking: bool = False) -> dict:
+    return {
+        name: FakeProvider(name=name, latency=latency, blocking=blocking)
+        for name in ("openai", "anthropic", "google")
+    }
+
+
+class FakeEmbeddings(Embeddings):
+    """Deterministic hashed bag-of-characters embeddings with configurable latency."""
+
+    def __init__(self, size: int = 256, latency: float = 0.0):
+        self.size = size
+        self.latency = latency
+        self.calls = 0
+        self.texts_embedded = 0
+
+    def _vector(self, text: str) -> list:
+        vector = [0.0] * self.size
+        for i in range(len(text) - 1):
+            digest = hashlib.md5(text[i:i + 2].encode("utf-8")).digest()
+            vector[int.from_bytes(digest[:4], "little") % self.size] += 1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def embed_documents(self, texts: list) -> list:
+        self.calls += 1
+        self.texts_embedded += len(texts)
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> list:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: list) -> list:
+        self.calls += 1
+        self.texts_embedded += len(texts)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return [self._vector(text) for text in texts]
+
+    async def aembed_query(self, text: str) -> list:
+        return (await self.aembed_documents([text]))[0]
+
+
+class FakeTavilyClient:
+    """Stands in for AsyncTavilyClient with canned results and configurable latency."""
+
+    def __init__(self, latency: float = 0.3, results: int = 3):
+        self.latency = latency
+        self.results = results
+        self.calls = 0
+
+    async def search(self, query: str, search_depth: str = "basic", **kwargs) -> dict:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return {
+            "results": [
+                {"title": f"{query} #{i}", "url": f"https://example.com/{i}", "content": f"關於 {query} 的最新消息 {i}"}
+                for i in range(self.results)
+            ]
+        }
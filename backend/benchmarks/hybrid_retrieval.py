@@ -0,0 +1,85 @@
+"""Retrieval latency, embedding calls and hit rate per mode: vector vs keyword vs hybrid.
+
+Run from the backend directory:
+
+    python -m benchmarks.hybrid_retrieval --docs 500 --embedding-latency 0.08
+
+Query embeddings go through ``FakeEmbeddings`` with a latency standing in for the
+remote embedding API. ``hit@k`` is the share of queries whose target chunk (the
+one naming that SKU or product) is in the top k.
+"""
+import argparse
+import asyncio
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from benchmarks.fakes import FakeEmbeddings
+from app.services.rag_service import RAGService
+
+WORDS = ["新品", "限時", "優惠", "咖啡", "保養", "旅行", "健身", "會員", "禮盒", "門市", "季節", "口碑"]
+PRODUCTS = ["焦糖瑪奇朵", "玫瑰保濕精華", "登山背包", "燕麥奶拿鐵", "抹茶生乳捲", "極光保溫瓶"]
+
+
+def corpus(docs: int, rng: random.Random):
+    texts, targets = [], {}
+    for i in range(docs):
+        sku = f"SKU-{i:05d}"
+        product = f"{rng.choice(PRODUCTS)}{i}號"
+        text = f"{product}（{sku}）" + " ".join(rng.choice(WORDS) for _ in range(30))
+        texts.append(text)
+        targets[sku] = targets[product] = text
+    return texts, targets
+
+
+async def main(docs: int, queries: int, latency: float, limit: int):
+    rng = random.Random(0)
+    texts, targets = corpus(docs, rng)
+    directory = tempfile.mkdtemp(prefix="bench_hybrid_")
+    try:
+        embeddings = FakeEmbeddings(latency=latency)
+        service = RAGService(
+            embeddings=embeddings,
+            persist_directory=f"{directory}/chroma",
+            embedding_cache_path=f"{directory}/embeddings.sqlite3",
+            keyword_index_path=f"{directory}/keywords.sqlite3",
+        )
+        await service.add_documents("brand_bench", texts, [{"source": "bench"} for _ in texts])
+        # Measure the retrieval paths themselves, not the result and query-embedding caches
+        service.result_cache = None
+
+        workloads = {
+            "sku": rng.sample([key for key in targets if key.startswith("SKU-")], queries),
+            "product": rng.sample([key for key in targets if not key.startswith("SKU-")], queries),
+            "topic": [" ".join(rng.choice(WORDS) for _ in range(4)) for _ in range(queries)],
+        }
+        print(f"{'workload':<10}{'mode':<9}{'p50 ms':>9}{'p95 ms':>9}{'embeds':>8}{f'hit@{limit}':>8}")
+        for workload, items in workloads.items():
+            for mode in ("vector", "keyword", "hybrid"):
+                latencies, hits = [], 0
+                service.embeddings.query_backend.clear()
+                calls = embeddings.calls
+                for query in items:
+                    start = time.perf_counter()
+                    result = await service.search("brand_bench", query, limit=limit, mode=mode)
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    hits += targets.get(query) in result["results"]
+                p95 = sorted(latencies)[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+                hit_rate = f"{hits / len(items):.2f}" if workload != "topic" else "-"
+                print(
+                    f"{workload:<10}{mode:<9}{statistics.median(latencies):>9.2f}{p95:>9.2f}"
+                    f"{embeddings.calls - calls:>8}{hit_rate:>8}"
+                )
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--embedding-latency", type=float, default=0.08)
+    parser.add_argument("--limit", type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(main(args.docs, args.queries, args.embedding_latency, args.limit))
@@ -0,0 +1,78 @@
+"""Routing benchmark for LLMService against fake providers with injected latency and failures.
+
+Run from the backend directory:
+
+    python -m benchmarks.llm_routing --requests 200
+
+* ``auto``: provider="auto" should converge on the fastest provider after sampling each once.
+* ``breaker``: the requested provider always fails; its circuit should open after
+  ``LLM_BREAKER_FAILURE_THRESHOLD`` calls while every request still succeeds via fallback.
+* ``hedging``: a provider with a slow tail; hedging at p95 should cut p99 latency
+  for a small number of extra calls.
+"""
+import argparse
+import asyncio
+import time
+from collections import Counter
+from benchmarks.fakes import FakeProvider
+from app.services.llm_router import LLMRouter
+from app.services.llm_service import LLMService
+
+
+def percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def drive(service: LLMService, total: int, concurrency: int, provider: str):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, served = [], Counter()
+
+    async def one(i: int):
+        async with semaphore:
+            start = time.perf_counter()
+            result = await service.generate(f"prompt {i}", provider=provider, use_cache=False)
+            latencies.append(time.perf_counter() - start)
+            served[result.provider] += 1
+
+    await asyncio.gather(*(one(i) for i in range(total)))
+    return latencies, served
+
+
+def build(providers: list, **router_options) -> LLMService:
+    service = LLMService(providers={provider.name: provider for provider in providers}, cache=None)
+    service.router = LLMRouter(service.providers, **router_options)
+    return service
+
+
+async def main(total: int, concurrency: int):
+    service = build([
+        FakeProvider("openai", latency=0.12),
+        FakeProvider("google", latency=0.03),
+        FakeProvider("anthropic", latency=0.06),
+    ])
+    _, served = await drive(service, total, concurrency, "auto")
+    print(f"auto     served: {dict(served)}")
+
+    failing = FakeProvider("openai", latency=0.02, failure_rate=1.0)
+    service = build([failing, FakeProvider("google", latency=0.03)], failure_threshold=3, cooldown=60)
+    _, served = await drive(service, total, concurrency, "openai")
+    print(f"breaker  served: {dict(served)}, calls to failing provider: {failing.calls}")
+
+    print(f"{'hedging':<10}{'p50 ms':>10}{'p99 ms':>10}{'extra calls':>13}")
+    for hedge in (False, True):
+        slow_tail = FakeProvider("openai", latency=0.02, tail_rate=0.03, tail_latency=0.5, seed=7)
+        backup = FakeProvider("google", latency=0.03)
+        service = build([slow_tail, backup], hedge=hedge, hedge_min_samples=20)
+        latencies, _ = await drive(service, total, concurrency, "openai")
+        extra = slow_tail.calls + backup.calls - total
+        label = "on" if hedge else "off"
+        print(f"{label:<10}{percentile(latencies, 0.5) * 1000:>10.1f}{percentile(latencies, 0.99) * 1000:>10.1f}{extra:>13}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.concurrency))
@@ -0,0 +1,52 @@
+"""Load benchmark for /api/copy/generate against a local fake LLM provider.
+
+Run from the backend directory:
+
+    python -m benchmarks.llm_throughput --latency 0.2 --requests 64
+
+The ``blocking`` rows emulate the previous synchronous SDK calls; the ``async``
+rows use the native async provider layer. Throughput of the async rows should
+scale with concurrency until the provider concurrency limit is reached.
+"""
+import argparse
+import asyncio
+import time
+from benchmarks.fakes import fake_providers
+import httpx
+from app.main import app
+from app.services.llm_service import llm_service
+
+
+async def run_level(client: httpx.AsyncClient, concurrency: int, total: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+    payload = {"platform": "facebook", "topic": "新品上市", "use_rag": False, "use_cache": False}
+
+    async def one():
+        async with semaphore:
+            response = await client.post("/api/copy/generate", json=payload)
+            response.raise_for_status()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    return total / (time.perf_counter() - start)
+
+
+async def main(latency: float, total: int, levels: list):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        print(f"{'mode':<10}{'concurrency':>12}{'req/s':>10}")
+        for blocking in (True, False):
+            llm_service.providers = fake_providers(latency=latency, blocking=blocking)
+            mode = "blocking" if blocking else "async"
+            for concurrency in levels:
+                throughput = await run_level(client, concurrency, total)
+                print(f"{mode:<10}{concurrency:>12}{throughput:>10.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 4, 16, 32])
+    args = parser.parse_args()
+    asyncio.run(main(args.latency, args.requests, args.levels))
@@ -0,0 +1,297 @@
+"""Load test for the public API against deterministic fake LLM, embedding and search backends.
+
+Run from the backend directory:
+
+    python -m benchmarks.load_test --levels 1 8 32 --requests 64 --output bench.json
+    python -m benchmarks.load_test --compare bench.json --fail-on-regression 20
+
+Every scenario is driven in-process through the ASGI app, so numbers measure
+this codebase plus the injected fake latencies and nothing else. Chroma, the
+embedding cache and the ingestion queue run for real in a temporary directory.
+Responses are not read from the LLM response cache, every copy request and
+knowledge search sends a different topic or query (so retrieval results, query
+embeddings and searches are never cached or shared between requests) and each
+vision request sends a different image, so caches don't flatter the numbers.
+
+Results are printed as a table and written as JSON (``--output``); ``--compare``
+diffs a run against an earlier JSON file, keyed by scenario and concurrency.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from benchmarks.fakes import FakeEmbeddings, FakeTavilyClient, fake_providers
+import httpx
+from PIL import Image, ImageDraw
+from app.main import app
+from app.services.ingestion_service import ingestion_service
+from app.services.llm_service import llm_service
+from app.services.rag_service import rag_service
+from app.services.search_service import search_service
+from app.services.vision_service import vision_service
+
+WORDS = ["新品", "限時", "優惠", "咖啡", "保養", "旅行", "健身", "會員", "禮盒", "門市", "季節", "口碑"]
+BRAND = "loadtest"
+
+
+def percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:
+        # No procfs (macOS): fall back to the high-water mark, reported in bytes there
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 20
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def document(rng: random.Random, sentences: int) -> str:
+    return "\n".join(" ".join(rng.choice(WORDS) for _ in range(20)) + "。" for _ in range(sentences))
+
+
+def image(rng: random.Random, size=(1600, 1200)) -> bytes:
+    picture = Image.new("RGB", size, tuple(rng.randrange(256) for _ in range(3)))
+    draw = ImageDraw.Draw(picture)
+    for _ in range(12):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        draw.rectangle((x, y, x + rng.randrange(100, 600), y + rng.randrange(100, 600)), fill=tuple(rng.randrange(256) for _ in range(3)))
+    buffer = io.BytesIO()
+    picture.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+async def install_fakes(workdir: str, args):
+    llm_service.providers = fake_providers(latency=args.llm_latency)
+    llm_service.cache = None
+    search_service.client = FakeTavilyClient(latency=args.search_latency)
+    # Re-initialise the shared singletons in place so every module holding a reference sees the fakes
+    rag_service.__init__(
+        embeddings=FakeEmbeddings(latency=args.embedding_latency),
+        persist_directory=os.path.join(workdir, "chroma"),
+        embedding_cache_path=os.path.join(workdir, "embeddings.sqlite3"),
+        keyword_index_path=os.path.join(workdir, "keywords.sqlite3"),
+        document_registry_path=os.path.join(workdir, "documents.sqlite3"),
+    )
+    ingestion_service.__init__(
+        db_path=os.path.join(workdir, "ingestion.sqlite3"), upload_dir=os.path.join(workdir, "uploads")
+    )
+    vision_service.__init__()
+    await ingestion_service.start()
+
+    rng = random.Random(0)
+    texts = [document(rng, 3) for _ in range(200)]
+    await rag_service.add_documents(rag_service.collection_for(BRAND), texts, [{"source": "seed"} for _ in texts])
+
+
+def scenarios(args) -> dict:
+    copy_payload = {"platform": "facebook", "topic": "秋季新品咖啡禮盒", "brand_id": BRAND, "use_cache": False}
+
+    async def copy_single(client, i):
+        # The topic is the retrieval and search query, so it varies per request as well
+        return await client.post("/api/copy/generate", json={**copy_payload, "topic": f"{copy_payload['topic']} {i}"})
+
+    async def copy_agent(client, i):
+        return await client.post(
+            "/api/copy/generate",
+            json={**copy_payload, "topic": f"{copy_payload['topic']} {i}", "use_agent": True, "use_search": True}
+        )
+
+    async def brainstorm(client, i):
+        return await client.post("/api/copy/brainstorm", json={"idea": f"會員日活動 {i}", "use_cache": False})
+
+    async def upload_brand_info(client, i):
+        # Queueing is instant; measure until the ingestion job has embedded every chunk
+        content = document(random.Random(f"upload-{i}"), args.upload_sentences).encode("utf-8")
+        response = await client.post(
+            "/api/brand/upload-brand-info",
+            files={"file": (f"brand-{i}.txt", content, "text/plain")},
+            data={"brand_id": BRAND},
+        )
+        response.raise_for_status()
+        job_id = response.json()["job_id"]
+        while True:
+            job = (await client.get(f"/api/brand/jobs/{job_id}")).json()
+            if job["status"] in ("completed", "failed"):
+                if job["status"] == "failed":
+                    raise RuntimeError(job["error"])
+                return response
+            await asyncio.sleep(0.01)
+
+    async def search_knowledge(client, i):
+        # A query per request: a repeated one would time the retrieval and query-embedding caches, not retrieval
+        query = f"{WORDS[i % len(WORDS)]} {WORDS[i // len(WORDS) % len(WORDS)]} 活動 {i}"
+        return await client.get("/api/brand/search-knowledge", params={"query": query, "brand_id": BRAND})
+
+    images = {}
+
+    async def vision(client, i):
+        data = images.pop(i)
+        return await client.post("/api/vision/analyze", files={"file": (f"photo-{i}.jpg", data, "image/jpeg")})
+
+    def prepare_vision(count: int, offset: int):
+        rng = random.Random(offset)
+        images.update((offset + i, image(rng)) for i in range(count))
+
+    return {
+        "copy_single": (copy_single, None),
+        "copy_agent": (copy_agent, None),
+        "brainstorm": (brainstorm, None),
+        "upload_brand_info": (upload_brand_info, None),
+        "search_knowledge": (search_knowledge, None),
+        "vision": (vision, prepare_vision),
+    }
+
+
+async def run_level(client, request, concurrency: int, total: int, offset: int, trace_memory: bool) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def one(i: int):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await request(client, offset + i)
+                response.raise_for_status()
+                latencies.append((time.perf_counter() - start) * 1000)
+            except Exception as e:
+                errors += 1
+                if errors == 1:
+                    print(f"  first error: {e}", file=sys.stderr)
+
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    elapsed = time.perf_counter() - start
+    heap_peak = None
+    if trace_memory:
+        heap_peak = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 2)
+        tracemalloc.stop()
+
+    result = {
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "rss_mb": round(rss_mb(), 1),
+        "heap_peak_mb": heap_peak,
+    }
+    if latencies:
+        result.update({
+            "p50_ms": round(percentile(latencies, 0.50), 2),
+            "p95_ms": round(percentile(latencies, 0.95), 2),
+            "p99_ms": round(percentile(latencies, 0.99), 2),
+            "mean_ms": round(sum(latencies) / len(latencies), 2),
+            "max_ms": round(max(latencies), 2),
+        })
+    return result
+
+
+def compare(baseline_path: str, results: list, threshold: float) -> list:
+    with open(baseline_path) as f:
+        baseline = {(row["scenario"], row["concurrency"]): row for row in json.load(f)["results"]}
+    regressions = []
+    print(f"\n{'scenario':<20}{'conc':>6}{'p95 Δ%':>10}{'rps Δ%':>10}", file=sys.stderr)
+    for row in results:
+        before = baseline.get((row["scenario"], row["concurrency"]))
+        if not before or "p95_ms" not in row or "p95_ms" not in before:
+            continue
+        p95_delta = (row["p95_ms"] - before["p95_ms"]) / before["p95_ms"] * 100
+        rps_delta = (row["throughput_rps"] - before["throughput_rps"]) / before["throughput_rps"] * 100
+        flag = ""
+        if threshold and (p95_delta > threshold or rps_delta < -threshold):
+            flag = "  REGRESSION"
+            regressions.append(row)
+        print(f"{row['scenario']:<20}{row['concurrency']:>6}{p95_delta:>+10.1f}{rps_delta:>+10.1f}{flag}", file=sys.stderr)
+    return regressions
+
+
+async def main(args) -> int:
+    workdir = tempfile.mkdtemp(prefix="bench_load_")
+    results = []
+    try:
+        await install_fakes(workdir, args)
+        available = scenarios(args)
+        selected = args.scenarios or list(available)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            print(f"{'scenario':<20}{'conc':>6}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'rss MB':>9}{'err':>5}", file=sys.stderr)
+            offset = 0
+            for name in selected:
+                request, prepare = available[name]
+                for concurrency in args.levels:
+                    if prepare:
+                        prepare(args.requests, offset)
+                    row = {"scenario": name, **await run_level(client, request, concurrency, args.requests, offset, args.tracemalloc)}
+                    offset += args.requests
+                    results.append(row)
+                    print(
+                        f"{name:<20}{concurrency:>6}{row['throughput_rps']:>9.1f}{row.get('p50_ms', 0):>9.1f}"
+                        f"{row.get('p95_ms', 0):>9.1f}{row.get('p99_ms', 0):>9.1f}{row['rss_mb']:>9.1f}{row['errors']:>5}",
+                        file=sys.stderr
+                    )
+    finally:
+        await ingestion_service.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "config": {
+                key: getattr(args, key)
+                for key in ("levels", "requests", "llm_latency", "embedding_latency", "search_latency", "upload_sentences")
+            },
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    else:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+
+    if args.compare and compare(args.compare, results, args.fail_on_regression):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenarios", nargs="+", choices=list(scenarios(argparse.Namespace(upload_sentences=0))))
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--embedding-latency", type=float, default=0.01)
+    parser.add_argument("--search-latency", type=float, default=0.05)
+    parser.add_argument("--upload-sentences", type=int, default=200)
+    parser.add_argument("--tracemalloc", action="store_true", help="report per-level heap peaks (slows every request)")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--compare", help="earlier JSON report to diff against")
+    parser.add_argument("--fail-on-regression", type=float, default=0.0, help="exit 1 if p95 or throughput regress by more than this %%")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,95 @@
+"""Prompt prefix layout check: how much of each prompt a provider prefix cache can reuse.
+
+Run from the backend directory:
+
+    python -m benchmarks.prompt_cache --topics 6
+
+Copy requests for one brand run through the API (single-call and agent paths,
+every platform) against ``FakeProvider``, which counts the leading text shared
+with recent requests as cached, the way OpenAI's automatic prefix caching does.
+Per prompt kind (told apart by system prompt) it reports input tokens, the
+cached share and how many distinct prefixes were sent: brand context depends on
+the topic's retrieval and the writer's prefix carries that request's plan, but
+platforms and revisions of one request should share theirs.
+"""
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import tempfile
+from collections import defaultdict
+from benchmarks.fakes import FakeEmbeddings, FakeTavilyClient, fake_providers
+import httpx
+from app.main import app
+from app.services.document_processor import DocumentProcessor
+from app.services.llm_service import llm_service
+from app.services.rag_service import rag_service
+from app.services.search_service import search_service
+
+WORDS = ["新品", "限時", "優惠", "咖啡", "保養", "旅行", "健身", "會員", "禮盒", "門市", "季節", "口碑"]
+BRAND = "prefixbench"
+
+
+async def main(topics: int, sentences: int):
+    workdir = tempfile.mkdtemp(prefix="bench_prefix_")
+    try:
+        llm_service.providers = fake_providers(latency=0)
+        llm_service.cache = None
+        search_service.client = FakeTavilyClient(latency=0)
+        rag_service.__init__(
+            embeddings=FakeEmbeddings(latency=0),
+            persist_directory=os.path.join(workdir, "chroma"),
+            embedding_cache_path=os.path.join(workdir, "embeddings.sqlite3"),
+            keyword_index_path=os.path.join(workdir, "keywords.sqlite3"),
+        )
+        rng = random.Random(0)
+        text = "。".join(" ".join(rng.choice(WORDS) for _ in range(20)) for _ in range(sentences))
+        chunks = DocumentProcessor().text_splitter.split_text(text)
+        await rag_service.add_documents(rag_service.collection_for(BRAND), chunks, [{"source": "bench"} for _ in chunks])
+
+        requests = [
+            {"platform": platform, "topic": f"{WORDS[i % len(WORDS)]}活動第{i}檔", "use_agent": agent}
+            for i in range(topics) for platform in ("facebook", "instagram", "threads") for agent in (False, True)
+        ]
+        usage = defaultdict(int)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            for payload in requests:
+                # Sequential on purpose: a prefix cache only helps requests that arrive after the first write
+                response = await client.post("/api/copy/generate", json={
+                    **payload, "brand_id": BRAND, "use_search": True, "use_cache": False, "editor_mode": "strict"
+                })
+                response.raise_for_status()
+                for key, value in response.json()["usage"].items():
+                    if key != "cached_input_ratio":
+                        usage[key] += value
+
+        kinds = defaultdict(lambda: {"calls": 0, "input": 0, "cached": 0, "prefixes": set()})
+        provider = llm_service.providers["openai"]
+        for request in provider.requests:
+            row = kinds[request["system_prompt"]]
+            row["calls"] += 1
+            row["input"] += request["input_tokens"]
+            row["cached"] += request["cached_input_tokens"]
+            row["prefixes"].add(request["prefix"])
+
+        print(f"{'prompt (system)':<34}{'calls':>7}{'prefixes':>10}{'input tok':>11}{'cached %':>10}")
+        for system_prompt, row in kinds.items():
+            share = row["cached"] / row["input"] * 100 if row["input"] else 0.0
+            print(f"{system_prompt[:32]:<34}{row['calls']:>7}{len(row['prefixes']):>10}{row['input']:>11}{share:>9.1f}%")
+        total = usage["input_tokens"] or 1
+        print(
+            f"\nResponse usage: {usage['calls']} calls, {usage['input_tokens']} input tokens, "
+            f"{usage['cached_input_tokens']} cached ({usage['cached_input_tokens'] / total * 100:.1f}%)"
+        )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--topics", type=int, default=6)
+    parser.add_argument("--sentences", type=int, default=200, help="brand document size; more sentences, longer chunks retrieved")
+    args = parser.parse_args()
+    asyncio.run(main(args.topics, args.sentences))
@@ -0,0 +1,75 @@
+"""Query latency against the number of tenants: one shared collection vs per-brand collections.
+
+Run from the backend directory:
+
+    python -m benchmarks.rag_tenants --tenants 1 10 50 --docs 200
+
+``foreign`` is the share of top-k results that belong to another brand, which
+the shared collection returns and per-brand collections cannot.
+"""
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from benchmarks.fakes import FakeEmbeddings
+from app.services.rag_service import RAGService
+
+WORDS = ["新品", "限時", "優惠", "咖啡", "保養", "旅行", "健身", "會員", "禮盒", "門市", "季節", "口碑"]
+
+
+def tenant_docs(tenant: int, count: int, rng: random.Random) -> list:
+    return [f"brand{tenant} " + " ".join(rng.choice(WORDS) for _ in range(40)) for _ in range(count)]
+
+
+async def measure(service: RAGService, collection_for, tenants: int, queries: int, rng: random.Random):
+    latencies, foreign = [], 0
+    for _ in range(queries):
+        tenant = rng.randrange(tenants)
+        query = f"brand{tenant} " + " ".join(rng.choice(WORDS) for _ in range(5))
+        start = time.perf_counter()
+        results = await service.query_similar(collection_for(tenant), query, limit=3)
+        latencies.append((time.perf_counter() - start) * 1000)
+        foreign += sum(1 for text in results if not text.startswith(f"brand{tenant} "))
+    return statistics.median(latencies), foreign / (queries * 3)
+
+
+async def main(tenant_levels: list, docs: int, queries: int):
+    print(f"{'tenants':>8}{'layout':>12}{'p50 ms':>10}{'foreign':>10}")
+    for tenants in tenant_levels:
+        rng = random.Random(tenants)
+        corpus = {t: tenant_docs(t, docs, rng) for t in range(tenants)}
+        for layout in ("shared", "per-brand"):
+            directory = tempfile.mkdtemp(prefix="bench_chroma_")
+            try:
+                service = RAGService(
+                    embeddings=FakeEmbeddings(),
+                    persist_directory=os.path.join(directory, "chroma"),
+                    embedding_cache_path=os.path.join(directory, "embeddings.sqlite3"),
+                    keyword_index_path=os.path.join(directory, "keywords.sqlite3"),
+                )
+                if layout == "shared":
+                    collection_for = lambda tenant: "brand_knowledge"
+                else:
+                    collection_for = lambda tenant: service.collection_for(f"tenant{tenant}")
+                for tenant, texts in corpus.items():
+                    await service.add_documents(collection_for(tenant), texts, [{"source": f"t{tenant}"} for _ in texts])
+                # Touch every collection once so the numbers reflect warm handles
+                for tenant in corpus:
+                    await service.query_similar(collection_for(tenant), "warmup", limit=3)
+                p50, foreign = await measure(service, collection_for, tenants, queries, rng)
+                print(f"{tenants:>8}{layout:>12}{p50:>10.2f}{foreign:>10.2f}")
+            finally:
+                shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tenants", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--docs", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=100)
+    args = parser.parse_args()
+    asyncio.run(main(args.tenants, args.docs, args.queries))
@@ -0,0 +1,90 @@
+"""Carousel vision benchmark: one image per request versus packed batch requests.
+
+Run from the backend directory:
+
+    python -m benchmarks.vision_carousel --images 10
+
+A carousel of distinct images is analyzed three ways against a fake vision
+provider with ``--latency`` seconds per round-trip (plus ``--image-latency``
+per extra image in a packed request, for its longer answer):
+
+* ``sequential``: ``/api/vision/analyze`` once per image, one after another
+* ``parallel``: ``/api/vision/analyze-batch`` with ``pack=false``
+* ``packed``: ``/api/vision/analyze-batch`` with several images per request
+
+The vision and response caches are emptied before each run; a last run repeats
+the packed request to show a carousel served from cache.
+"""
+import argparse
+import asyncio
+import io
+import random
+import time
+from benchmarks.fakes import FakeProvider
+import httpx
+from PIL import Image, ImageDraw
+from app.main import app
+from app.services.llm_service import build_response_cache, llm_service
+from app.services.vision_service import vision_service
+
+
+def carousel(count: int) -> list:
+    images = []
+    for i in range(count):
+        rng = random.Random(i)
+        image = Image.new("RGB", (1080, 1350), tuple(rng.randrange(256) for _ in range(3)))
+        draw = ImageDraw.Draw(image)
+        # Random blocks keep the slides' perceptual hashes apart
+        for _ in range(12):
+            x, y = rng.randrange(1080), rng.randrange(1350)
+            box = (x, y, x + rng.randrange(100, 500), y + rng.randrange(100, 500))
+            draw.rectangle(box, fill=tuple(rng.randrange(256) for _ in range(3)))
+        buffer = io.BytesIO()
+        image.save(buffer, "JPEG", quality=90)
+        images.append((f"slide{i}.jpg", buffer.getvalue(), "image/jpeg"))
+    return images
+
+
+def reset(latency: float, image_latency: float, clear: bool = True) -> FakeProvider:
+    provider = FakeProvider(name="openai", latency=latency, image_latency=image_latency)
+    llm_service.providers = {"openai": provider}
+    if clear:
+        llm_service.cache = build_response_cache()
+        vision_service.__init__()
+    return provider
+
+
+async def run(client: httpx.AsyncClient, mode: str, images: list) -> float:
+    start = time.perf_counter()
+    if mode == "sequential":
+        for image in images:
+            (await client.post("/api/vision/analyze", files={"file": image})).raise_for_status()
+    else:
+        files = [("files", image) for image in images]
+        data = {"pack": "false" if mode == "parallel" else "true"}
+        response = await client.post("/api/vision/analyze-batch", files=files, data=data)
+        response.raise_for_status()
+        body = response.json()
+        assert len(body["images"]) == len(images) and body["summary"]
+    return time.perf_counter() - start
+
+
+async def main(count: int, latency: float, image_latency: float):
+    images = carousel(count)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        print(f"{count} images, {latency}s per round-trip\n")
+        print(f"{'mode':<12}{'wall s':>9}{'LLM calls':>11}")
+        for mode in ("sequential", "parallel", "packed", "cached"):
+            provider = reset(latency, image_latency, clear=mode != "cached")
+            elapsed = await run(client, "packed" if mode == "cached" else mode, images)
+            print(f"{mode:<12}{elapsed:>9.2f}{provider.calls:>11}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=1.0, help="seconds per vision or text round-trip")
+    parser.add_argument("--image-latency", type=float, default=0.05, help="extra seconds per additional packed image")
+    args = parser.parse_args()
+    asyncio.run(main(args.images, args.latency, args.image_latency))
@@ -27,7 +27,7 @@ async def test_vision():
         # If OpenAI key is missing (which it is in .env), it falls back to Google.
         
         response = await llm_service.analyze_image(
-            image_url=image_url,
+            image=image_url,
             prompt="What color is this image? Please answer in one word."
         )
         print(f"\n✅ Vision Analysis Result:\n{response}")